@@ -0,0 +1,161 @@
+# EU868 data rates DR0..DR6, index into SX127x._data_rates
+ADR_DATA_RATES = (
+    'SF12BW125', 'SF11BW125', 'SF10BW125', 'SF9BW125',
+    'SF8BW125', 'SF7BW125', 'SF7BW250',
+)
+# demodulator SNR floor per spreading factor (dB)
+REQUIRED_SNR = {7: -7.5, 8: -10.0, 9: -12.5, 10: -15.0, 11: -17.5, 12: -20.0}
+
+# EU868 TXPower index 0..7 is MaxEIRP - 2 dB * index
+MAX_EIRP_DBM = 16
+TX_POWER_STEPS = 8
+
+# LoRaWAN 1.0 ADR backoff: request an answer after ADR_ACK_LIMIT uplinks
+# without downlink, then back off every ADR_ACK_DELAY uplinks
+ADR_ACK_LIMIT = 64
+ADR_ACK_DELAY = 32
+
+# FCtrl bits of an uplink
+FCTRL_ADR = 0x80
+FCTRL_ADR_ACK_REQ = 0x40
+
+# MAC commands
+LINK_ADR_REQ = 0x03
+# payload length of each downlink MAC command (CID: length)
+MAC_COMMAND_LENGTH = {
+    0x02: 2, 0x03: 4, 0x04: 1, 0x05: 4, 0x06: 0, 0x07: 5,
+    0x08: 1, 0x09: 1, 0x0A: 4,
+}
+
+
+class ADR:
+    """ Adaptive data rate for an SX127x node.
+
+        LinkADRReq commands from the network take precedence. Until the
+        network takes control, the link margin of received downlinks is
+        used to step the data rate and TX power to the cheapest setting
+        that keeps margin_db in reserve. Without downlinks the node backs
+        off as LoRaWAN requires: more power first, then slower data rates.
+    """
+    def __init__(self, lora, margin_db=10, history=8):
+        self._lora = lora
+        self._margin_db = margin_db
+        self._snr = [0.0] * history
+        self._snr_count = 0
+        self._snr_index = 0
+        self._network_controlled = False
+        self.adr_ack_cnt = 0
+        self.link_adr_reqs = 0  # applied LinkADRReq commands
+
+        self.data_rate = ADR_DATA_RATES.index(lora._data_rate)
+        self.tx_power = min(
+            max((MAX_EIRP_DBM - lora._tx_power_level) // 2, 0),
+            TX_POWER_STEPS - 1
+        )
+        self._answer = bytearray(2)
+
+    def fctrl(self):
+        """ ADR bits for the FCtrl byte of the next uplink.
+        """
+        if self.adr_ack_cnt >= ADR_ACK_LIMIT:
+            return FCTRL_ADR | FCTRL_ADR_ACK_REQ
+        return FCTRL_ADR
+
+    def on_uplink(self):
+        self.adr_ack_cnt += 1
+        backoff = self.adr_ack_cnt - ADR_ACK_LIMIT
+        if backoff > 0 and backoff % ADR_ACK_DELAY == 0:
+            self._backoff()
+
+    def on_downlink(self, packet, length, snr):
+        """ Any downlink proves the link: reset the backoff, record the
+            margin and act on MAC commands carried in FOpts.
+        """
+        self.adr_ack_cnt = 0
+        self._snr[self._snr_index] = snr
+        self._snr_index = (self._snr_index + 1) % len(self._snr)
+        self._snr_count = min(self._snr_count + 1, len(self._snr))
+
+        if length >= 8:
+            fopts_len = packet[5] & 0x0F
+            self.process_mac_commands(packet, 8, min(8 + fopts_len, length))
+        self._adapt()
+
+    def process_mac_commands(self, buf, start, end):
+        i = start
+        while i < end:
+            cid = buf[i]
+            if cid not in MAC_COMMAND_LENGTH:
+                break  # unknown command, the rest cannot be parsed
+            if cid == LINK_ADR_REQ and i + 4 < end:
+                self.link_adr_req(buf[i + 1])
+            i += 1 + MAC_COMMAND_LENGTH[cid]
+
+    def link_adr_req(self, data_rate_tx_power):
+        """ Applies a LinkADRReq and queues the LinkADRAns.
+            The channel mask is acknowledged as is.
+        """
+        self._network_controlled = True
+        status = 0x01  # channel mask ACK
+        data_rate = data_rate_tx_power >> 4
+        tx_power = data_rate_tx_power & 0x0F
+
+        if data_rate == 0x0F or data_rate < len(ADR_DATA_RATES):
+            status |= 0x02
+        if tx_power == 0x0F or tx_power < TX_POWER_STEPS:
+            status |= 0x04
+        if status == 0x07:
+            if data_rate != 0x0F:
+                self.data_rate = data_rate
+            if tx_power != 0x0F:
+                self.tx_power = tx_power
+            self.link_adr_reqs += 1
+            self._apply()
+
+        self._answer[0] = LINK_ADR_REQ
+        self._answer[1] = status
+        self._lora.add_fopts(self._answer)
+        return status
+
+    def tx_power_dbm(self):
+        return MAX_EIRP_DBM - 2 * self.tx_power
+
+    def _adapt(self):
+        # node side stepping, only until the network sends LinkADRReq
+        if self._network_controlled or self._snr_count < len(self._snr):
+            return
+
+        sf = self._lora._sf
+        margin = max(self._snr) - REQUIRED_SNR[sf] - self._margin_db
+        steps = int(margin // 3)
+        data_rate, tx_power = self.data_rate, self.tx_power
+
+        # faster data rate first (up to DR5, DR6 needs a 250 kHz gateway
+        # channel), then less power; a negative margin adds power back
+        while steps > 0 and data_rate < 5:
+            data_rate += 1
+            steps -= 1
+        while steps > 0 and tx_power < TX_POWER_STEPS - 1:
+            tx_power += 1
+            steps -= 1
+        while steps < 0 and tx_power > 0:
+            tx_power -= 1
+            steps += 1
+
+        if (data_rate, tx_power) != (self.data_rate, self.tx_power):
+            self.data_rate, self.tx_power = data_rate, tx_power
+            self._snr_count = 0  # collect margins at the new setting
+            self._apply()
+
+    def _backoff(self):
+        if self.tx_power > 0:
+            self.tx_power = 0
+        elif self.data_rate > 0:
+            self.data_rate -= 1
+        else:
+            return
+        self._apply()
+
+    def _apply(self):
+        self._lora.set_data_rate(ADR_DATA_RATES[self.data_rate])
+        self._lora.set_tx_power(self.tx_power_dbm())
@@ -0,0 +1,42 @@
+import utime
+import struct
+from encryption_aes import AES, SessionCrypto
+from config import *
+
+# Benchmark: per-uplink crypto time (FRMPayload encryption + MIC),
+# AES object rebuilt per packet versus the cached session context.
+
+uplinks = 50  # Number of uplinks timed per variant
+
+devaddr = ttn_config['devaddr']
+nwkey = ttn_config['nwkey']
+app = ttn_config['app']
+
+# Same 16 byte payload as the irrigation report, behind the 9 byte header
+payload = struct.pack('@ffff', 12.5, 360.0, 60.0, 55.0)
+packet = bytearray(64)
+packet_length = 9 + len(payload)
+
+def per_packet_aes():
+    start = utime.ticks_us()
+    for frame_counter in range(uplinks):
+        enc_data = bytearray(payload)
+        aes = AES(devaddr, app, nwkey, frame_counter)
+        aes.encrypt(enc_data)
+        packet[9:packet_length] = enc_data
+        aes.calculate_mic(packet, packet_length, bytearray(4))
+    return utime.ticks_diff(utime.ticks_us(), start) // uplinks
+
+def session_crypto():
+    session = SessionCrypto(devaddr, app, nwkey)
+    frm_payload = memoryview(packet)[9:]
+    start = utime.ticks_us()
+    for frame_counter in range(uplinks):
+        frm_payload[0:len(payload)] = payload
+        session.encrypt(frame_counter, frm_payload, len(payload))
+        session.mic(frame_counter, packet, packet_length)
+    return utime.ticks_diff(utime.ticks_us(), start) // uplinks
+
+before = per_packet_aes()
+after = session_crypto()
+print("crypto per uplink: AES per packet {} us, session context {} us".format(before, after))
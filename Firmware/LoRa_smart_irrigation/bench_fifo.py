@@ -0,0 +1,67 @@
+import utime
+import struct
+from sx127x import TTN, SX127x
+from machine import Pin, SPI
+from config import device_config, lora_parameters
+
+# Benchmark: SPI transactions and FIFO load time per uplink,
+# byte-wise FIFO access versus burst FIFO access.
+#
+# Nothing is sent: each uplink is built, encrypted and loaded into the
+# FIFO, and the radio stays in standby where TX would start. The
+# session is a throwaway one, never the node's TTN keys.
+
+uplinks = 10  # Number of uplinks loaded per mode
+
+# Throwaway session, not registered with any network server
+ttn_config = TTN(bytearray(4), bytearray(16), bytearray(16), country='EU')
+
+# Initiating SPI pins
+device_spi = SPI(device_config['spi_unit'], baudrate = 10000000,
+        polarity = 0, phase = 0, bits = 8, firstbit = SPI.MSB,
+        sck = Pin(device_config['sck'], Pin.OUT, Pin.PULL_DOWN),
+        mosi = Pin(device_config['mosi'], Pin.OUT, Pin.PULL_UP),
+        miso = Pin(device_config['miso'], Pin.IN, Pin.PULL_UP))
+
+# nothing goes on air, no airtime to book
+lora = SX127x(device_spi, pins=device_config, lora_parameters=lora_parameters, ttn_config=ttn_config,
+        duty_cycle=False)
+
+# Same 16 byte payload as the irrigation report
+payload = struct.pack('@ffff', 12.5, 360.0, 60.0, 55.0)
+packet = bytearray(64)
+packet[0:len(payload)] = payload
+
+def run(burst_fifo, first_frame_counter):
+    lora.burst_fifo = burst_fifo
+    total_transactions = 0
+    fifo_transactions = 0
+    fifo_us = 0
+
+    # frame counters keep increasing across the runs
+    for frame_counter in range(first_frame_counter, first_frame_counter + uplinks):
+        # uplink path up to the switch to TX
+        start_transactions = lora.spi_transactions
+        lora_pkt, lora_pkt_len = lora.build_packet(payload, len(payload), frame_counter)
+        lora.standby()
+        lora.prepare_packet()
+        lora.write(lora_pkt, lora_pkt_len)
+        total_transactions += lora.spi_transactions - start_transactions
+
+        # FIFO phase on its own
+        lora.standby()
+        start_transactions = lora.spi_transactions
+        start = utime.ticks_us()
+        lora.write(packet, len(payload) + 13)
+        fifo_us += utime.ticks_diff(utime.ticks_us(), start)
+        fifo_transactions += lora.spi_transactions - start_transactions
+
+    print("burst_fifo={}: {} SPI transactions/uplink, FIFO load {} transactions in {} us".format(
+        burst_fifo,
+        total_transactions // uplinks,
+        fifo_transactions // uplinks,
+        fifo_us // uplinks))
+
+run(False, 0)
+run(True, uplinks)
+lora.sleep()
@@ -0,0 +1,87 @@
+import utime
+import struct
+from sx127x import TTN, SX127x
+from radio_worker import RadioWorker, EVT_ERROR
+from machine import Pin, SPI, ADC
+from config import device_config, lora_parameters
+
+# Benchmark: control-loop jitter while uplinks are sent, radio stack
+# inline on core 0 versus the RadioWorker on core 1.
+#
+# The uplinks really go on air, the load is TX plus both RX windows,
+# but with a throwaway session, never the node's TTN keys: its frame
+# counters and duty cycle are left alone.
+
+period_ms = 50     # Control loop period
+iterations = 600   # Loop iterations per variant (30 s)
+send_every = 200   # Iterations between uplinks (10 s, within the duty cycle)
+
+# Throwaway session, not registered with any network server
+ttn_config = TTN(bytearray(4), bytearray(16), bytearray(16), country='EU')
+
+# Initiating SPI pins
+device_spi = SPI(device_config['spi_unit'], baudrate = 10000000,
+        polarity = 0, phase = 0, bits = 8, firstbit = SPI.MSB,
+        sck = Pin(device_config['sck'], Pin.OUT, Pin.PULL_DOWN),
+        mosi = Pin(device_config['mosi'], Pin.OUT, Pin.PULL_UP),
+        miso = Pin(device_config['miso'], Pin.IN, Pin.PULL_UP))
+
+lora = SX127x(device_spi, pins=device_config, lora_parameters=lora_parameters, ttn_config=ttn_config)
+soil = ADC(Pin(26))
+
+# Same 16 byte payload as the irrigation report
+payload = struct.pack('@ffff', 12.5, 360.0, 60.0, 55.0)
+
+# frame counter of the throwaway session, increasing across both runs
+frame_counter = 0
+
+def next_frame_counter():
+    global frame_counter
+    frame_counter += 1
+    return frame_counter - 1
+
+def inline_send():
+    lora.send_data(data=payload, data_length=len(payload), frame_counter=next_frame_counter())
+    lora.receive_windows()
+
+def control_loop(send):
+    """ Fixed-rate loop reading the soil sensor, returns the worst and
+        mean lateness of the iterations in ms.
+    """
+    worst = 0
+    total = 0
+    deadline = utime.ticks_ms()
+    for i in range(iterations):
+        late = max(utime.ticks_diff(utime.ticks_ms(), deadline), 0)
+        worst = max(worst, late)
+        total += late
+
+        soil.read_u16()
+        if i % send_every == 0:
+            send()
+
+        deadline = utime.ticks_add(deadline, period_ms)
+        wait = utime.ticks_diff(deadline, utime.ticks_ms())
+        if wait > 0:
+            utime.sleep_ms(wait)
+        else:
+            # overran: restart the schedule instead of bursting to catch up
+            deadline = utime.ticks_ms()
+    return worst, total / iterations
+
+worst, mean = control_loop(inline_send)
+print("inline: worst {} ms, mean {:.2f} ms late".format(worst, mean))
+
+worker = RadioWorker(lora)
+worker.start()
+worst, mean = control_loop(lambda: worker.send(payload, next_frame_counter()))
+print("worker: worst {} ms, mean {:.2f} ms late".format(worst, mean))
+
+event = bytearray(255)
+while worker.running:
+    message = worker.poll(event)
+    if message is None:
+        worker.stop()
+        utime.sleep_ms(100)
+    elif message[0] == EVT_ERROR:
+        print("worker error:", bytes(event[:message[1]]))
@@ -90,6 +90,11 @@ device_config = {
 app_config = {
     'loop': 200,
     'sleep': 100,
+    'status_leds': True,  # set False to keep all indicator LEDs off
+    'adr': False,  # adaptive data rate on the uplinks (opt-in)
+    'listen_before_talk': False,  # CAD before each uplink (opt-in)
+    'radio_worker': False,  # run the radio stack on core 1
+    'confirmed_uplinks': False,  # pump reports wait for the network's ACK (opt-in)
 }
 
 lora_parameters = {
@@ -104,6 +109,15 @@ lora_parameters = {
     'invert_IQ': False,
 }
 
+# Fixed-frame relay link (fixed_frame.FrameSchema), same on both ends:
+# initial moisture, pump duration, water used, final moisture
+relay_link = {
+    'fmt': '<ffff',
+    'coding_rate': 5,
+    'crc': True,
+    'sync_word': 0x12,
+}
+
 wifi_config = {
     'ssid':'',
     'password':''
@@ -0,0 +1,54 @@
+from sx127x import RX2_FREQUENCY, RX2_DATA_RATE
+
+
+class DualRadio:
+    """ Two SX127x radios (e.g. on SPI0 and SPI1) acting as one Class A
+        node: tx sends the uplinks and opens RX1, rx listens on RX2 all
+        the time. RX2 downlinks are never missed and tx is free to send
+        again right after RX1.
+
+        Both radios must be built with the same TTN session; the downlink
+        frame counter is kept in step between them. rx uses the ADR of
+        tx, so LinkADRReq heard on RX2 sets the uplink data rate and
+        queues its answer in the FOpts of tx, and a confirmed downlink
+        on RX2 is acknowledged by the next uplink of tx.
+    """
+    def __init__(self, tx, rx, rx2_frequency=RX2_FREQUENCY,
+                 rx2_data_rate=RX2_DATA_RATE):
+        self.tx = tx
+        self.rx = rx
+        self._on_receive = None
+        # one ADR for the node, it acts on the uplink radio
+        rx.adr = tx.adr
+
+        rx.on_receive(self._handle_rx2)
+        rx.listen_rx2(rx2_frequency, rx2_data_rate)
+
+    def on_receive(self, callback):
+        """ callback(lora, payload) for downlinks heard on RX2.
+        """
+        self._on_receive = callback
+
+    def send_data(self, data, data_length, frame_counter, timeout=5):
+        """ Uplink on tx followed by RX1. Returns the RX1 payload or None,
+            RX2 downlinks go to the on_receive callback.
+        """
+        self.tx.send_data(data, data_length, frame_counter, timeout)
+        payload = self.tx.receive_windows(rx2_delay=None)
+        self._sync(self.tx, self.rx)
+        return payload
+
+    def _handle_rx2(self, lora, payload):
+        self._sync(self.rx, self.tx)
+        # the ACK goes out with the next uplink, which only tx sends
+        if self.rx._ack_pending:
+            self.tx._ack_pending = True
+            self.rx._ack_pending = False
+        if self._on_receive:
+            self._on_receive(lora, payload)
+
+    @staticmethod
+    def _sync(source, target):
+        # one session, one FCntDown, whichever radio heard the frame
+        if source.frame_counter_down > target.frame_counter_down:
+            target.frame_counter_down = source.frame_counter_down
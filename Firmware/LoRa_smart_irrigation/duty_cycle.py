@@ -0,0 +1,67 @@
+import utime
+
+# ETSI EN 300 220 sub-bands used by EU868: (low Hz, high Hz, duty cycle
+# divisor), e.g. 100 is a 1% duty cycle
+EU868_SUB_BANDS = (
+    (863000000, 865000000, 1000),
+    (865000000, 868000000, 100),
+    (868000000, 868600000, 100),
+    (868700000, 869200000, 1000),
+    (869400000, 869650000, 10),
+    (869700000, 870000000, 100),
+)
+
+# an off time can never be longer than this, older entries are stale ticks
+MAX_OFF_MS = 3600000
+
+
+def frf_to_hz(frf):
+    """ Carrier frequency of an FRF MSB/MID/LSB triple (32 MHz crystal).
+    """
+    return ((frf[0] << 16) | (frf[1] << 8) | frf[2]) * 15625 >> 8
+
+
+class DutyCycle:
+    """ Per sub-band airtime ledger.
+
+        After a transmission of t on a sub-band with duty cycle 1/d the
+        sub-band stays closed for t * d, counted from the start of the
+        transmission.
+    """
+    def __init__(self, sub_bands=EU868_SUB_BANDS):
+        self._sub_bands = sub_bands
+        self._available = [0] * len(sub_bands)
+        self._closed = bytearray(len(sub_bands))
+        self.airtime_us = [0] * len(sub_bands)
+
+    def sub_band(self, frequency):
+        """ Index of the sub-band holding frequency (Hz), -1 if none.
+        """
+        for i in range(len(self._sub_bands)):
+            low, high, _ = self._sub_bands[i]
+            if low <= frequency < high:
+                return i
+        return -1
+
+    def delay_ms(self, sub_band):
+        """ Milliseconds until sub_band may transmit again, 0 if now.
+        """
+        if sub_band < 0 or not self._closed[sub_band]:
+            return 0
+        delay = utime.ticks_diff(self._available[sub_band], utime.ticks_ms())
+        if delay <= 0 or delay > MAX_OFF_MS:
+            self._closed[sub_band] = 0
+            return 0
+        return delay
+
+    def record(self, sub_band, time_on_air_us):
+        """ Books a transmission that just ended on sub_band.
+        """
+        if sub_band < 0:
+            return
+        self.airtime_us[sub_band] += time_on_air_us
+        divisor = self._sub_bands[sub_band][2]
+        off_ms = (time_on_air_us * divisor + 999) // 1000
+        start = utime.ticks_add(utime.ticks_ms(), -(time_on_air_us // 1000))
+        self._available[sub_band] = utime.ticks_add(start, off_ms)
+        self._closed[sub_band] = 1
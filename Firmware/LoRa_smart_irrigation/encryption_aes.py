@@ -38,21 +38,28 @@ class AES:
         self.encrypt_payload(aes_data)
         return aes_data
 
-    def decrypt_payload(self, cipher):
-        _aes = aes(self._app_key, 1)
-        print(cipher)
+    def decrypt_payload(self, cipher, length=None):
+        """Decrypts a downlink FRMPayload in place, frame_counter is FCntDown.
+        :param bytearray cipher: Data to-be-decrypted.
+        :param int length: Number of bytes to decrypt, defaults to len(cipher).
+        """
+        self.encrypt_payload(cipher, length, direction=1)
         return cipher
 
-    def encrypt_payload(self, data):
-        """Encrypts data payload.
+    def encrypt_payload(self, data, length=None, direction=0):
+        """Encrypts data payload in place.
         :param bytearray data: Data to-be-encrypted.
+        :param int length: Number of bytes to encrypt, defaults to len(data).
+        :param int direction: 0 for uplinks, 1 for downlinks.
         """
         _aes = aes(self._app_key, 1)
+        if length is None:
+            length = len(data)
 
         block_a = bytearray(16)
         # calculate required number of blocks
-        num_blocks = len(data) // 16
-        incomplete_block_size = len(data) % 16
+        num_blocks = length // 16
+        incomplete_block_size = length % 16
         if incomplete_block_size != 0:
             num_blocks += 1
         # k = data ptr
@@ -64,7 +71,7 @@ class AES:
             block_a[2] = 0x00
             block_a[3] = 0x00
             block_a[4] = 0x00
-            block_a[5] = 0x00
+            block_a[5] = direction
             # block from device_address, MSB first
             block_a[6] = self._device_address[3]
             block_a[7] = self._device_address[2]
@@ -218,4 +225,131 @@ class AES:
         :param bytearray old_data: data to be xor'd.
         """
         for i in range(16):
-            new_data[i] ^= old_data[i]
\ No newline at end of file
+            new_data[i] ^= old_data[i]
+
+class SessionCrypto:
+    """ Long-lived LoRaWAN session crypto context.
+
+        Created once per session: holds the AES cipher instances for the
+        application and network keys, the CMAC subkeys K1/K2 (which only
+        depend on the network key) and the block buffers, so an uplink
+        costs no cipher setup and no allocation.
+    """
+
+    def __init__(self, device_address, app_key, network_key):
+        self._device_address = device_address
+        self._app_aes = aes(app_key, 1)
+        self._network_aes = aes(network_key, 1)
+
+        # encryption block A and keystream block S
+        self._block_a = bytearray(16)
+        self._block_s = bytearray(16)
+        self._block_a[0] = 0x01
+        # MIC block B0, running CMAC state and message block
+        self._block_b = bytearray(16)
+        self._block_b[0] = 0x49
+        self._cmac = bytearray(16)
+        self._block = bytearray(16)
+        # DevAddr, LSB first as on air
+        for block in (self._block_a, self._block_b):
+            block[6] = device_address[3]
+            block[7] = device_address[2]
+            block[8] = device_address[1]
+            block[9] = device_address[0]
+        self._mic = bytearray(4)
+
+        # CMAC subkeys (RFC 4493): K1 = L << 1, K2 = K1 << 1, L = AES(0)
+        self._key_k1 = bytearray(16)
+        self._key_k2 = bytearray(16)
+        self._network_aes.encrypt(bytearray(16), self._key_k1)
+        self._generate_subkey(self._key_k1)
+        self._key_k2[:] = self._key_k1
+        self._generate_subkey(self._key_k2)
+
+    def encrypt(self, fcnt, buf, n=None, direction=0, offset=0, network=False):
+        """ Encrypts (or decrypts, the operation is symmetric) n bytes of
+            buf starting at offset, in place. n defaults to the rest of buf.
+            FPort 0 payloads (MAC commands) use the network key.
+        """
+        if n is None:
+            n = len(buf) - offset
+        block_a = self._block_a
+        block_s = self._block_s
+        block_a[5] = direction
+        self._set_fcnt(block_a, fcnt)
+
+        cipher = self._network_aes if network else self._app_aes
+        k = offset
+        end = offset + n
+        i = 1
+        while k < end:
+            block_a[15] = i
+            cipher.encrypt(block_a, block_s)
+            for j in range(min(16, end - k)):
+                buf[k] ^= block_s[j]
+                k += 1
+            i += 1
+        return buf
+
+    def mic(self, fcnt, buf, n, direction=0):
+        """ Message integrity code over the first n bytes of buf
+            (MHDR | FHDR | FPort | FRMPayload). Returns a reused
+            4 byte buffer.
+        """
+        block_b = self._block_b
+        block_b[5] = direction
+        self._set_fcnt(block_b, fcnt)
+        block_b[15] = n
+
+        cmac = self._cmac
+        block = self._block
+        self._network_aes.encrypt(block_b, cmac)
+
+        k = 0
+        while k < n:
+            remaining = n - k
+            if remaining > 16:
+                for j in range(16):
+                    block[j] = buf[k + j] ^ cmac[j]
+            elif remaining == 16:
+                for j in range(16):
+                    block[j] = buf[k + j] ^ cmac[j] ^ self._key_k1[j]
+            else:
+                for j in range(16):
+                    if j < remaining:
+                        pad = buf[k + j]
+                    elif j == remaining:
+                        pad = 0x80
+                    else:
+                        pad = 0x00
+                    block[j] = pad ^ cmac[j] ^ self._key_k2[j]
+            self._network_aes.encrypt(block, cmac)
+            k += 16
+
+        mic = self._mic
+        mic[0] = cmac[0]
+        mic[1] = cmac[1]
+        mic[2] = cmac[2]
+        mic[3] = cmac[3]
+        return mic
+
+    def verify_mic(self, fcnt, buf, n, direction=1):
+        """ True if the 4 bytes after the first n bytes of buf are their MIC.
+        """
+        mic = self.mic(fcnt, buf, n, direction)
+        return mic[0] == buf[n] and mic[1] == buf[n + 1] and \
+            mic[2] == buf[n + 2] and mic[3] == buf[n + 3]
+
+    @staticmethod
+    def _set_fcnt(block, fcnt):
+        block[10] = fcnt & 0xFF
+        block[11] = (fcnt >> 8) & 0xFF
+        block[12] = (fcnt >> 16) & 0xFF
+        block[13] = (fcnt >> 24) & 0xFF
+
+    @staticmethod
+    def _generate_subkey(key):
+        msb = key[0] & 0x80
+        AES._shift_left(key)
+        if msb:
+            key[15] ^= 0x87
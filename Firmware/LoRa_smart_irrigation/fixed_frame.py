@@ -0,0 +1,185 @@
+import struct
+import utime
+from machine import Pin
+from micropython import schedule
+from rx_ring import RxRing
+from sx127x import (
+    REG_FIFO, REG_FIFO_ADDR_PTR, REG_FIFO_RX_CURRENT_ADDR, REG_IRQ_FLAGS,
+    REG_PAYLOAD_LENGTH, REG_PKT_RSSI_VALUE, REG_PKT_SNR_VALUE,
+    IRQ_RX_DONE_MASK, IRQ_PAYLOAD_CRC_ERROR_MASK, MAX_PKT_LENGTH,
+)
+
+# private network sync word, keeps relay frames apart from LoRaWAN (0x34)
+P2P_SYNC_WORD = 0x12
+
+
+class FrameSchema:
+    """ What both ends of a fixed-frame link agree on: the frame layout
+        as a struct format, coding rate, CRC and sync word. Keep one
+        schema in config.py and build both ends from it.
+    """
+    def __init__(self, fmt, coding_rate=5, crc=True, sync_word=P2P_SYNC_WORD):
+        self.fmt = fmt
+        self.payload_length = struct.calcsize(fmt)
+        if not 0 < self.payload_length <= MAX_PKT_LENGTH:
+            raise ValueError("Frame must be 1 to {} bytes.".format(
+                MAX_PKT_LENGTH))
+        self.coding_rate = coding_rate
+        self.crc = crc
+        self.sync_word = sync_word
+
+    def pack_into(self, buffer, *values):
+        struct.pack_into(self.fmt, buffer, 0, *values)
+
+    def unpack(self, frame):
+        return struct.unpack_from(self.fmt, frame)
+
+    def configure(self, lora):
+        """ Register settings of the link, compiled into a profile.
+        """
+        lora.implicit_header_mode(True)
+        lora.write_register(REG_PAYLOAD_LENGTH, self.payload_length)
+        lora.set_coding_rate(self.coding_rate)
+        lora.enable_CRC(self.crc)
+        lora.set_sync_word(self.sync_word)
+
+
+class FixedFrameLink:
+    """ Point-to-point link of fixed-size frames in implicit header mode.
+
+        With length, coding rate and CRC agreed up front no PHY header is
+        sent, which saves its symbols on every frame (see time_on_air_us),
+        and the receiver reads exactly one frame per packet without
+        looking at a length. Takes over the DIO0 interrupt of a radio
+        dedicated to the link; the radio needs a fixed channel.
+
+            link = FixedFrameLink(lora, FrameSchema(**relay_link))
+            link.on_receive(lambda link, frame: print(link.schema.unpack(frame)))
+            link.listen()
+    """
+    def __init__(self, lora, schema, rx_slots=4):
+        if not lora._pin_rx_done:
+            raise ValueError("FixedFrameLink needs the dio_0 pin.")
+        if lora._channel is None:
+            raise ValueError("FixedFrameLink needs a fixed channel.")
+        self.lora = lora
+        self.schema = schema
+        self._length = schema.payload_length
+
+        # one ring slot per frame, a full slot read is one frame
+        self._ring = RxRing(rx_slots, self._length)
+        self._frame = bytearray(self._length)
+        self._on_receive = None
+        self._poll_scheduled = False
+        # bound once, binding in the IRQ would allocate
+        self._poll_ref = self._scheduled_poll
+        self.rx_packets = 0
+        self.rx_dropped = 0  # CRC errors
+        self.rx_overflows = 0  # ring full
+
+        self._profile = lora.compile_profile(schema.configure, 'fixed_frame')
+        lora.apply_profile(self._profile)
+        lora._pin_rx_done.irq(
+            trigger=Pin.IRQ_RISING, handler = self._handle_dio0
+        )
+
+    def time_on_air_us(self):
+        return self.lora.time_on_air_us(self._length)
+
+    def on_receive(self, callback):
+        """ Registers callback(link, frame), the frame is only valid
+            during the callback.
+        """
+        self._on_receive = callback
+
+    def listen(self):
+        """ Continuous reception of frames.
+        """
+        self.lora.receive(self._length)
+
+    def send(self, frame, timeout=5):
+        """ Sends one frame of exactly payload_length bytes, the radio is
+            left in standby.
+        """
+        if len(frame) != self._length:
+            raise ValueError("Frame must be {} bytes.".format(self._length))
+
+        lora = self.lora
+        lora.set_lock(True)
+        try:
+            lora.standby()
+            lora.prepare_packet(implicit_header_mode=True)
+            if lora._listen_before_talk:
+                lora.listen_before_talk()
+            lora.write(frame, self._length)
+            lora.end_packet(timeout)
+        finally:
+            lora.set_lock(False)
+
+        lora.blink_led()
+
+    def _handle_dio0(self, event_source):
+        lora = self.lora
+        if lora._cad_pending:
+            return
+        if lora._tx_pending:
+            lora._tx_done_ms = utime.ticks_ms()
+            lora._tx_done = True
+            return
+
+        irq_flags = lora.read_register(REG_IRQ_FLAGS)
+        lora.write_register(REG_IRQ_FLAGS, irq_flags)
+        if irq_flags & IRQ_RX_DONE_MASK == 0:
+            return
+        lora.reset_hop()
+        if irq_flags & IRQ_PAYLOAD_CRC_ERROR_MASK:
+            self.rx_dropped += 1
+            return
+
+        slot = self._ring.slot()
+        if slot is None:
+            self.rx_overflows += 1
+            return
+        # no header, no length to read: the slot is one frame
+        lora.write_register(
+            REG_FIFO_ADDR_PTR, lora.read_register(REG_FIFO_RX_CURRENT_ADDR)
+        )
+        lora.read_registers(REG_FIFO, slot)
+        self._ring.commit(
+            self._length,
+            lora.read_register(REG_PKT_RSSI_VALUE),
+            lora.read_register(REG_PKT_SNR_VALUE)
+        )
+        self.rx_packets += 1
+
+        if not self._poll_scheduled:
+            self._poll_scheduled = True
+            try:
+                schedule(self._poll_ref, None)
+            except RuntimeError:
+                # schedule queue full, the next IRQ or poll() catches up
+                self._poll_scheduled = False
+
+    def _scheduled_poll(self, _):
+        self._poll_scheduled = False
+        self.poll()
+
+    def poll(self):
+        """ Hands the queued frames to the on_receive callback, oldest
+            first. Returns the number of frames handled.
+        """
+        ring = self._ring
+        frame = self._frame
+        handled = 0
+        while len(ring):
+            packet, slot = ring.peek()
+            frame[:] = packet
+            rssi_value = ring.rssi[slot]
+            snr_value = ring.snr[slot]
+            ring.release()
+            handled += 1
+
+            self.lora.record_link_quality(rssi_value, snr_value)
+            if self._on_receive:
+                self._on_receive(self, frame)
+        return handled
@@ -0,0 +1,347 @@
+import struct
+import utime
+from duty_cycle import frf_to_hz
+from sx127x import (
+    REG_FIFO, REG_OP_MODE, REG_FRF_MSB, REG_DIO_MAPPING_1,
+    MODE_SLEEP, MODE_STDBY, MODE_TX, MODE_RX_CONTINUOUS, DIO0_RX_DONE,
+)
+
+# FSK page registers (SX1276 datasheet 6.2), 0x0D-0x3F mean something
+# else in LoRa mode; the chip keeps the LoRa values while in FSK
+REG_BITRATE_MSB = 0x02
+REG_RX_CONFIG = 0x0D
+REG_RX_BW = 0x12
+REG_FSK_PREAMBLE_DETECT = 0x1F
+REG_FSK_PREAMBLE_MSB = 0x25
+REG_FIFO_THRESH = 0x35
+REG_IRQ_FLAGS_1 = 0x3E
+REG_IRQ_FLAGS_2 = 0x3F
+REG_BITRATE_FRAC = 0x5D
+
+FSK_MODE = 0x00  # REG_OP_MODE bit 7 clear, FSK modulation
+FXOSC = 32000000
+FSTEP = FXOSC / (1 << 19)
+
+IRQ1_MODE_READY = 0x80
+IRQ2_PACKET_SENT = 0x08
+IRQ2_PAYLOAD_READY = 0x04
+IRQ2_CRC_OK = 0x02
+
+# RxConfig: AFC and AGC on, RX starts on preamble detection
+RX_CONFIG = 0x1E
+# preamble detector on, 2 bytes, 10 chips tolerance
+PREAMBLE_DETECT = 0xAA
+# SyncConfig: auto restart RX after a packet, sync word on, 4 bytes
+SYNC_CONFIG = 0x53
+FSK_SYNC_WORD = b'\xC1\x94\xC1\x5A'
+# PacketConfig1: variable length, whitening, CRC on, keep packets with a
+# bad CRC so CrcOk can be counted; PacketConfig2: packet mode
+PACKET_CONFIG_1 = 0xD8
+PACKET_CONFIG_2 = 0x40
+# TX starts as soon as the FIFO is not empty
+FIFO_THRESH = 0x8F
+# DIO0 10: no FSK event, the modem polls its IRQ flags
+DIO0_FSK_NONE = 0x80
+
+FSK_MAX_BITRATE = 300000
+# the FSK FIFO holds 64 bytes, length byte included
+FSK_MAX_PAYLOAD = 63
+MODE_READY_TIMEOUT_MS = 10
+# longest wait for the duty cycle before a send is refused, below the
+# receiver's BULK_IDLE_TIMEOUT_MS so a paced bulk transfer keeps going
+DUTY_CYCLE_MAX_WAIT_MS = 500
+
+# bulk transfer frames: kind, sequence number (LE), data
+BULK_START = 1  # data: total length (LE u32)
+BULK_DATA = 2
+BULK_END = 3
+BULK_ACK = 4
+BULK_HEADER = 3
+BULK_CHUNK = FSK_MAX_PAYLOAD - BULK_HEADER
+BULK_RETRIES = 5
+BULK_ACK_TIMEOUT_MS = 50
+BULK_IDLE_TIMEOUT_MS = 1000
+
+
+def rx_bw_code(bandwidth):
+    """ RegRxBw value of the narrowest bandwidth of at least bandwidth
+        Hz, FXOSC / (mant * 2 ** (exp + 2)); 250 kHz at most.
+    """
+    for exp in range(7, 0, -1):
+        for code, mant in ((2, 24), (1, 20), (0, 16)):
+            if FXOSC // (mant << (exp + 2)) >= bandwidth:
+                return code << 3 | exp
+    return 0x01
+
+
+class FskModem:
+    """ High-rate FSK profile of an SX127x for close-range maintenance:
+        a laptop or handheld pulling logged data or pushing configuration
+        in seconds rather than minutes of LoRa airtime.
+
+        enter() switches the radio to FSK with a precompiled register
+        image, exit() goes back to LoRa. The LoRa registers are kept by
+        the chip meanwhile and the LoRaWAN session lives in the driver,
+        so exit() only restores the registers both modes share. FSK
+        bypasses the register shadow; IRQ flags are polled and DIO0 is
+        muted, so no LoRa interrupt handler fires while in FSK. Airtime
+        is booked in the radio's duty cycle ledger like LoRa uplinks,
+        sends wait for the sub-band up to DUTY_CYCLE_MAX_WAIT_MS; pick a
+        frequency whose band allows the traffic, e.g. 869.525 MHz (10%).
+
+            with FskModem(lora) as fsk:
+                fsk.send_bulk(log)
+    """
+    def __init__(self, lora, bitrate=300000, fdev=100000, frequency=None,
+                 preamble_length=5, sync_word=FSK_SYNC_WORD):
+        if not 1200 <= bitrate <= FSK_MAX_BITRATE:
+            raise ValueError("FSK bit rate must be 1200 to {} bps.".format(
+                FSK_MAX_BITRATE))
+        self.lora = lora
+        self._frequency = frequency  # FRF bytes, None keeps the channel
+        self._preamble_length = preamble_length
+        self.active = False
+        self._sub_band = -1
+
+        br = FXOSC * 16 // bitrate
+        fd = int(fdev / FSTEP + 0.5)
+        # Carson: deviation plus half the bit rate on either side
+        bw = rx_bw_code(fdev + bitrate // 2)
+
+        config = bytearray(14)  # PreambleMsb 0x25 .. PayloadLength 0x32
+        config[0] = preamble_length >> 8
+        config[1] = preamble_length & 0xFF
+        config[2] = SYNC_CONFIG
+        for i in range(4):
+            config[3 + i] = sync_word[i]
+        config[11] = PACKET_CONFIG_1
+        config[12] = PACKET_CONFIG_2
+        config[13] = FSK_MAX_PAYLOAD  # RX drops longer packets
+        # register image as (address, burst) pairs
+        self._image = (
+            (REG_BITRATE_MSB, bytes([br >> 12, (br >> 4) & 0xFF,
+                                     fd >> 8, fd & 0xFF])),
+            (REG_BITRATE_FRAC, bytes([br & 0x0F])),
+            (REG_RX_CONFIG, bytes([RX_CONFIG])),
+            (REG_RX_BW, bytes([bw, bw])),  # RxBw, AfcBw
+            (REG_FSK_PREAMBLE_DETECT, bytes([PREAMBLE_DETECT])),
+            (REG_FSK_PREAMBLE_MSB, bytes(config)),
+            (REG_FIFO_THRESH, bytes([FIFO_THRESH])),
+            (REG_DIO_MAPPING_1, bytes([DIO0_FSK_NONE])),
+        )
+        self.bitrate = FXOSC * 16 // br
+
+        self._tx = bytearray(FSK_MAX_PAYLOAD + 1)
+        self._rx = bytearray(FSK_MAX_PAYLOAD)
+        self._frame = bytearray(FSK_MAX_PAYLOAD)
+        self.rx_crc_errors = 0
+        self.bulk_retries = 0
+
+    def __enter__(self):
+        self.enter()
+        return self
+
+    def __exit__(self, *exc):
+        self.exit()
+
+    def enter(self):
+        """ LoRa sleep, FSK sleep, register image, FSK standby.
+        """
+        lora = self.lora
+        lora.set_mode(MODE_SLEEP)
+        # sleep clears the FIFO, a preloaded uplink is gone
+        lora._preloaded = None
+        self._op_mode(MODE_SLEEP)
+        for address, burst in self._image:
+            lora._burst_write(address, burst)
+        if self._frequency is not None:
+            lora.write_registers(REG_FRF_MSB, self._frequency)
+        if lora._duty_cycle:
+            frf = bytearray(3)
+            lora.read_registers(REG_FRF_MSB, frf)
+            self._sub_band = lora._duty_cycle.sub_band(frf_to_hz(frf))
+        self._op_mode(MODE_STDBY)
+        self._wait_mode_ready()
+        self.active = True
+
+    def exit(self):
+        """ Back to LoRa standby with the LoRaWAN settings.
+        """
+        lora = self.lora
+        self._op_mode(MODE_SLEEP)
+        lora.set_mode(MODE_SLEEP)
+        lora.standby()
+        # DIO mapping is shared by both modes, the shadow holds the LoRa one
+        lora._shadow_valid[REG_DIO_MAPPING_1] = 0
+        lora.write_register(REG_DIO_MAPPING_1, DIO0_RX_DONE)
+        if self._frequency is not None and lora._actual_channel is not None:
+            lora.set_frequency(lora._actual_channel)
+        self.active = False
+
+    def _op_mode(self, mode):
+        self.lora.transfer(REG_OP_MODE | 0x80, FSK_MODE | mode)
+
+    def _irq_flags_2(self):
+        return self.lora.transfer(REG_IRQ_FLAGS_2)
+
+    def _wait_mode_ready(self):
+        start = utime.ticks_ms()
+        while self.lora.transfer(REG_IRQ_FLAGS_1) & IRQ1_MODE_READY == 0:
+            if utime.ticks_diff(utime.ticks_ms(), start) >= MODE_READY_TIMEOUT_MS:
+                raise RuntimeError("FSK mode not ready")
+
+    def time_on_air_us(self, payload_length):
+        # preamble, sync word, length byte, payload and CRC
+        n = self._preamble_length + 4 + 1 + payload_length + 2
+        return n * 8 * 1000000 // self.bitrate
+
+    def duty_cycle_delay_ms(self):
+        """ Milliseconds until the FSK frequency may transmit again.
+        """
+        duty_cycle = self.lora._duty_cycle
+        if not duty_cycle:
+            return 0
+        return duty_cycle.delay_ms(self._sub_band)
+
+    def send_packet(self, buffer, length, timeout_ms=100,
+                    max_wait_ms=DUTY_CYCLE_MAX_WAIT_MS):
+        """ One variable-length packet of at most FSK_MAX_PAYLOAD bytes,
+            length byte and payload loaded in a single burst. Waits up to
+            max_wait_ms for the duty cycle, RuntimeError if longer.
+        """
+        if length > FSK_MAX_PAYLOAD:
+            raise ValueError("FSK packet too long.")
+        delay = self.duty_cycle_delay_ms()
+        if delay > max_wait_ms:
+            raise RuntimeError("Duty cycle limit, FSK free in {} ms".format(delay))
+        if delay:
+            utime.sleep_ms(delay)
+        tx = self._tx
+        tx[0] = length
+        for i in range(length):
+            tx[1 + i] = buffer[i]
+        self.lora._burst_write(REG_FIFO, memoryview(tx)[:length + 1])
+
+        self._op_mode(MODE_TX)
+        start = utime.ticks_ms()
+        while self._irq_flags_2() & IRQ2_PACKET_SENT == 0:
+            if utime.ticks_diff(utime.ticks_ms(), start) >= timeout_ms:
+                self._op_mode(MODE_STDBY)
+                raise RuntimeError("Timeout during FSK packet send")
+        self._op_mode(MODE_STDBY)
+        duty_cycle = self.lora._duty_cycle
+        if duty_cycle:
+            duty_cycle.record(self._sub_band, self.time_on_air_us(length))
+
+    def receive_packet(self, buffer, timeout_ms):
+        """ Waits up to timeout_ms for a packet with a valid CRC, returns
+            its length with the payload in buffer, or None.
+        """
+        lora = self.lora
+        self._op_mode(MODE_RX_CONTINUOUS)
+        start = utime.ticks_ms()
+        length = None
+        while utime.ticks_diff(utime.ticks_ms(), start) < timeout_ms:
+            irq_flags = self._irq_flags_2()
+            if irq_flags & IRQ2_PAYLOAD_READY == 0:
+                continue
+            n = lora.transfer(REG_FIFO)
+            if n:
+                lora.read_registers(REG_FIFO, memoryview(buffer)[:n])
+            if irq_flags & IRQ2_CRC_OK:
+                length = n
+                break
+            self.rx_crc_errors += 1
+        self._op_mode(MODE_STDBY)
+        return length
+
+    def send_bulk(self, data, length=None, ack_timeout_ms=BULK_ACK_TIMEOUT_MS):
+        """ Sends length bytes of data as START, DATA... and END frames,
+            each acknowledged by the receiver before the next one goes
+            out. Raises RuntimeError when a frame is not acknowledged
+            after BULK_RETRIES retries. Returns the number of frames.
+        """
+        n = len(data) if length is None else length
+        if n > 0xFFFE * BULK_CHUNK:
+            raise ValueError("Bulk transfer too long.")
+        frame = self._frame
+
+        struct.pack_into('<I', frame, BULK_HEADER, n)
+        self._exchange(BULK_START, 0, 4, ack_timeout_ms)
+        seq = 1
+        for offset in range(0, n, BULK_CHUNK):
+            count = min(BULK_CHUNK, n - offset)
+            for i in range(count):
+                frame[BULK_HEADER + i] = data[offset + i]
+            self._exchange(BULK_DATA, seq, count, ack_timeout_ms)
+            seq += 1
+        self._exchange(BULK_END, seq, 0, ack_timeout_ms)
+        return seq + 1
+
+    def _exchange(self, kind, seq, count, ack_timeout_ms):
+        frame = self._frame
+        rx = self._rx
+        frame[0] = kind
+        frame[1] = seq & 0xFF
+        frame[2] = seq >> 8
+        for attempt in range(BULK_RETRIES + 1):
+            if attempt:
+                self.bulk_retries += 1
+            self.send_packet(frame, BULK_HEADER + count)
+            n = self.receive_packet(rx, ack_timeout_ms)
+            if n is not None and n >= BULK_HEADER and rx[0] == BULK_ACK and \
+               rx[1] | (rx[2] << 8) == seq:
+                return
+        raise RuntimeError("No ACK for bulk frame {}".format(seq))
+
+    def _ack(self, seq):
+        tx = self._frame
+        tx[0] = BULK_ACK
+        tx[1] = seq & 0xFF
+        tx[2] = seq >> 8
+        self.send_packet(tx, BULK_HEADER)
+
+    def receive_bulk(self, buffer, timeout_ms=10000):
+        """ Receives a bulk transfer into buffer, waiting up to timeout_ms
+            for it to start. Returns the number of bytes received. Raises
+            ValueError if it does not fit and RuntimeError when the sender
+            goes quiet for BULK_IDLE_TIMEOUT_MS.
+        """
+        rx = self._rx
+        start = utime.ticks_ms()
+        total = None
+        while total is None:
+            remaining = timeout_ms - utime.ticks_diff(utime.ticks_ms(), start)
+            if remaining <= 0:
+                return 0
+            n = self.receive_packet(rx, remaining)
+            if n is not None and n >= BULK_HEADER + 4 and rx[0] == BULK_START:
+                total = struct.unpack_from('<I', rx, BULK_HEADER)[0]
+        if total > len(buffer):
+            raise ValueError("Bulk transfer of {} bytes does not fit.".format(total))
+        self._ack(0)
+
+        expected = 1
+        while True:
+            n = self.receive_packet(rx, BULK_IDLE_TIMEOUT_MS)
+            if n is None:
+                raise RuntimeError("Bulk transfer stalled at frame {}".format(expected))
+            if n < BULK_HEADER:
+                continue
+            seq = rx[1] | (rx[2] << 8)
+            if seq < expected:
+                self._ack(seq)  # our ACK was lost, the frame is repeated
+                continue
+            if seq > expected:
+                continue
+
+            kind = rx[0]
+            if kind == BULK_DATA:
+                offset = (seq - 1) * BULK_CHUNK
+                count = min(n - BULK_HEADER, total - offset)
+                for i in range(count):
+                    buffer[offset + i] = rx[BULK_HEADER + i]
+            self._ack(seq)
+            expected += 1
+            if kind == BULK_END:
+                return total
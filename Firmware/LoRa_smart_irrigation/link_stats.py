@@ -0,0 +1,55 @@
+class RollingStats:
+    """ Statistics over the last size samples.
+
+        The window is kept twice: in arrival order, to know which sample
+        drops out, and sorted, so min/max/percentiles are a lookup. Each
+        add() is one insertion into a short sorted list, the mean is a
+        running sum.
+    """
+    def __init__(self, size=16):
+        self._size = size
+        self._samples = [0.0] * size
+        self._sorted = []
+        self._next = 0
+        self._sum = 0.0
+
+    def __len__(self):
+        return len(self._sorted)
+
+    def add(self, value):
+        ordered = self._sorted
+        if len(ordered) == self._size:
+            old = self._samples[self._next]
+            ordered.remove(old)
+            self._sum -= old
+        self._samples[self._next] = value
+        self._next = (self._next + 1) % self._size
+        self._sum += value
+
+        # insertion into the sorted window
+        i = len(ordered)
+        while i > 0 and ordered[i - 1] > value:
+            i -= 1
+        ordered.insert(i, value)
+
+    def min(self):
+        return self._sorted[0] if self._sorted else None
+
+    def max(self):
+        return self._sorted[-1] if self._sorted else None
+
+    def mean(self):
+        if not self._sorted:
+            return None
+        return self._sum / len(self._sorted)
+
+    def percentile(self, p):
+        """ Nearest-rank percentile, p in 0..100: the smallest sample
+            with at least p% of the window at or below it.
+        """
+        if not self._sorted:
+            return None
+        n = len(self._sorted)
+        # rank ceil(p * n / 100), 1-based
+        rank = int(-(-p * n // 100))
+        return self._sorted[min(max(rank, 1), n) - 1]
@@ -2,7 +2,9 @@ import utime
 import struct
 import urandom
 import ujson
-from sx127x import TTN, SX127x
+from sx127x import TTN, SX127x, UPLINK_ACKED
+from status_led import StatusLEDs
+from radio_worker import RadioWorker, EVT_SENT, EVT_DOWNLINK, EVT_UNACKED
 from machine import Pin, SPI, ADC
 from config import *
 
@@ -12,6 +14,11 @@ pump = Pin(15, Pin.OUT)  # Relay activation pin
 irrigON = Pin(20, Pin.OUT) # LED to indicate when irrigation is happening
 moistureOK = Pin(19, Pin.OUT) # LED showing good soil conditions
 
+# Timer driven indicator LEDs, shared with the lora driver
+leds = StatusLEDs(enabled=app_config['status_leds'])
+leds.add('irrigation', irrigON)
+leds.add('moisture', moistureOK)
+
 # Calibration values for soil sensor ADC readings
 min_moisture = 0
 max_moisture = 65535
@@ -50,17 +57,33 @@ device_spi = SPI(device_config['spi_unit'], baudrate = 10000000,
         mosi = Pin(device_config['mosi'], Pin.OUT, Pin.PULL_UP),
         miso = Pin(device_config['miso'], Pin.IN, Pin.PULL_UP))
 
-# Initiating lora device connected to SPI0
-lora = SX127x(device_spi, pins=device_config, lora_parameters=lora_parameters, ttn_config=ttn_config)
+# Initiating lora device connected to SPI0; only the radio worker has
+# queued uplinks to preload, so the FIFO is split for it alone
+lora = SX127x(device_spi, pins=device_config, lora_parameters=lora_parameters, ttn_config=ttn_config,
+        register_shadow=True, leds=leds, warm_start=True, adr=app_config['adr'],
+        listen_before_talk=app_config['listen_before_talk'], pipelined_tx=app_config['radio_worker'])
 frame_counter = load_frame_counter()
 
-# lora callback function
-def on_receive(lora, outgoing):
-    payload = lora.read_payload()
-    print(payload)
-
-lora.on_receive(on_receive)
-lora.receive()
+# Optional radio worker: uplinks are sent from core 1, results come back as events
+worker = None
+if app_config['radio_worker']:
+    worker = RadioWorker(lora)
+    worker.start()
+event_buf = bytearray(255)
+
+def print_radio_events():
+    event = worker.poll(event_buf)
+    while event:
+        kind, length, arg = event
+        if kind == EVT_SENT:
+            print("Uplink {} sent".format(arg))
+        elif kind == EVT_UNACKED:
+            print("Uplink {} not acknowledged".format(arg))
+        elif kind == EVT_DOWNLINK:
+            print("Downlink on port {}: {}".format(arg, bytes(event_buf[:length])))
+        else:
+            print("Radio error: {}".format(bytes(event_buf[:length])))
+        event = worker.poll(event_buf)
 
 # Soil sensor reading function
 def read_moisture():
@@ -85,8 +108,8 @@ def main():
         if moisture < pump_on_threshold:
             initial_moisture = moisture
             pump.value(1)  # Turn on the pump
-            irrigON.value(1) # Turning on irrigation indicator LED
-            moistureOK.value(0) # Turning off moisture ok indicator LED
+            leds.set('irrigation', 1) # Turning on irrigation indicator LED
+            leds.set('moisture', 0) # Turning off moisture ok indicator LED
             start_time = utime.time() #Starting pump timer
             print("Pump turned on.")
             
@@ -98,8 +121,8 @@ def main():
                 
             # Code once while loop becomes false
             pump.value(0)  # Turn off the pump
-            irrigON.value(0) # Turning off irrigation indicator LED
-            moistureOK.value(1) # Turning on moisture ok indicator LED
+            leds.set('irrigation', 0) # Turning off irrigation indicator LED
+            leds.set('moisture', 1) # Turning on moisture ok indicator LED
             pump_duration = utime.time() - start_time  # Duration in seconds
             final_moisture = moisture # Setting final sensor reading value
             print("Pump turned off.")
@@ -126,15 +149,36 @@ def main():
             payload = struct.pack('@ffff', initial_moisture, pump_duration, water_used, final_moisture)
             print(payload)
 
-            # Send data over LoRa
-            lora.send_data(data=payload, data_length=len(payload), frame_counter=frame_counter)
-            lora.receive()
+            if worker:
+                # core 1 waits for the duty cycle, sends and listens
+                worker.send(payload, frame_counter, confirmed=app_config['confirmed_uplinks'])
+            elif app_config['confirmed_uplinks']:
+                # Confirmed uplink, retransmitted until the network acknowledges it
+                utime.sleep_ms(lora.send_delay_ms())
+                status = lora.send_confirmed(payload, len(payload), frame_counter)
+                if status != UPLINK_ACKED:
+                    print("Uplink {} not acknowledged, report lost".format(frame_counter))
+                downlink = lora.last_downlink
+                if downlink:
+                    print(bytes(downlink))
+            else:
+                # Send data over LoRa, once the duty cycle allows it
+                utime.sleep_ms(lora.send_delay_ms())
+                lora.send_data(data=payload, data_length=len(payload), frame_counter=frame_counter)
+
+                # Class A: listen in the RX1/RX2 windows, the radio sleeps afterwards
+                downlink = lora.receive_windows()
+                if downlink:
+                    print(bytes(downlink))
+                    print("RSSI {} dBm, SNR {} dB".format(lora.last_rssi, lora.last_snr))
                     
             # Incrimenting frame counter
             frame_counter += 1
             # Saving last frame counter for future use even with device shutdown
             save_frame_counter(frame_counter)
 
+        if worker:
+            print_radio_events()
         utime.sleep(read_delay)
 
 # Initialising main function to loop indefinitely
@@ -0,0 +1,200 @@
+import _thread
+import utime
+from sx127x import MAX_PKT_LENGTH, TX_WAIT_LIGHTSLEEP, UPLINK_ACKED
+
+# commands, application -> worker
+CMD_SEND = 1
+CMD_STOP = 2
+CMD_SEND_CONFIRMED = 3
+# events, worker -> application
+EVT_SENT = 1      # arg: frame counter
+EVT_DOWNLINK = 2  # data: decrypted FRMPayload, arg: FPort
+EVT_ERROR = 3     # data: error message, arg: frame counter
+EVT_UNACKED = 4   # confirmed uplink without ACK, arg: frame counter
+
+# worker loop period while there is nothing to do
+WORKER_IDLE_MS = 5
+
+
+class FixedQueue:
+    """ Lock-protected queue of fixed-size slots, safe between the cores.
+
+        Slots are preallocated; put() copies the data in and get() copies
+        it out, so neither side holds on to a buffer the other is writing.
+    """
+    def __init__(self, slots=4, slot_size=MAX_PKT_LENGTH):
+        self._lock = _thread.allocate_lock()
+        self._slots = slots
+        self._slot_size = slot_size
+        self._data = [bytearray(slot_size) for _ in range(slots)]
+        self._kind = bytearray(slots)
+        self._length = bytearray(slots)
+        self._arg = [0] * slots
+        self._head = 0
+        self._count = 0
+        self.dropped = 0  # put() on a full queue
+
+    def __len__(self):
+        return self._count
+
+    def put(self, kind, data=b'', arg=0):
+        """ Queues a message, False (and counted in dropped) when full.
+        """
+        n = min(len(data), self._slot_size)
+        with self._lock:
+            if self._count == self._slots:
+                self.dropped += 1
+                return False
+            i = (self._head + self._count) % self._slots
+            slot = self._data[i]
+            for j in range(n):
+                slot[j] = data[j]
+            self._kind[i] = kind
+            self._length[i] = n
+            self._arg[i] = arg
+            self._count += 1
+        return True
+
+    def peek(self, buffer):
+        """ Like get(), but the message stays queued.
+        """
+        with self._lock:
+            if not self._count:
+                return None
+            i = self._head
+            n = self._length[i]
+            slot = self._data[i]
+            for j in range(n):
+                buffer[j] = slot[j]
+            return (self._kind[i], n, self._arg[i])
+
+    def get(self, buffer):
+        """ Copies the oldest message into buffer and returns
+            (kind, length, arg), None when empty.
+        """
+        with self._lock:
+            if not self._count:
+                return None
+            i = self._head
+            n = self._length[i]
+            slot = self._data[i]
+            for j in range(n):
+                buffer[j] = slot[j]
+            message = (self._kind[i], n, self._arg[i])
+            self._head = (i + 1) % self._slots
+            self._count -= 1
+        return message
+
+
+class RadioWorker:
+    """ Runs the radio stack on the RP2040's second core.
+
+        The application queues payloads with send() and collects results
+        with poll(); building, encrypting and sending the uplink, the duty
+        cycle wait and the Class A receive windows all happen on core 1,
+        so the control loop on core 0 keeps its cadence. Once started the
+        driver belongs to the worker: do not call it from core 0 and do
+        not register on_receive.
+
+        With a pipelined_tx driver the next queued uplink is preloaded
+        into the FIFO while the current one waits for its receive windows,
+        so back-to-back reports go out with a single mode write.
+    """
+    def __init__(self, lora, queue_slots=4):
+        if lora._tx_wait == TX_WAIT_LIGHTSLEEP:
+            raise ValueError("RadioWorker cannot lightsleep core 1.")
+        self.lora = lora
+        self.commands = FixedQueue(queue_slots)
+        self.events = FixedQueue(queue_slots)
+        self._command_buf = bytearray(MAX_PKT_LENGTH)
+        self._next_buf = bytearray(MAX_PKT_LENGTH)
+        self._running = False
+
+    def start(self):
+        self._running = True
+        _thread.start_new_thread(self._run, ())
+
+    def stop(self):
+        self.commands.put(CMD_STOP)
+
+    @property
+    def running(self):
+        return self._running
+
+    def send(self, data, frame_counter, confirmed=False):
+        """ Queues an uplink, False when the command queue is full.
+            A confirmed uplink reports EVT_SENT once acknowledged and
+            EVT_UNACKED when the retransmissions are spent.
+        """
+        kind = CMD_SEND_CONFIRMED if confirmed else CMD_SEND
+        return self.commands.put(kind, data, frame_counter)
+
+    def poll(self, buffer):
+        """ Next event as (kind, length, arg) with its data copied into
+            buffer, None when there is none.
+        """
+        return self.events.get(buffer)
+
+    def _run(self):
+        buf = self._command_buf
+        while True:
+            command = self.commands.get(buf)
+            if command is None:
+                utime.sleep_ms(WORKER_IDLE_MS)
+                continue
+
+            kind, length, frame_counter = command
+            if kind == CMD_STOP:
+                break
+            if kind == CMD_SEND:
+                self._send(buf, length, frame_counter)
+            elif kind == CMD_SEND_CONFIRMED:
+                self._send_confirmed(buf, length, frame_counter)
+
+        self._running = False
+
+    def _send(self, data, length, frame_counter):
+        lora = self.lora
+        try:
+            utime.sleep_ms(lora.send_delay_ms())
+            if lora.preloaded == frame_counter:
+                lora.send_preloaded()
+            else:
+                lora.send_data(data, length, frame_counter)
+            self.events.put(EVT_SENT, b'', frame_counter)
+            self._preload_next()
+
+            downlink = lora.receive_windows()
+            if downlink is not None:
+                self.events.put(EVT_DOWNLINK, downlink, lora.last_fport or 0)
+        except (RuntimeError, ValueError) as e:
+            self.events.put(EVT_ERROR, str(e).encode(), frame_counter)
+
+    def _preload_next(self):
+        # radio idle until RX1: load the next unconfirmed uplink
+        if not self.lora._pipelined:
+            return
+        command = self.commands.peek(self._next_buf)
+        if command is None or command[0] != CMD_SEND:
+            return
+        _, length, frame_counter = command
+        try:
+            self.lora.preload(self._next_buf, length, frame_counter)
+        except ValueError:
+            pass  # too long for the TX half, sent the normal way
+
+    def _send_confirmed(self, data, length, frame_counter):
+        lora = self.lora
+        try:
+            utime.sleep_ms(lora.send_delay_ms())
+            status = lora.send_confirmed(data, length, frame_counter)
+            if status == UPLINK_ACKED:
+                self.events.put(EVT_SENT, b'', frame_counter)
+            else:
+                self.events.put(EVT_UNACKED, b'', frame_counter)
+
+            downlink = lora.last_downlink
+            if downlink is not None:
+                self.events.put(EVT_DOWNLINK, downlink, lora.last_fport or 0)
+        except (RuntimeError, ValueError) as e:
+            self.events.put(EVT_ERROR, str(e).encode(), frame_counter)
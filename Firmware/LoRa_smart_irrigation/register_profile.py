@@ -0,0 +1,27 @@
+class RegisterProfile:
+    """ Compiled register image: the value of every register a
+        configuration sets, plus the driver state that goes with it.
+
+        Built by SX127x.compile_profile() and applied with
+        SX127x.apply_profile().
+    """
+    def __init__(self, name=None):
+        self.name = name
+        self.mask = bytearray(128)    # 1 for each register in the profile
+        self.values = bytearray(128)
+        self.state = ()               # (attribute, value) pairs
+        self.first = 0
+        self.last = -1
+
+    def __len__(self):
+        return sum(self.mask)
+
+    def finish(self):
+        """ Bounds of the register range, called once compiled.
+        """
+        self.first = 128
+        self.last = -1
+        for i in range(128):
+            if self.mask[i]:
+                self.first = min(self.first, i)
+                self.last = i
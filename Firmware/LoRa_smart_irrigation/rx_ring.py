@@ -0,0 +1,58 @@
+class RxRing:
+    """ Fixed-slot ring buffer for received packets.
+
+        All storage is allocated up front so the receive interrupt can
+        claim a slot, fill it and commit it without touching the heap.
+        One producer (the IRQ) and one consumer (poll) only: the producer
+        only advances _written and the consumer only _read, so neither
+        side needs to disable interrupts.
+    """
+    def __init__(self, slots=4, slot_size=255):
+        self._slots = slots
+        self._slot_size = slot_size
+        self._data = bytearray(slots * slot_size)
+        view = memoryview(self._data)
+        # one view per slot, slicing in the IRQ would allocate
+        self._slot_views = [
+            view[i * slot_size:(i + 1) * slot_size] for i in range(slots)
+        ]
+        self._length = bytearray(slots)
+        # raw PktRssiValue / PktSnrValue per slot
+        self.rssi = bytearray(slots)
+        self.snr = bytearray(slots)
+        self._written = 0  # packets committed, producer side
+        self._read = 0  # packets released, consumer side
+
+    def __len__(self):
+        return self._written - self._read
+
+    def slot(self):
+        """ Free slot to fill, None when the ring is full.
+        """
+        if self._written - self._read == self._slots:
+            return None
+        return self._slot_views[self._written % self._slots]
+
+    def commit(self, length, rssi=0, snr=0):
+        """ Publishes the slot returned by slot() with its packet length.
+        """
+        head = self._written % self._slots
+        self._length[head] = length
+        self.rssi[head] = rssi
+        self.snr[head] = snr
+        self._written += 1
+
+    def peek(self):
+        """ Oldest packet as (memoryview, index), None when empty. The
+            view stays valid until release().
+        """
+        if self._written == self._read:
+            return None
+        tail = self._read % self._slots
+        return self._slot_views[tail][:self._length[tail]], tail
+
+    def release(self):
+        """ Frees the oldest slot.
+        """
+        if self._written != self._read:
+            self._read += 1
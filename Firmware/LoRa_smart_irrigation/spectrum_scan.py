@@ -0,0 +1,165 @@
+import utime
+from array import array
+from duty_cycle import frf_to_hz
+from sx127x import (
+    REG_FRF_MSB, REG_RSSI_VALUE, MODE_STDBY, MODE_RX_CONTINUOUS,
+)
+
+# after retuning: PLL lock and the first RSSI average
+SCAN_SETTLE_US = 1000
+SCAN_SAMPLES = 256
+# raw RssiValue 0..127 (-157..-30 dBm HF), stronger is clamped
+RSSI_BINS = 128
+MAX_SAMPLES = 0xFFFF  # per channel, histogram bins are 16 bit
+# above the quietest channel's floor by this much counts as busy
+BUSY_MARGIN_DB = 6
+
+
+class SpectrumScanner:
+    """ RSSI sweep over a frequency plan, to pick quiet channels and
+        gateway sites from measurements.
+
+        Each channel is tuned in standby, RX continuous started and, once
+        the RSSI has settled, RssiValue read samples times. Samples go
+        into a histogram per channel, so repeated sweeps add up without
+        using more memory. report() gives noise floor, percentiles and
+        occupancy per channel.
+
+            scanner = SpectrumScanner(lora)
+            scanner.scan(sweeps=20)
+            scanner.print_report()
+    """
+    def __init__(self, lora, frequencies=None, samples=SCAN_SAMPLES,
+                 settle_us=SCAN_SETTLE_US):
+        """ frequencies is a TTN_FREQS style dict of FRF bytes, a list
+            of FRF bytes, or None for the plan of the radio.
+        """
+        self.lora = lora
+        if frequencies is None:
+            frequencies = lora._frequencies
+        if isinstance(frequencies, dict):
+            frequencies = sorted(frequencies.items())
+        else:
+            frequencies = enumerate(frequencies)
+        self._channels = [(ch, bytes(frf)) for ch, frf in frequencies]
+        self.samples = samples
+        self.settle_us = settle_us
+        self._histograms = {}
+        self._counts = {}
+        self.reset()
+
+    def reset(self):
+        for ch, _ in self._channels:
+            self._histograms[ch] = array('H', [0] * RSSI_BINS)
+            self._counts[ch] = 0
+        self.sweeps = 0
+
+    def scan(self, sweeps=1):
+        """ Sweeps the channels sweeps times, adding to the histograms.
+            The radio is left in standby on its previous frequency.
+            Returns the time taken in ms.
+        """
+        samples = self.samples
+        for ch, _ in self._channels:
+            if self._counts[ch] + samples * sweeps > MAX_SAMPLES:
+                raise ValueError("Too many samples, reset() first.")
+
+        lora = self.lora
+        transfer = lora.transfer
+        frf_before = bytearray(3)
+        lora.read_registers(REG_FRF_MSB, frf_before)
+        lora.set_lock(True)
+        try:
+            start = utime.ticks_ms()
+            for _ in range(sweeps):
+                for ch, frf in self._channels:
+                    histogram = self._histograms[ch]
+                    lora.set_mode(MODE_STDBY)
+                    lora.write_registers(REG_FRF_MSB, frf)
+                    lora.set_mode(MODE_RX_CONTINUOUS)
+                    utime.sleep_us(self.settle_us)
+                    for _ in range(samples):
+                        # RssiValue is a status register, never shadowed
+                        value = transfer(REG_RSSI_VALUE)
+                        if value >= RSSI_BINS:
+                            value = RSSI_BINS - 1
+                        histogram[value] += 1
+                    self._counts[ch] += samples
+                self.sweeps += 1
+            elapsed = utime.ticks_diff(utime.ticks_ms(), start)
+        finally:
+            lora.standby()
+            lora.write_registers(REG_FRF_MSB, frf_before)
+            lora.set_lock(False)
+        return elapsed
+
+    def percentile(self, ch, p):
+        """ Nearest-rank percentile of the raw RssiValue of a channel,
+            p in 0..100: the lowest value with at least p% of the samples
+            at or below it.
+        """
+        count = self._counts[ch]
+        if not count:
+            return None
+        # 0-based rank, ceil(p * count / 100) - 1
+        rank = min(max(int(-(-p * count // 100)), 1), count) - 1
+        seen = 0
+        histogram = self._histograms[ch]
+        for value in range(RSSI_BINS):
+            seen += histogram[value]
+            if seen > rank:
+                return value
+
+    def occupancy(self, ch, threshold):
+        """ Percentage of samples at or above the raw RssiValue threshold.
+        """
+        count = self._counts[ch]
+        if not count:
+            return None
+        histogram = self._histograms[ch]
+        busy = 0
+        for value in range(max(threshold, 0), RSSI_BINS):
+            busy += histogram[value]
+        return busy * 100 / count
+
+    def report(self, margin_db=BUSY_MARGIN_DB):
+        """ One tuple per scanned channel: (channel, frequency in Hz,
+            noise floor, median, 90th percentile, max in dBm, occupancy
+            in %). The noise floor is the 10th percentile; samples
+            margin_db above the quietest channel's floor count as busy.
+        """
+        offset = self.lora._rssi_offset
+        scanned = [ch for ch, _ in self._channels if self._counts[ch]]
+        if not scanned:
+            return []
+        floors = {ch: self.percentile(ch, 10) for ch in scanned}
+        threshold = min(floors.values()) + margin_db
+
+        report = []
+        for ch, frf in self._channels:
+            if ch not in floors:
+                continue
+            report.append((
+                ch, frf_to_hz(frf),
+                floors[ch] - offset,
+                self.percentile(ch, 50) - offset,
+                self.percentile(ch, 90) - offset,
+                self.percentile(ch, 100) - offset,
+                self.occupancy(ch, threshold),
+            ))
+        return report
+
+    def quietest(self, n=1, margin_db=BUSY_MARGIN_DB):
+        """ The n channels with the lowest occupancy, ties broken on the
+            90th percentile.
+        """
+        ranked = sorted(self.report(margin_db), key=lambda r: (r[6], r[4]))
+        return [r[0] for r in ranked[:n]]
+
+    def print_report(self, margin_db=BUSY_MARGIN_DB):
+        print("{} sweeps, {} samples per channel and sweep".format(
+            self.sweeps, self.samples))
+        print(" ch      MHz  floor    p50    p90    max  busy%")
+        for ch, hz, floor, p50, p90, peak, busy in self.report(margin_db):
+            print("{:3d} {:8.3f} {:6d} {:6d} {:6d} {:6d} {:6.1f}".format(
+                ch, hz / 1000000, floor, p50, p90, peak, busy))
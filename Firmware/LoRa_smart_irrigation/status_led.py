@@ -0,0 +1,81 @@
+from machine import Timer
+
+class StatusLEDs:
+    """ Timer driven status and blink indicators.
+
+        LEDs are registered by name. set() drives a steady status LED,
+        blink() queues a pattern that is played back from a periodic
+        machine.Timer, so callers never sleep for an indicator.
+        With enabled=False every call is a no-op and the LEDs stay off.
+    """
+    def __init__(self, enabled=True, period_ms=50):
+        self.enabled = enabled
+        self._period_ms = period_ms
+        self._timer = None
+        self._running = False
+        # name -> [pin, ticks left in phase, phases left, on ticks, off ticks]
+        self._leds = {}
+
+    def add(self, name, pin):
+        self._leds[name] = [pin, 0, 0, 0, 0]
+        pin.value(False)
+
+    def set(self, name, value):
+        if not self.enabled or name not in self._leds:
+            return
+        led = self._leds[name]
+        led[2] = 0      # a steady state cancels a running pattern
+        led[0].value(value)
+
+    def blink(self, name, times=1, on_ms=100, off_ms=100):
+        if not self.enabled or name not in self._leds:
+            return
+        led = self._leds[name]
+        led[3] = max(on_ms // self._period_ms, 1)
+        led[4] = max(off_ms // self._period_ms, 1)
+        led[1] = led[3]
+        led[2] = 2 * times
+        led[0].value(True)
+        self._start()
+
+    def off(self):
+        """ Stops all patterns and switches every LED off.
+        """
+        self._stop()
+        for name in self._leds:
+            self._leds[name][2] = 0
+            self._leds[name][0].value(False)
+
+    def _start(self):
+        if self._running:
+            return
+        if self._timer is None:
+            self._timer = Timer(-1)
+        self._timer.init(
+            mode=Timer.PERIODIC, period=self._period_ms, callback=self._tick
+        )
+        self._running = True
+
+    def _stop(self):
+        if self._running:
+            self._timer.deinit()
+            self._running = False
+
+    def _tick(self, timer):
+        active = False
+        for name in self._leds:
+            led = self._leds[name]
+            if led[2] == 0:
+                continue
+            led[1] -= 1
+            if led[1] <= 0:
+                led[2] -= 1
+                if led[2] % 2:      # on phase over, switch off
+                    led[0].value(False)
+                    led[1] = led[4]
+                elif led[2]:        # off phase over, next blink
+                    led[0].value(True)
+                    led[1] = led[3]
+            active = active or led[2] > 0
+        if not active:
+            self._stop()
@@ -0,0 +1,27 @@
+from sx127x import TTN, SX127x
+from machine import Pin, SPI
+from spectrum_scan import SpectrumScanner
+from config import *
+
+# Site survey: RSSI sweep of the frequency plan, noise floor and
+# occupancy per channel, to pick quiet channels and gateway sites.
+
+sweeps = 50  # 50 x 8 channels x 256 samples, a few seconds on EU868
+
+# Setting server access configurations
+ttn_config = TTN(ttn_config['devaddr'], ttn_config['nwkey'], ttn_config['app'], country=ttn_config['country'])
+
+# Initiating SPI pins
+device_spi = SPI(device_config['spi_unit'], baudrate = 10000000,
+        polarity = 0, phase = 0, bits = 8, firstbit = SPI.MSB,
+        sck = Pin(device_config['sck'], Pin.OUT, Pin.PULL_DOWN),
+        mosi = Pin(device_config['mosi'], Pin.OUT, Pin.PULL_UP),
+        miso = Pin(device_config['miso'], Pin.IN, Pin.PULL_UP))
+
+lora = SX127x(device_spi, pins=device_config, lora_parameters=lora_parameters, ttn_config=ttn_config)
+
+scanner = SpectrumScanner(lora)
+elapsed_ms = scanner.scan(sweeps)
+scanner.print_report()
+print("Sweep took {} ms, quietest channels: {}".format(
+    elapsed_ms, scanner.quietest(3)))
@@ -1,6 +1,13 @@
 import utime
-from machine import SPI, Pin
-from encryption_aes import AES
+from machine import SPI, Pin, idle, lightsleep
+from encryption_aes import SessionCrypto
+from status_led import StatusLEDs
+from duty_cycle import DutyCycle, frf_to_hz
+from adr import ADR, ADR_DATA_RATES
+from rx_ring import RxRing
+from link_stats import RollingStats
+from register_profile import RegisterProfile
+from micropython import schedule
 import gc
 import urandom
 import ubinascii
@@ -15,6 +22,8 @@ REG_FRF_MSB = 0x06
 REG_FRF_MID = 0x07
 REG_FRF_LSB = 0x08
 REG_PA_CONFIG = 0x09
+REG_PA_RAMP = 0x0A
+REG_OCP = 0x0B
 REG_LNA = 0x0C
 REG_FIFO_ADDR_PTR = 0x0D
 
@@ -28,8 +37,9 @@ REG_FIFO_RX_CURRENT_ADDR = 0x10
 REG_IRQ_FLAGS_MASK = 0x11
 REG_IRQ_FLAGS = 0x12
 REG_RX_NB_BYTES = 0x13
+REG_PKT_SNR_VALUE = 0x19
 REG_PKT_RSSI_VALUE = 0x1A
-REG_PKT_SNR_VALUE = 0x1B
+REG_RSSI_VALUE = 0x1B
 
 REG_FEI_MSB = 0x1D
 REG_FEI_LSB = 0x1E
@@ -39,13 +49,18 @@ REG_PREAMBLE_DETECT = 0x1F
 REG_PREAMBLE_MSB = 0x20
 REG_PREAMBLE_LSB = 0x21
 REG_PAYLOAD_LENGTH = 0x22
+REG_MAX_PAYLOAD_LENGTH = 0x23
+REG_HOP_PERIOD = 0x24
+REG_HOP_CHANNEL = 0x1C
 REG_FIFO_RX_BYTE_ADDR = 0x25
+REG_PPM_CORRECTION = 0x27
 
 REG_RSSI_WIDEBAND = 0x2C
 REG_DETECTION_OPTIMIZE = 0x31
 REG_DETECTION_THRESHOLD = 0x37
 REG_SYNC_WORD = 0x39
 REG_DIO_MAPPING_1 = 0x40
+REG_DIO_MAPPING_2 = 0x41
 REG_VERSION = 0x42
 
 # invert IQ
@@ -68,11 +83,54 @@ MODE_STDBY = 0x01
 MODE_TX = 0x03
 MODE_RX_CONTINUOUS = 0x05
 MODE_RX_SINGLE = 0x06
+MODE_CAD = 0x07
+
+# time given to the radio to settle after a mode change
+MODE_SETTLE_MS = 10
+
+# reset timing (datasheet 7.2.2: NRESET low > 100 us, ready 5 ms later)
+RESET_PULSE_MS = 1
+RESET_READY_MS = 6
+VERSION_RETRY_MS = 10
 
 # PA config
 PA_BOOST = 0x80
 
+# DIO0 mapping (REG_DIO_MAPPING_1 bits 7-6), DIO1 bits 5-4 (00: RxTimeout)
+DIO0_RX_DONE = 0x00
+DIO0_TX_DONE = 0x40
+DIO0_CAD_DONE = 0x80
+DIO1_CAD_DETECTED = 0x20
+
+# LoRaWAN Class A receive windows (EU868 defaults, RX2 as used by TTN)
+RECEIVE_DELAY1_MS = 1000
+RECEIVE_DELAY2_MS = 2000
+RX2_FREQUENCY = b'\xd9\x61\x9a'  # 869.525 MHz
+RX2_DATA_RATE = 'SF9BW125'
+# the window is opened early by the margin, the symbol timeout covers it
+RX_WINDOW_MARGIN_MS = 20
+RX_MIN_SYMBOLS = 6
+# upper bound for a window once a preamble was detected
+RX_WINDOW_MAX_MS = 3000
+RX_POLL_MS = 2
+
+# TX completion: busy-poll REG_IRQ_FLAGS or sleep until DIO0 fires
+TX_WAIT_POLL = 'poll'
+TX_WAIT_IDLE = 'idle'
+TX_WAIT_LIGHTSLEEP = 'lightsleep'
+TX_SLEEP_SLICE_MS = 10
+
+# listen-before-talk: CAD before each uplink, random backoff while busy
+CAD_RETRIES = 4
+CAD_BACKOFF_MS = 100  # backoff window, doubles with every busy attempt
+# CAD takes about two symbols, give up on CadDone after CAD_TIMEOUT_SYMBOLS
+CAD_SYMBOLS = 2
+CAD_TIMEOUT_SYMBOLS = 8
+
 # IRQ masks
+IRQ_CAD_DETECTED_MASK = 0x01
+IRQ_FHSS_CHANGE_CHANNEL_MASK = 0x02
+IRQ_CAD_DONE_MASK = 0x04
 IRQ_TX_DONE_MASK = 0x08
 IRQ_PAYLOAD_CRC_ERROR_MASK = 0x20
 IRQ_RX_DONE_MASK = 0x40
@@ -81,6 +139,87 @@ IRQ_RX_TIME_OUT_MASK = 0x80
 # Buffer size
 MAX_PKT_LENGTH = 255
 
+# FHSS: FhssPresentChannel in RegHopChannel, HopPeriod is 8 bits
+HOP_CHANNEL_MASK = 0x3F
+MAX_HOP_PERIOD = 255
+
+# pipelined TX: the FIFO split in a TX and an RX half; MaxPayloadLength
+# caps downlinks to the RX half so they cannot spill over the uplink
+# preloaded in the TX half
+PIPELINED_TX_BASE = 0x00
+PIPELINED_RX_BASE = 0x80
+PIPELINED_REGION = 0x80
+
+# packet RSSI offset (SX1276 datasheet 5.5.5), HF port above the mid band
+RSSI_OFFSET_HF = 157
+RSSI_OFFSET_LF = 164
+RF_MID_BAND_THRESH = 525000000
+# count, RSSI min/mean/p10 (-dBm), SNR min/mean/p10 (0.25 dB, signed)
+LINK_REPORT_LENGTH = 7
+
+# LoRaWAN data downlinks: MHDR MType, MHDR + FHDR + MIC at least
+MHDR_MTYPE_MASK = 0xE0
+MTYPE_UNCONFIRMED_DATA_DOWN = 0x60
+MTYPE_CONFIRMED_DATA_DOWN = 0xA0
+MIN_DOWNLINK_LENGTH = 12
+# FCntDown may skip at most this many frames (LoRaWAN 1.0 MAX_FCNT_GAP)
+MAX_FCNT_GAP = 16384
+
+# LoRaWAN data uplinks: MHDR MType; FCtrl ACK, set in a downlink that
+# acknowledges our confirmed uplink and in an uplink that acknowledges
+# a confirmed downlink
+MTYPE_UNCONFIRMED_DATA_UP = 0x40
+MTYPE_CONFIRMED_DATA_UP = 0x80
+FCTRL_ACK = 0x20
+# confirmed uplinks: at most CONFIRMED_TRANSMISSIONS of the same frame,
+# one DR lower after every DR_STEP_TRANSMISSIONS without ACK, retry once
+# ACK_TIMEOUT_MS +- ACK_TIMEOUT_JITTER_MS passed
+CONFIRMED_TRANSMISSIONS = 8
+DR_STEP_TRANSMISSIONS = 2
+ACK_TIMEOUT_MS = 2000
+ACK_TIMEOUT_JITTER_MS = 1000
+# outcome of an uplink, the last UPLINK_HISTORY are kept
+UPLINK_SENT = 'sent'  # unconfirmed
+UPLINK_ACKED = 'acked'
+UPLINK_UNACKED = 'unacked'  # retransmission budget spent
+UPLINK_FAILED = 'failed'  # radio error
+UPLINK_HISTORY = 8
+
+# GC policies: never collect, let MicroPython collect past a threshold
+# of allocated bytes, or run a full collection every N packets
+GC_NEVER = 'never'
+GC_THRESHOLD = 'threshold'
+GC_AFTER_PACKETS = 'packets'
+
+# Configuration registers that only change when written by the driver,
+# these can be served from the register shadow. Status registers, the
+# FIFO pointers and REG_OP_MODE are changed by the chip itself.
+SHADOW_REGISTERS = (
+    REG_FRF_MSB, REG_FRF_MID, REG_FRF_LSB,
+    REG_PA_CONFIG, REG_PA_RAMP, REG_OCP, REG_LNA,
+    REG_FIFO_TX_BASE_ADDR, REG_FIFO_RX_BASE_ADDR, REG_IRQ_FLAGS_MASK,
+    REG_FEI_MSB, REG_FEI_LSB, REG_PREAMBLE_DETECT,
+    REG_PREAMBLE_MSB, REG_PREAMBLE_LSB, REG_PAYLOAD_LENGTH,
+    REG_MAX_PAYLOAD_LENGTH, REG_HOP_PERIOD,
+    REG_MODEM_CONFIG, REG_PPM_CORRECTION,
+    REG_DETECTION_OPTIMIZE, REG_INVERTIQ, REG_DETECTION_THRESHOLD,
+    REG_SYNC_WORD, REG_INVERTIQ2, REG_DIO_MAPPING_1, REG_DIO_MAPPING_2,
+)
+SHADOW_MAP = bytearray(128)
+for _reg in SHADOW_REGISTERS:
+    SHADOW_MAP[_reg] = 1
+
+# driver state carried by a register profile, per register that sets it
+PROFILE_STATE = (
+    (REG_FEI_MSB, ('_data_rate', '_bw', '_coding_rate', '_implicit_header_mode')),
+    (REG_FEI_LSB, ('_sf', '_crc')),
+    (REG_PREAMBLE_MSB, ('_preamble_length',)),
+    (REG_PA_CONFIG, ('_tx_power_level',)),
+)
+# registers left unchanged between two runs that are cheaper to rewrite
+# than to split the burst
+PROFILE_MERGE_GAP = 2
+
 __DEBUG__ = True
 
 class TTN:
@@ -146,29 +285,151 @@ class SX127x:
                  ttn_config, 
                  channel=0,  # compatibility with Dragino LG02, set to None otherwise
                  fport=1,
-                 lora_parameters=_default_parameters):
+                 lora_parameters=_default_parameters,
+                 burst_fifo=True,
+                 register_shadow=False,
+                 tx_wait=TX_WAIT_IDLE,
+                 leds=None,
+                 gc_policy=GC_AFTER_PACKETS,
+                 gc_interval=1,
+                 gc_threshold=8192,
+                 warm_start=False,
+                 duty_cycle=True,
+                 adr=False,
+                 listen_before_talk=False,
+                 cad_retries=CAD_RETRIES,
+                 rx_slots=4,
+                 link_window=16,
+                 confirmed_transmissions=CONFIRMED_TRANSMISSIONS,
+                 pipelined_tx=False,
+                 debug=__DEBUG__):
         
         self._spi = spi
         self._pins = pins
-        self._parameters = lora_parameters
+        # own copy, invert_IQ() writes to it and the dict may be shared
+        self._parameters = dict(lora_parameters)
         self._lock = False
+        self._debug = debug
+
+        # load/drain the FIFO in a single SPI transaction per packet
+        self.burst_fifo = burst_fifo
+        # number of chip-select cycles issued on the SPI bus
+        self.spi_transactions = 0
+
+        # preallocated SPI buffers: [address, value] for single register
+        # access, address byte for bursts, scratch for register pairs
+        self._tx_buf = bytearray(2)
+        self._rx_buf = bytearray(2)
+        self._addr_buf = bytearray(1)
+        self._reg_pair = bytearray(2)
+
+        # write-through shadow of the configuration registers
+        self._register_shadow = register_shadow
+        self._shadow_enabled = False
+        self._shadow = bytearray(128)
+        self._shadow_valid = bytearray(128)
+        # staged configuration, see begin_config/commit_config
+        self._staging = False
+        self._chip_image = bytearray(128)
+        # register profiles, see compile_profile/apply_profile
+        self._recording = None
+        self._profile_buf = bytearray(128)
+        self._profiles = {}
+        self.shadow_reads_saved = 0
+        self.shadow_writes_saved = 0
+
+        # TX completion, REG_IRQ_FLAGS reads avoided by waiting on DIO0
+        self._tx_wait = tx_wait
+        self._tx_pending = False
+        self._tx_done = False
+        self._tx_done_ms = 0
+        self.tx_polls_saved = 0
+
+        # Class A receive windows
+        self._rx_window = False
+        self._rx_done = False
+        self._downlink_buf = bytearray(MAX_PKT_LENGTH)
+        self.last_rx_window = 0
+
+        # packets received in the IRQ, handed to on_receive by poll()
+        self._rx_ring = RxRing(rx_slots, MAX_PKT_LENGTH)
+        self._schedule_poll = True
+        self._rx_lorawan = True
+        self._poll_scheduled = False
+        # bound once, binding in the IRQ would allocate
+        self._poll_ref = self._scheduled_poll
+        self.rx_packets = 0
+        self.rx_dropped = 0  # CRC errors
+        self.rx_overflows = 0  # ring full
+        self.rx_foreign = 0  # not a data downlink for this DevAddr
+        self.rx_replayed = 0  # FCntDown not increasing
+        self.rx_bad_mic = 0
+        self._rx_payload = bytearray(MAX_PKT_LENGTH)
+        self.frame_counter_down = -1
+        self.last_fport = None
+        self.downlink_confirmed = False
+        self.downlink_ack = False
+        self.last_downlink = None
+        # ACK owed to a confirmed downlink, sent with the next uplink
+        self._ack_pending = False
+
+        # confirmed uplinks, outcome per message as (FCnt, status,
+        # transmissions), oldest first
+        self._confirmed_transmissions = confirmed_transmissions
+        self.uplink_outcomes = []
+        self.uplinks_acked = 0
+        self.uplinks_unacked = 0
+        self.retransmissions = 0
+
+        # link quality of the authenticated downlinks
+        self.last_rssi = None
+        self.last_snr = None
+        self.rssi_stats = RollingStats(link_window)
+        self.snr_stats = RollingStats(link_window)
+        self._link_report = bytearray(LINK_REPORT_LENGTH)
+
+        # listen-before-talk, CAD checks and busy results per channel
+        self._listen_before_talk = listen_before_talk
+        self._cad_retries = cad_retries
+        self._cad_pending = False
+        self.cad_checks = {}
+        self.cad_busy = {}
+
+        # garbage collection policy for the send/receive paths
+        self._gc_policy = gc_policy
+        self._gc_interval = gc_interval
+        self._gc_packets = 0
+        self.last_send_alloc = 0
+        if gc_policy == GC_THRESHOLD:
+            gc.threshold(gc_threshold)
 
         # setting pins
+        self._pin_rx_done = None
+        self._on_receive = None
         if "dio_0" in self._pins:
             self._pin_rx_done = Pin(self._pins["dio_0"], Pin.IN)
             self._irq = Pin(self._pins["dio_0"], Pin.IN)
         if "ss" in self._pins:
             self._pin_ss = Pin(self._pins["ss"], Pin.OUT)
+        # status LED blinks are played back by a timer, never inline
+        self._leds = leds if leds is not None else StatusLEDs()
+        self._led_status = None
         if "led" in self._pins:
             self._led_status = Pin(self._pins["led"], Pin.OUT)
+            self._leds.add("radio", self._led_status)
         if "reset" in self._pins:
             self._reset = Pin(self._pins["reset"], Pin.OUT)
 
-
-        self._reset.value(False)
-        utime.sleep(1)
-        self._reset.value(True)
-        utime.sleep(1)
+        # warm restart: after a soft reset or deep-sleep wake the radio may
+        # still be powered and in LoRa mode, no need to reset it then
+        self.warm_started = False
+        if warm_start:
+            self.warm_started = (
+                self.read_register(REG_VERSION) == 0x12 and
+                self.read_register(REG_OP_MODE) & MODE_LONG_RANGE_MODE != 0
+            )
+        if not self.warm_started:
+            self.reset()
 
         # check hardware version
         init_try = True
@@ -177,17 +438,38 @@ class SX127x:
             version = self.read_register(REG_VERSION)
             re_try = re_try + 1
             
-            if __DEBUG__:
+            if self._debug:
                 print("SX version: {}".format(version))
 
             if version == 0x12:
                 init_try = False
             else:
-                utime.sleep_ms(1000)
+                utime.sleep_ms(VERSION_RETRY_MS)
 
         if version != 0x12:
             raise Exception('Invalid version.')
 
+        # cost of one REG_IRQ_FLAGS poll, to account for polls saved
+        start = utime.ticks_us()
+        self.read_register(REG_IRQ_FLAGS)
+        self._poll_us = max(utime.ticks_diff(utime.ticks_us(), start), 1)
+
+        self._pin_rx_timeout = None
+        if "dio_1" in self._pins:
+            self._pin_rx_timeout = Pin(self._pins["dio_1"], Pin.IN)
+
+        # DIO2 is FhssChangeChannel in every LoRa mapping
+        self._pin_fhss = None
+        if "dio_2" in self._pins:
+            self._pin_fhss = Pin(self._pins["dio_2"], Pin.IN)
+        self._hop_frf = None
+        self.hops = 0
+
+        if self._pin_rx_done:
+            self._pin_rx_done.irq(
+                trigger=Pin.IRQ_RISING, handler = self._handle_dio0
+            )
+
         # Set frequency registers
         self._rfm_msb = None
         self._rfm_mid = None
@@ -200,6 +482,12 @@ class SX127x:
         self._sf = None
         self._bw = None
         self._modemcfg = None
+        # packet format, for time-on-air
+        self._coding_rate = 1
+        self._preamble_length = 8
+        self._crc = False
+        self._implicit_header_mode = False
+        self._tx_length = 0
 
         # ttn configuration
         if "US" in ttn_config.country:
@@ -216,11 +504,75 @@ class SX127x:
             self._frequencies = TTN_FREQS
         else:
             raise TypeError("Country Code Incorrect/Unsupported")
+        # FRF MSB/MID/LSB per channel, ready for a single burst write
+        self._frf = {}
+        for ch in self._frequencies:
+            self._frf[ch] = bytes(self._frequencies[ch])
+            self.cad_checks[ch] = 0
+            self.cad_busy[ch] = 0
+        # every channel plan sits in one band, the lowest channel stands
+        # for all of them
+        if frf_to_hz(self._frf[min(self._frf)]) > RF_MID_BAND_THRESH:
+            self._rssi_offset = RSSI_OFFSET_HF
+        else:
+            self._rssi_offset = RSSI_OFFSET_LF
+
+        # EU868 duty cycle: airtime ledger per sub-band, radios in the
+        # same device may share one by passing the same DutyCycle
+        self._duty_cycle = None
+        self._channel_sub_band = {}
+        if duty_cycle and ttn_config.country == "EU":
+            if isinstance(duty_cycle, DutyCycle):
+                self._duty_cycle = duty_cycle
+            else:
+                self._duty_cycle = DutyCycle()
+            for ch in self._frf:
+                self._channel_sub_band[ch] = self._duty_cycle.sub_band(
+                    frf_to_hz(self._frf[ch])
+                )
         # Give the uLoRa object ttn configuration
         self._ttn_config = ttn_config
 
-        # put in LoRa and sleep mode
-        self.sleep()
+        # uplink pipeline buffers, reused for every packet
+        self._pkt_buf = bytearray(MAX_PKT_LENGTH)
+        # MAC command answers piggybacked on the next uplink (FOpts)
+        self._fopts = bytearray(15)
+        self._fopts_len = 0
+        self._session = SessionCrypto(
+            self._ttn_config.device_address,
+            self._ttn_config.app_key,
+            self._ttn_config.network_key
+        )
+        # DevAddr LSB first, as on air
+        self._dev_addr = bytes(reversed(self._ttn_config.device_address))
+
+        # pipelined TX, see preload/send_preloaded
+        self._pipelined = pipelined_tx
+        if pipelined_tx:
+            self._tx_base = PIPELINED_TX_BASE
+            self._rx_base = PIPELINED_RX_BASE
+            self._preload_data = bytearray(PIPELINED_REGION)
+        else:
+            self._tx_base = FifoTxBaseAddr
+            self._rx_base = FifoRxBaseAddr
+            self._preload_data = None
+        self._preloaded = None  # FCnt of the uplink waiting in the FIFO
+        self._preload_data_length = 0
+        self._preload_confirmed = False
+        self._preload_length = 0
+        self._preload_fctrl = 0
+        self.preloads_rebuilt = 0
+
+        # put in LoRa and sleep mode; a warm chip may have been left in RX
+        # or TX, configuration registers need sleep or standby
+        if self.warm_started:
+            self.set_mode(MODE_STDBY)
+        else:
+            self.sleep()
+
+        # stage the configuration in the shadow, only registers that differ
+        # from the chip are written (none on a warm restart)
+        self.begin_config()
 
         # set channel number
         self._channel = channel
@@ -228,22 +580,7 @@ class SX127x:
         if self._channel is not None: 
             self.set_frequency(self._channel)
 
-        # set data rate and bandwidth
-        self.set_bandwidth(self._parameters["signal_bandwidth"])
-
-        # set LNA boost
-        self.write_register(REG_LNA, self.read_register(REG_LNA) | 0x03)
-
-        # set auto AGC
-        self.write_register(REG_MODEM_CONFIG, 0x04)
-        self.implicit_header_mode(self._parameters['implicit_header'])
-        self.set_tx_power(self._parameters['tx_power_level'])
-        self.set_coding_rate(self._parameters['coding_rate'])
-        self.set_sync_word(self._parameters['sync_word'])
-        self.enable_CRC(self._parameters['enable_CRC'])
-        #self.invert_IQ(self._parameters["invert_IQ"])
-        self.set_preamble_length(self._parameters['preamble_length'])
-        self.set_spreading_factor(self._parameters['spreading_factor'])
+        self.configure(self._parameters)
         # set LowDataRateOptimize flag if symbol time > 16ms (default disable on reset)
         # self.write_register(REG_MODEM_CONFIG, self.read_register(REG_MODEM_CONFIG) & 0xF7)  # default disable on reset
         
@@ -256,27 +593,87 @@ class SX127x:
         #        self.read_register(REG_MODEM_CONFIG) | 0x08
         #    )
 
-        # set base addresses
-        self.write_register(REG_FIFO_TX_BASE_ADDR, FifoTxBaseAddr)
-        self.write_register(REG_FIFO_RX_BASE_ADDR, FifoRxBaseAddr)
+        self.config_writes = self.commit_config()
 
         self.standby()
 
+        # adaptive data rate, starts from the configured data rate
+        self.adr = ADR(self) if adr else None
+
+    def configure(self, parameters):
+        """ Modem settings of a lora_parameters dict, frequency aside.
+        """
+        # set data rate and bandwidth
+        self.set_bandwidth(parameters["signal_bandwidth"])
+
+        # set LNA boost
+        self.write_register(REG_LNA, self.read_register(REG_LNA) | 0x03)
+
+        # set auto AGC
+        self.write_register(REG_MODEM_CONFIG, 0x04)
+        self.implicit_header_mode(parameters['implicit_header'])
+        self.set_tx_power(parameters['tx_power_level'])
+        self.set_coding_rate(parameters['coding_rate'])
+        self.set_sync_word(parameters['sync_word'])
+        self.enable_CRC(parameters['enable_CRC'])
+        #self.invert_IQ(parameters["invert_IQ"])
+        self.set_preamble_length(parameters['preamble_length'])
+        self.set_spreading_factor(parameters['spreading_factor'])
+
+        # set base addresses
+        self.write_register(REG_FIFO_TX_BASE_ADDR, self._tx_base)
+        self.write_register(REG_FIFO_RX_BASE_ADDR, self._rx_base)
+        if self._pipelined:
+            self.write_register(REG_MAX_PAYLOAD_LENGTH, PIPELINED_REGION)
+
+    def reset(self):
+        """ Hardware reset with datasheet timing.
+        """
+        self._reset.value(False)
+        utime.sleep_ms(RESET_PULSE_MS)
+        self._reset.value(True)
+        utime.sleep_ms(RESET_READY_MS)
+
+        # every register is back at its default
+        for i in range(128):
+            self._shadow_valid[i] = 0
+
     def begin_packet(self, implicit_header_mode = False):
         self.standby()
+        self.prepare_packet(implicit_header_mode)
+
+    def prepare_packet(self, implicit_header_mode = False):
+        """ begin_packet without the mode change, radio must be in standby.
+        """
         self.implicit_header_mode(implicit_header_mode)
         #self.write_register(REG_DIO_MAPPING_1, 0x40)
-        
+        self.claim_channel()
+        self.reset_hop()
+
+        # reset FIFO address and paload length
+        self.write_register(REG_FIFO_ADDR_PTR, self._tx_base)
+        self.write_register(REG_PAYLOAD_LENGTH, 0)
+
+    def claim_channel(self):
+        """ Picks the uplink channel when multi-channel and checks that its
+            duty cycle allows sending now.
+        """
         # Check for multi-channel configuration
         if self._channel is None:
-            self._actual_channel = urandom.getrandbits(3)
+            self._actual_channel = self.select_channel()
             self.set_frequency(self._actual_channel)
 
-        # reset FIFO address and paload length
-        self.write_register(REG_FIFO_ADDR_PTR, FifoTxBaseAddr)
-        self.write_register(REG_PAYLOAD_LENGTH, 0)
+        if self.channel_delay_ms(self._actual_channel) > 0:
+            raise RuntimeError("Duty cycle limit, channel {} free in {} ms".format(
+                self._actual_channel, self.channel_delay_ms(self._actual_channel)))
 
     def end_packet(self, timeout=5):
+        if self._tx_wait == TX_WAIT_POLL or not self._pin_rx_done:
+            self._end_packet_poll(timeout)
+        else:
+            self._end_packet_irq(timeout)
+
+    def _end_packet_poll(self, timeout):
         # put in TX mode
         self.write_register(REG_OP_MODE, MODE_LONG_RANGE_MODE | MODE_TX)
 
@@ -296,108 +693,489 @@ class SX127x:
 
         if timed_out:
             raise RuntimeError("Timeout during packet send")
+        self._tx_done_ms = utime.ticks_ms()
 
         # clear IRQ's
         self.write_register(REG_IRQ_FLAGS, IRQ_TX_DONE_MASK)
+        self.record_airtime()
 
-        self.collect_garbage()
+    def _end_packet_irq(self, timeout):
+        """ Waits for TxDone on DIO0 with the CPU idle (or in lightsleep)
+            instead of polling REG_IRQ_FLAGS over SPI.
+        """
+        self.start_transmit()
+
+        start = utime.ticks_us()
+        timeout_us = int(timeout * 1000000)
+        timed_out = False
+
+        # wait for TX done, standby automatically on TX_DONE
+        while not self._tx_done:
+            if utime.ticks_diff(utime.ticks_us(), start) >= timeout_us:
+                timed_out = True
+                break
+            if self._tx_wait == TX_WAIT_LIGHTSLEEP:
+                lightsleep(TX_SLEEP_SLICE_MS)
+            else:
+                idle()
+
+        elapsed_us = utime.ticks_diff(utime.ticks_us(), start)
+        self.finish_transmit()
+
+        if timed_out:
+            raise RuntimeError("Timeout during packet send")
+
+        self.tx_polls_saved += elapsed_us // self._poll_us
+
+    def start_transmit(self):
+        """ Maps DIO0 to TxDone and puts the radio in TX mode, the
+            FIFO must already hold the packet.
+        """
+        self.write_register(REG_DIO_MAPPING_1, DIO0_TX_DONE)
+        self._tx_done = False
+        self._tx_pending = True
+
+        # put in TX mode
+        self.write_register(REG_OP_MODE, MODE_LONG_RANGE_MODE | MODE_TX)
+
+    def finish_transmit(self):
+        """ Clears TxDone and hands DIO0 back to the receive path.
+        """
+        self._tx_pending = False
+        self.write_register(REG_IRQ_FLAGS, IRQ_TX_DONE_MASK)
+        self.write_register(REG_DIO_MAPPING_1, DIO0_RX_DONE)
+        self.record_airtime()
+
+    def record_airtime(self):
+        if self._duty_cycle and self._actual_channel is not None:
+            self._duty_cycle.record(
+                self._channel_sub_band[self._actual_channel],
+                self.time_on_air_us(self._tx_length)
+            )
+
+    def time_on_air_us(self, payload_length):
+        """ Exact LoRa time on air (SX1276 datasheet 4.1.1.7) for the
+            current data rate, coding rate, preamble, CRC and header mode.
+        """
+        sf = self._sf
+        symbol_us = self.symbol_us()
+        # LowDataRateOptimize is mandated for symbols of 16 ms and more
+        de = 1 if symbol_us >= 16000 else 0
+        ih = 1 if self._implicit_header_mode else 0
+        crc = 1 if self._crc else 0
+
+        bits = 8 * payload_length - 4 * sf + 28 + 16 * crc - 20 * ih
+        per_block = 4 * (sf - 2 * de)
+        payload_symbols = 8 + max(
+            -(-bits // per_block) * (self._coding_rate + 4), 0
+        )
+        # preamble is n + 4.25 symbols
+        return (4 * self._preamble_length + 17) * symbol_us // 4 + \
+            payload_symbols * symbol_us
+
+    def channel_delay_ms(self, channel):
+        """ Milliseconds until channel may transmit under the duty cycle.
+        """
+        if not self._duty_cycle:
+            return 0
+        return self._duty_cycle.delay_ms(self._channel_sub_band[channel])
+
+    def select_channel(self):
+        """ Picks the channel that can transmit soonest, randomly among
+            those free right now.
+        """
+        channels = len(self._frf)
+        offset = urandom.getrandbits(8) % channels
+        best = offset
+        best_delay = self.channel_delay_ms(best)
+        for i in range(1, channels):
+            if best_delay == 0:
+                break
+            channel = (offset + i) % channels
+            delay = self.channel_delay_ms(channel)
+            if delay < best_delay:
+                best, best_delay = channel, delay
+        return best
+
+    def send_delay_ms(self):
+        """ Earliest allowed send time, in ms from now (0: send now).
+        """
+        if self._channel is not None:
+            return self.channel_delay_ms(self._channel)
+        return self.channel_delay_ms(self.select_channel())
 
     def write(self, buffer, buffer_length):
         # update length
+        self._tx_length = buffer_length
         self.write_register(REG_PAYLOAD_LENGTH, buffer_length)
 
         # write data
-        for i in range(buffer_length):
-            self.write_register(REG_FIFO, buffer[i])
+        if self.burst_fifo:
+            self.write_fifo(buffer, buffer_length)
+        else:
+            for i in range(buffer_length):
+                self.write_register(REG_FIFO, buffer[i])
 
+    def write_fifo(self, buffer, buffer_length):
+        """ Loads the first buffer_length bytes of buffer into the FIFO
+            in a single SPI burst transaction.
+        """
+        if len(buffer) != buffer_length:
+            buffer = memoryview(buffer)[:buffer_length]
+        self.write_registers(REG_FIFO, buffer)
+
+    def read_fifo(self, buffer, buffer_length):
+        """ Drains buffer_length bytes from the FIFO into buffer
+            in a single SPI burst transaction.
+        """
+        if len(buffer) != buffer_length:
+            buffer = memoryview(buffer)[:buffer_length]
+        self.read_registers(REG_FIFO, buffer)
 
     def set_lock(self, lock = False):
         self._lock = lock
 
-    def send_data(self, data, data_length, frame_counter, timeout=5):
-        # Data packet
-        enc_data = bytearray(data_length)
-        lora_pkt = bytearray(64)
+    def send_data(self, data, data_length, frame_counter, timeout=5,
+                  confirmed=False):
+        alloc = gc.mem_alloc()
+
+        lora_pkt, lora_pkt_len = self.build_packet(
+            data, data_length, frame_counter, confirmed
+        )
+        self.send_packet(lora_pkt, lora_pkt_len, timeout)
+        self.uplink_sent()
+
+        self.last_send_alloc = gc.mem_alloc() - alloc
+        self.apply_gc_policy()
+
+    def send_confirmed(self, data, data_length, frame_counter,
+                       transmissions=None, timeout=5):
+        """ Confirmed uplink followed by the receive windows, sent again
+            with the same FCnt until a downlink carries the ACK bit, at most
+            transmissions times (confirmed_transmissions by default).
+            After every DR_STEP_TRANSMISSIONS unacknowledged transmissions
+            the data rate steps down one DR, restored once done; the ADR
+            state follows both steps, and a LinkADRReq received meanwhile
+            ends the stepping and is kept. Returns
+            UPLINK_ACKED or UPLINK_UNACKED; the outcome is also recorded
+            in uplink_outcomes and a downlink payload left in last_downlink.
+            Radio errors are recorded as UPLINK_FAILED and raised.
+        """
+        budget = transmissions or self._confirmed_transmissions
+        base_rate = data_rate = self._data_rate
+        adr_reqs = self.adr.link_adr_reqs if self.adr else 0
+        sent = 0
+        status = UPLINK_FAILED
+        self.last_downlink = None
 
-        # Copy bytearray into bytearray for encryption
-        enc_data[0:data_length] = data[0:data_length]
+        try:
+            while sent < budget:
+                if sent:
+                    utime.sleep_ms(max(self.ack_timeout_ms(),
+                                       self.send_delay_ms()))
+                    self.retransmissions += 1
+                self.send_data(data, data_length, frame_counter, timeout,
+                               confirmed=True)
+                sent += 1
+
+                payload = self.receive_windows()
+                if payload is not None:
+                    self.last_downlink = payload
+                    if self.downlink_ack:
+                        status = UPLINK_ACKED
+                        break
+
+                # step down, unless ADR or a LinkADRReq set the data rate
+                if sent % DR_STEP_TRANSMISSIONS == 0 and \
+                   self._rate_kept(data_rate, adr_reqs) and \
+                   data_rate in ADR_DATA_RATES:
+                    dr = ADR_DATA_RATES.index(data_rate)
+                    if dr > 0:
+                        data_rate = ADR_DATA_RATES[dr - 1]
+                        self._step_data_rate(data_rate)
+            if status != UPLINK_ACKED:
+                status = UPLINK_UNACKED
+        finally:
+            if data_rate != base_rate and self._rate_kept(data_rate, adr_reqs):
+                self._step_data_rate(base_rate)
+            self.record_outcome(frame_counter, status, sent)
+
+        return status
+
+    def _rate_kept(self, data_rate, adr_reqs):
+        # still on the rate send_confirmed set, no LinkADRReq since
+        if self.adr and self.adr.link_adr_reqs != adr_reqs:
+            return False
+        return self._data_rate == data_rate
+
+    def _step_data_rate(self, data_rate):
+        # retransmission step, the ADR state moves along so that its
+        # next backoff or adaptation starts from the rate in use
+        self.set_data_rate(data_rate)
+        if self.adr:
+            self.adr.data_rate = ADR_DATA_RATES.index(data_rate)
+
+    def ack_timeout_ms(self):
+        """ Wait before retransmitting a confirmed uplink, counted from the
+            end of the receive windows.
+        """
+        return ACK_TIMEOUT_MS - ACK_TIMEOUT_JITTER_MS + \
+            urandom.getrandbits(16) % (2 * ACK_TIMEOUT_JITTER_MS)
+
+    def record_outcome(self, frame_counter, status, transmissions):
+        if status == UPLINK_ACKED:
+            self.uplinks_acked += 1
+        elif status == UPLINK_UNACKED:
+            self.uplinks_unacked += 1
+        outcomes = self.uplink_outcomes
+        if len(outcomes) == UPLINK_HISTORY:
+            outcomes.pop(0)
+        outcomes.append((frame_counter, status, transmissions))
+
+    def build_packet(self, data, data_length, frame_counter, confirmed=False):
+        """ Builds the encrypted PHYPayload for a data uplink in the
+            preallocated packet buffer, returns the buffer and its length.
+        """
+        if data_length + 13 + self._fopts_len > MAX_PKT_LENGTH:
+            raise ValueError("Payload too long.")
 
-        # Encrypt data (enc_data is overwritten in this function)
+        lora_pkt = self._pkt_buf
         self.frame_counter = frame_counter
-        aes = AES(
-            self._ttn_config.device_address,
-            self._ttn_config.app_key,
-            self._ttn_config.network_key,
-            self.frame_counter
-        )
-        
-        enc_data = aes.encrypt(enc_data)
+
         # Construct MAC Layer packet (PHYPayload)
         # MHDR (MAC Header) - 1 byte
-        lora_pkt[0] = REG_DIO_MAPPING_1 # MType: unconfirmed data up, RFU / Major zeroed
+        # MType: (un)confirmed data up, RFU / Major zeroed
+        lora_pkt[0] = MTYPE_CONFIRMED_DATA_UP if confirmed \
+            else MTYPE_UNCONFIRMED_DATA_UP
         # MACPayload
         # FHDR (Frame Header): DevAddr (4 bytes) - short device address
         lora_pkt[1] = self._ttn_config.device_address[3]
         lora_pkt[2] = self._ttn_config.device_address[2]
         lora_pkt[3] = self._ttn_config.device_address[1]
         lora_pkt[4] = self._ttn_config.device_address[0]
-        # FHDR (Frame Header): FCtrl (1 byte) - frame control
-        lora_pkt[5] = 0x00
+        # FHDR (Frame Header): FCtrl (1 byte) - ADR bits, ACK, FOpts length
+        lora_pkt[5] = self._fctrl()
         # FHDR (Frame Header): FCnt (2 bytes) - frame counter
         lora_pkt[6] = self.frame_counter & 0x00FF
         lora_pkt[7] = (self.frame_counter >> 8) & 0x00FF
+        # FHDR (Frame Header): FOpts - pending MAC command answers
+        for i in range(self._fopts_len):
+            lora_pkt[8 + i] = self._fopts[i]
+        lora_pkt_len = 8 + self._fopts_len
         # FPort - port field
-        lora_pkt[8] = self._fport
-        # Set length of LoRa packet
-        lora_pkt_len = 9
-
-        if __DEBUG__:
-            print("PHYPayload", ubinascii.hexlify(lora_pkt))
-        # load encrypted data into lora_pkt
-        lora_pkt[lora_pkt_len : lora_pkt_len + data_length] = enc_data[0:data_length]
-
-        if __DEBUG__:
-            print("PHYPayload with FRMPayload", ubinascii.hexlify(lora_pkt))
+        lora_pkt[lora_pkt_len] = self._fport
+        lora_pkt_len += 1
+
+        # Copy data into the packet and encrypt it in place (FRMPayload)
+        for i in range(data_length):
+            lora_pkt[lora_pkt_len + i] = data[i]
+        self._session.encrypt(
+            self.frame_counter, lora_pkt, data_length, offset=lora_pkt_len
+        )
 
         # Recalculate packet length
         lora_pkt_len += data_length
         # Calculate Message Integrity Code (MIC)
         # MIC is calculated over: MHDR | FHDR | FPort | FRMPayload
-        mic = bytearray(4)
-        mic = aes.calculate_mic(lora_pkt, lora_pkt_len, mic)
+        mic = self._session.mic(self.frame_counter, lora_pkt, lora_pkt_len)
 
         # Load MIC in package
-        lora_pkt[lora_pkt_len : lora_pkt_len + 4] = mic[0:4]
+        for i in range(4):
+            lora_pkt[lora_pkt_len + i] = mic[i]
         # Recalculate packet length (add MIC length)
         lora_pkt_len += 4
         
-        if __DEBUG__:
-            print("PHYPayload with FRMPayload + MIC", ubinascii.hexlify(lora_pkt))
+        if self._debug:
+            print("PHYPayload with FRMPayload + MIC",
+                  ubinascii.hexlify(lora_pkt[:lora_pkt_len]))
         
-        self.send_packet(lora_pkt, lora_pkt_len, timeout)
+        return lora_pkt, lora_pkt_len
+
+    def _fctrl(self):
+        return (self.adr.fctrl() if self.adr else 0x00) | \
+            (FCTRL_ACK if self._ack_pending else 0x00) | self._fopts_len
+
+    def preload(self, data, data_length, frame_counter, confirmed=False):
+        """ Pipelined TX: builds the next uplink and loads it into the TX
+            half of the FIFO, where it waits through the receive windows of
+            the current one. Call it with the radio idle, best between
+            send_data() and receive_windows(): the RX1 delay runs from
+            TxDone, so the encryption and the FIFO load add no latency.
+            send_preloaded() then only has to switch the radio to TX.
+        """
+        if not self._pipelined:
+            raise ValueError("Preloading needs pipelined_tx.")
+        if data_length + 13 + self._fopts_len > PIPELINED_REGION:
+            raise ValueError("Payload too long for the TX half of the FIFO.")
+
+        lora_pkt, lora_pkt_len = self.build_packet(
+            data, data_length, frame_counter, confirmed
+        )
+        # kept in case the frame must be rebuilt, see send_preloaded
+        if data is not self._preload_data:
+            for i in range(data_length):
+                self._preload_data[i] = data[i]
+        self._preload_data_length = data_length
+        self._preload_confirmed = confirmed
+
+        self.standby()
+        self.implicit_header_mode(False)
+        self.write_register(REG_FIFO_ADDR_PTR, self._tx_base)
+        self.write(lora_pkt, lora_pkt_len)
+        self._preload_length = lora_pkt_len
+        self._preload_fctrl = lora_pkt[5]
+        self._preloaded = frame_counter
+
+    @property
+    def preloaded(self):
+        """ Frame counter of the uplink waiting in the FIFO, or None.
+        """
+        return self._preloaded
+
+    def send_preloaded(self, timeout=5):
+        """ Sends the uplink loaded by preload(): a mode write once the
+            channel is clear. A downlink in between that queued MAC answers
+            or an ACK changes FCtrl, the frame is then rebuilt first.
+            Returns its frame counter.
+        """
+        frame_counter = self._preloaded
+        if frame_counter is None:
+            raise RuntimeError("No uplink preloaded.")
+        if self._fctrl() != self._preload_fctrl:
+            self.preloads_rebuilt += 1
+            self.preload(self._preload_data, self._preload_data_length,
+                         frame_counter, self._preload_confirmed)
+
+        self.set_lock(True)
+        try:
+            self.claim_channel()
+            if self._listen_before_talk:
+                self.listen_before_talk()
+                # a channel hop resets the payload length
+                self.write_register(REG_PAYLOAD_LENGTH, self._preload_length)
+            self._tx_length = self._preload_length
+            self._preloaded = None
+            self.end_packet(timeout)
+        finally:
+            self.set_lock(False)
+
+        self.uplink_sent()
+        self.blink_led()
+        self.apply_gc_policy()
+        return frame_counter
+
+    def uplink_sent(self):
+        """ Bookkeeping once an uplink left the radio.
+        """
+        self._fopts_len = 0
+        self._ack_pending = False
+        if self.adr:
+            self.adr.on_uplink()
+
+    def add_fopts(self, data):
+        """ Queues MAC command bytes for the FOpts of the next uplink.
+        """
+        n = min(len(data), len(self._fopts) - self._fopts_len)
+        for i in range(n):
+            self._fopts[self._fopts_len + i] = data[i]
+        self._fopts_len += n
 
     def send_packet(self, lora_packet, packet_length, timeout):
         """ Sends a LoRa packet using the SX1276 module.
         """
         self.set_lock(True)  # wait until RX_Done, lock and begin writing.
 
-        self.begin_packet()
-
-        # Fill the FIFO buffer with the LoRa payload
-        self.write(lora_packet, packet_length)
-        
-        # Send the package
-        self.end_packet(timeout)
+        try:
+            self._preloaded = None  # overwritten in the FIFO
+            self.begin_packet()
+            if self._listen_before_talk:
+                self.listen_before_talk()
 
-        self.set_lock(False) # unlock when done writing
+            # Fill the FIFO buffer with the LoRa payload
+            self.write(lora_packet, packet_length)
+            
+            # Send the package
+            self.end_packet(timeout)
+        finally:
+            self.set_lock(False) # unlock when done writing
 
         self.blink_led()
-        self.collect_garbage()
+
+    def listen_before_talk(self):
+        """ CAD until the channel is clear, backing off randomly while it
+            is busy and hopping channel when multi-channel. Radio must be
+            in standby with the packet prepared. Returns the number of busy
+            attempts, raises RuntimeError once the retry budget is spent.
+        """
+        for attempt in range(self._cad_retries + 1):
+            if not self.channel_activity():
+                return attempt
+            if attempt < self._cad_retries:
+                utime.sleep_ms(self.cad_backoff_ms(attempt))
+                if self._channel is None:
+                    self.prepare_packet()
+        raise RuntimeError("Channel busy after {} CAD attempts".format(
+            self._cad_retries + 1))
+
+    def cad_backoff_ms(self, attempt):
+        """ Random backoff in the upper half of a window that doubles with
+            every busy attempt, so colliding nodes spread out.
+        """
+        window = CAD_BACKOFF_MS << attempt
+        return window // 2 + urandom.getrandbits(16) % (window // 2)
+
+    def channel_activity(self):
+        """ Runs a single CAD on the current channel, radio must be in
+            standby. Returns True when a LoRa preamble was detected.
+        """
+        self.write_register(REG_DIO_MAPPING_1, DIO0_CAD_DONE | DIO1_CAD_DETECTED)
+        self.write_register(REG_IRQ_FLAGS, IRQ_CAD_DONE_MASK | IRQ_CAD_DETECTED_MASK)
+        self._cad_pending = True
+        self.set_mode(MODE_CAD)
+
+        # nothing to poll before the CAD can have finished
+        symbol_us = self.symbol_us()
+        utime.sleep_us(CAD_SYMBOLS * symbol_us)
+        start = utime.ticks_us()
+        irq_flags = self.read_register(REG_IRQ_FLAGS)
+        while irq_flags & IRQ_CAD_DONE_MASK == 0:
+            if utime.ticks_diff(utime.ticks_us(), start) >= \
+               CAD_TIMEOUT_SYMBOLS * symbol_us:
+                break
+            utime.sleep_us(symbol_us >> 3)
+            irq_flags = self.read_register(REG_IRQ_FLAGS)
+
+        # the radio is back in standby after CadDone
+        self.write_register(REG_IRQ_FLAGS, IRQ_CAD_DONE_MASK | IRQ_CAD_DETECTED_MASK)
+        self.write_register(REG_DIO_MAPPING_1, DIO0_RX_DONE)
+        self._cad_pending = False
+
+        if irq_flags & IRQ_CAD_DONE_MASK == 0:
+            self.set_mode(MODE_STDBY)
+            raise RuntimeError("Timeout during channel activity detection")
+
+        busy = irq_flags & IRQ_CAD_DETECTED_MASK != 0
+        channel = self._actual_channel
+        self.cad_checks[channel] += 1
+        if busy:
+            self.cad_busy[channel] += 1
+        return busy
+
+    def busy_rates(self):
+        """ Share of CAD checks that found the channel busy, keyed by
+            frequency in Hz, for the channels checked so far.
+        """
+        rates = {}
+        for ch in self.cad_checks:
+            if self.cad_checks[ch]:
+                rates[frf_to_hz(self._frf[ch])] = \
+                    self.cad_busy[ch] / self.cad_checks[ch]
+        return rates
 
     def get_irq_flags(self):
         irq_flags = self.read_register(REG_IRQ_FLAGS)
 
-        if __DEBUG__:
+        if self._debug:
             irq_dict = dict(
                 rx_timeout     = irq_flags >> 7 & 0x01,
                 rx_done        = irq_flags >> 6 & 0x01,
@@ -415,22 +1193,72 @@ class SX127x:
         return irq_flags
 
     def packet_rssi(self):
-        # TODO
-        rssi = self.read_register(REG_PKT_RSSI_VALUE)
-        return rssi
-        #return (rssi - (164 if self._frequency < 868E6 else 157))
+        """ RSSI of the last packet in dBm, SNR corrected.
+        """
+        return self.rssi_dbm(
+            self.read_register(REG_PKT_RSSI_VALUE),
+            self.read_register(REG_PKT_SNR_VALUE)
+        )
 
     def packet_snr(self):
-        snr = self.read_register(REG_PKT_SNR_VALUE)
-        return snr * 0.25
+        return self.snr_db(self.read_register(REG_PKT_SNR_VALUE))
+
+    @staticmethod
+    def snr_db(snr_value):
+        # two's complement, in 0.25 dB steps
+        if snr_value > 127:
+            snr_value -= 256
+        return snr_value * 0.25
+
+    def rssi_dbm(self, rssi_value, snr_value):
+        """ Packet RSSI from the raw PktRssiValue and PktSnrValue: below
+            the noise floor the SNR is added, above it the 16/15 slope
+            corrects the register's linearity.
+        """
+        snr = self.snr_db(snr_value)
+        if snr < 0:
+            return rssi_value - self._rssi_offset + snr
+        return rssi_value * 16 / 15 - self._rssi_offset
+
+    def record_link_quality(self, rssi_value, snr_value):
+        self.last_snr = self.snr_db(snr_value)
+        self.last_rssi = self.rssi_dbm(rssi_value, snr_value)
+        self.rssi_stats.add(self.last_rssi)
+        self.snr_stats.add(self.last_snr)
+
+    def link_report(self):
+        """ Compact link quality summary for an uplink: sample count,
+            RSSI min/mean/10th percentile in -dBm and SNR min/mean/10th
+            percentile in signed 0.25 dB steps. Returns a reused buffer,
+            all zero before the first downlink.
+        """
+        report = self._link_report
+        rssi, snr = self.rssi_stats, self.snr_stats
+        report[0] = min(len(rssi), 255)
+        if not len(rssi):
+            for i in range(1, LINK_REPORT_LENGTH):
+                report[i] = 0
+            return report
+        report[1] = min(int(-rssi.min() + 0.5), 255)
+        report[2] = min(int(-rssi.mean() + 0.5), 255)
+        report[3] = min(int(-rssi.percentile(10) + 0.5), 255)
+        report[4] = int(snr.min() * 4) & 0xFF
+        report[5] = int(snr.mean() * 4) & 0xFF
+        report[6] = int(snr.percentile(10) * 4) & 0xFF
+        return report
 
     def standby(self):
-        self.write_register(REG_OP_MODE, MODE_LONG_RANGE_MODE | MODE_STDBY)
-        utime.sleep_ms(10)
+        self.set_mode(MODE_STDBY)
+        utime.sleep_ms(MODE_SETTLE_MS)
 
     def sleep(self):
-        self.write_register(REG_OP_MODE, MODE_LONG_RANGE_MODE | MODE_SLEEP)
-        utime.sleep_ms(10)
+        self.set_mode(MODE_SLEEP)
+        utime.sleep_ms(MODE_SETTLE_MS)
+
+    def set_mode(self, mode):
+        """ Writes the LoRa operating mode without waiting for it to settle.
+        """
+        self.write_register(REG_OP_MODE, MODE_LONG_RANGE_MODE | mode)
 
     def set_tx_power(self, level, outputPin=PA_OUTPUT_PA_BOOST_PIN):
         self._tx_power_level = level
@@ -446,24 +1274,27 @@ class SX127x:
             self.write_register(REG_PA_CONFIG, PA_BOOST | (level - 2))
 
     def set_frequency(self, channel):
-        self.write_register(REG_FRF_MSB, self._frequencies[channel][0])
-        self.write_register(REG_FRF_MID, self._frequencies[channel][1])
-        self.write_register(REG_FRF_LSB, self._frequencies[channel][2])
+        # FRF MSB/MID/LSB are consecutive, one burst
+        self.write_registers(REG_FRF_MSB, self._frf[channel])
     
     def set_coding_rate(self, denominator):
         denominator = min(max(denominator, 5), 8)
         cr = denominator - 4
+        self._coding_rate = cr
         self.write_register(
             REG_FEI_MSB, 
             (self.read_register(REG_FEI_MSB) & 0xf1) | (cr << 1)
         )
 
     def set_preamble_length(self, length):
-        self.write_register(REG_PREAMBLE_MSB,  (length >> 8) & 0xff)
-        self.write_register(REG_PREAMBLE_LSB,  (length >> 0) & 0xff)
+        self._preamble_length = length
+        self._reg_pair[0] = (length >> 8) & 0xff
+        self._reg_pair[1] = (length >> 0) & 0xff
+        self.write_registers(REG_PREAMBLE_MSB, self._reg_pair)
 
     def set_spreading_factor(self, sf): 
         sf = min(max(sf, 6), 12)
+        self._sf = sf
         self.write_register(REG_DETECTION_OPTIMIZE, 0xc5 if sf == 6 else 0xc3)
         self.write_register(REG_DETECTION_THRESHOLD, 0x0c if sf == 6 else 0x0a)
         self.write_register(REG_FEI_LSB, (self.read_register(REG_FEI_LSB) & 0x0f) | ((sf << 4) & 0xf0))
@@ -471,13 +1302,150 @@ class SX127x:
     def set_bandwidth(self, datarate):
         try:
             sf, bw, modemcfg = self._data_rates[datarate]
-            self.write_register(REG_FEI_LSB, sf)
-            self.write_register(REG_FEI_MSB, bw)
-            self.write_register(REG_MODEM_CONFIG, modemcfg)
         except KeyError:
             raise KeyError("Invalid or Unsupported Datarate.")
+        self._data_rate = datarate
+        self._sf = sf >> 4
+        self._bw = (125, 250, 500)[(bw >> 4) - 7]
+        self._crc = sf & 0x04 != 0
+        self._coding_rate = (bw >> 1) & 0x07
+
+        # modem config 1 (REG_FEI_MSB) and 2 (REG_FEI_LSB) in one burst
+        self._reg_pair[0] = bw
+        self._reg_pair[1] = sf
+        self.write_registers(REG_FEI_MSB, self._reg_pair)
+        self.write_register(REG_MODEM_CONFIG, modemcfg)
+
+    def set_data_rate(self, datarate):
+        """ Switches data rate (SF and bandwidth) keeping the CRC setting,
+            through a cached register profile.
+        """
+        self.apply_profile(self.data_rate_profile(datarate))
+
+    def _configure_data_rate(self, datarate):
+        self.set_bandwidth(datarate)
+        self.set_spreading_factor(self._sf)
+        self.enable_CRC(self._parameters['enable_CRC'])
+
+    def data_rate_profile(self, datarate):
+        """ Register profile of a data rate in _data_rates, compiled on
+            first use.
+        """
+        profile = self._profiles.get(datarate)
+        if profile is None:
+            if datarate not in self._data_rates:
+                raise KeyError("Invalid or Unsupported Datarate.")
+            profile = self.compile_profile(
+                lambda lora: lora._configure_data_rate(datarate), datarate
+            )
+            self._profiles[datarate] = profile
+        return profile
+
+    def parameters_profile(self, parameters, name=None):
+        """ Register profile of a whole lora_parameters dict.
+        """
+        return self.compile_profile(
+            lambda lora: lora.configure(parameters), name
+        )
+
+    def compile_profile(self, configure, name=None):
+        """ Runs configure(self) against the register shadow and records
+            every register it sets into a RegisterProfile. Nothing is
+            written to the chip and the driver state is left as it was.
+        """
+        profile = RegisterProfile(name)
+        shadow_enabled = self._shadow_enabled
+        staging = self._staging
+        shadow = bytearray(self._shadow)
+        shadow_valid = bytearray(self._shadow_valid)
+        state = [
+            (attribute, getattr(self, attribute))
+            for _, attributes in PROFILE_STATE for attribute in attributes
+        ]
+
+        if not shadow_enabled:
+            self._shadow_enabled = True
+            self.resync()
+        self._staging = True
+        self._recording = profile.mask
+        try:
+            configure(self)
+            for i in range(128):
+                if profile.mask[i]:
+                    profile.values[i] = self._shadow[i]
+            profile.state = tuple(
+                (attribute, getattr(self, attribute))
+                for register, attributes in PROFILE_STATE
+                if profile.mask[register]
+                for attribute in attributes
+            )
+        finally:
+            self._recording = None
+            self._staging = staging
+            self._shadow_enabled = shadow_enabled
+            self._shadow[:] = shadow
+            self._shadow_valid[:] = shadow_valid
+            for attribute, value in state:
+                setattr(self, attribute, value)
+
+        profile.finish()
+        return profile
+
+    def apply_profile(self, profile):
+        """ Switches the chip to a compiled profile. With the register
+            shadow only the registers that differ are written; runs less
+            than PROFILE_MERGE_GAP registers apart share one burst.
+            Returns the number of SPI transactions used.
+        """
+        mask = profile.mask
+        values = profile.values
+        shadow = self._shadow
+        valid = self._shadow_valid
+        known = self._shadow_enabled
+
+        for attribute, value in profile.state:
+            setattr(self, attribute, value)
+
+        if self._staging:
+            for i in range(profile.first, profile.last + 1):
+                if mask[i]:
+                    shadow[i] = values[i]
+                    valid[i] = 1
+            return 0
+
+        buf = self._profile_buf
+        transactions = 0
+        i = profile.first
+        end = profile.last + 1
+        while i < end:
+            if not mask[i] or (known and valid[i] and shadow[i] == values[i]):
+                i += 1
+                continue
+
+            # extend the burst over registers that differ, bridging short
+            # gaps of registers whose value is known
+            start = last = i
+            j = i + 1
+            while j < end and j - last <= PROFILE_MERGE_GAP:
+                if mask[j] and not (known and valid[j] and shadow[j] == values[j]):
+                    last = j
+                elif not mask[j] and not (known and valid[j]):
+                    break
+                j += 1
+
+            for k in range(start, last + 1):
+                buf[k] = values[k] if mask[k] else shadow[k]
+                if known:
+                    shadow[k] = buf[k]
+                    valid[k] = 1
+            self._burst_write(start, memoryview(buf)[start:last + 1])
+            transactions += 1
+            i = last + 1
+
+        return transactions
 
     def enable_CRC(self, enable_CRC = False):
+        self._crc = enable_CRC
         modem_config_2 = self.read_register(REG_FEI_LSB)
         config = modem_config_2 | 0x04 if enable_CRC else modem_config_2 & 0xfb
         self.write_register(REG_FEI_LSB, config)
@@ -539,46 +1507,407 @@ class SX127x:
 
         if size > 0: 
             self.write_register(REG_PAYLOAD_LENGTH, size & 0xff)
+        self.reset_hop()
         # The last packet always starts at FIFO_RX_CURRENT_ADDR
         # no need to reset FIFO_ADDR_PTR
         self.write_register(
             REG_OP_MODE, MODE_LONG_RANGE_MODE | MODE_RX_CONTINUOUS
         )
 
-    def on_receive(self, callback):
+    def receive_windows(self, rx1_delay=RECEIVE_DELAY1_MS,
+                        rx2_delay=RECEIVE_DELAY2_MS,
+                        rx2_frequency=RX2_FREQUENCY,
+                        rx2_data_rate=RX2_DATA_RATE):
+        """ LoRaWAN Class A reception after an uplink: RX1 on the uplink
+            channel and data rate, RX2 on its own frequency and data rate
+            if RX1 stays empty. Both use single RX with a symbol timeout and
+            the radio sleeps afterwards. Returns a memoryview of the
+            decrypted FRMPayload of an authenticated downlink, or None;
+            last_rx_window tells which window got it, last_fport its port.
+            rx2_delay None skips RX2, for a node with a second radio
+            listening there (see listen_rx2).
+        """
+        uplink_data_rate = self._data_rate
+        self.last_rx_window = 0
+        self.invert_IQ(True)
+
+        length = self._receive_window(rx1_delay)
+        if length:
+            self.last_rx_window = 1
+        elif rx2_delay is not None:
+            self.write_registers(REG_FRF_MSB, rx2_frequency)
+            self.set_data_rate(rx2_data_rate)
+            length = self._receive_window(rx2_delay)
+            if length:
+                self.last_rx_window = 2
+
+            # back to the uplink settings
+            self.set_data_rate(uplink_data_rate)
+            if self._actual_channel is not None:
+                self.set_frequency(self._actual_channel)
+
+        self.invert_IQ(False)
+
+        payload = None
+        if length:
+            payload = self.open_downlink(self._downlink_buf, length)
+        if payload is not None:
+            self.downlink_received(
+                self._downlink_buf, length, payload,
+                self.read_register(REG_PKT_RSSI_VALUE),
+                self.read_register(REG_PKT_SNR_VALUE)
+            )
+        # sleep clears the FIFO, a preloaded uplink keeps the radio up
+        if self._preloaded is None:
+            self.sleep()
+        else:
+            self.standby()
+
+        return payload
+
+    def listen_rx2(self, rx2_frequency=RX2_FREQUENCY,
+                   rx2_data_rate=RX2_DATA_RATE):
+        """ Continuous reception on RX2, for a radio dedicated to
+            downlinks; packets are delivered through on_receive.
+        """
+        self.standby()
+        self.write_registers(REG_FRF_MSB, rx2_frequency)
+        self.set_data_rate(rx2_data_rate)
+        self.invert_IQ(True)
+        self.receive()
+
+    def downlink_for_us(self, packet, length):
+        """ Cheap check before any crypto: a data downlink of sane length
+            addressed to our DevAddr. Safe in interrupt context.
+        """
+        if length < MIN_DOWNLINK_LENGTH:
+            return False
+        mtype = packet[0] & MHDR_MTYPE_MASK
+        if mtype != MTYPE_UNCONFIRMED_DATA_DOWN and \
+           mtype != MTYPE_CONFIRMED_DATA_DOWN:
+            return False
+        dev_addr = self._dev_addr
+        return packet[1] == dev_addr[0] and packet[2] == dev_addr[1] and \
+            packet[3] == dev_addr[2] and packet[4] == dev_addr[3]
+
+    def open_downlink(self, packet, length):
+        """ Authenticates a data downlink and decrypts its FRMPayload in
+            place. Returns a memoryview of the payload (empty without
+            FPort), or None if the frame is foreign, replayed or fails
+            the MIC check.
+        """
+        if not self.downlink_for_us(packet, length):
+            self.rx_foreign += 1
+            return None
+
+        fcnt = self.downlink_counter(packet[6] | (packet[7] << 8))
+        if fcnt is None:
+            self.rx_replayed += 1
+            return None
+
+        # MIC over MHDR | FHDR | FPort | FRMPayload
+        n = length - 4
+        if not self._session.verify_mic(fcnt, packet, n):
+            self.rx_bad_mic += 1
+            return None
+        self.frame_counter_down = fcnt
+        self.downlink_confirmed = \
+            packet[0] & MHDR_MTYPE_MASK == MTYPE_CONFIRMED_DATA_DOWN
+        if self.downlink_confirmed:
+            self._ack_pending = True
+        self.downlink_ack = packet[5] & FCTRL_ACK != 0
+
+        start = 8 + (packet[5] & 0x0F)
+        if start >= n:
+            self.last_fport = None
+            return memoryview(packet)[n:n]
+        self.last_fport = packet[start]
+        start += 1
+        self._session.encrypt(
+            fcnt, packet, n - start, direction=1, offset=start,
+            network=self.last_fport == 0
+        )
+        return memoryview(packet)[start:n]
+
+    def downlink_received(self, packet, length, payload, rssi_value,
+                          snr_value):
+        """ Bookkeeping for an authenticated downlink, whether it came in
+            a receive window or through the receive ring: link quality,
+            then ADR with the MAC commands in FOpts and, on FPort 0, in
+            the payload.
+        """
+        self.record_link_quality(rssi_value, snr_value)
+        if self.adr:
+            self.adr.on_downlink(packet, length, self.last_snr)
+            if self.last_fport == 0:
+                self.adr.process_mac_commands(payload, 0, len(payload))
+
+    def downlink_counter(self, fcnt16):
+        """ Full 32-bit FCntDown for the 16 bits on air, None unless it
+            moves forward by less than MAX_FCNT_GAP.
+        """
+        last = self.frame_counter_down
+        if last < 0:
+            return fcnt16
+        fcnt = (last & ~0xFFFF) | fcnt16
+        if fcnt <= last:
+            fcnt += 0x10000
+        if fcnt - last >= MAX_FCNT_GAP:
+            return None
+        return fcnt
+
+    def _receive_window(self, delay):
+        # single RX, opened RX_WINDOW_MARGIN_MS early, returns the length
+        # of the received packet or 0
+        symbols = RX_MIN_SYMBOLS + (2 * RX_WINDOW_MARGIN_MS * 1000) // self.symbol_us()
+        self.set_symbol_timeout(min(symbols, 0x3FF))
+
+        self.standby()
+        self.implicit_header_mode(False)
+        self.write_register(REG_FIFO_ADDR_PTR, self._rx_base)
+        self.write_register(REG_DIO_MAPPING_1, DIO0_RX_DONE)
+        self.write_register(REG_IRQ_FLAGS, 0xFF)
+
+        opens = utime.ticks_add(self._tx_done_ms, delay - RX_WINDOW_MARGIN_MS)
+        wait_ms = utime.ticks_diff(opens, utime.ticks_ms())
+        if wait_ms > 0:
+            if self._tx_wait == TX_WAIT_LIGHTSLEEP:
+                lightsleep(wait_ms)
+            else:
+                utime.sleep_ms(wait_ms)
+
+        self._rx_done = False
+        self._rx_window = True
+        self.set_mode(MODE_RX_SINGLE)
+
+        start = utime.ticks_ms()
+        timed_out = False
+        polled = start
+        while not self._rx_done:
+            now = utime.ticks_ms()
+            if utime.ticks_diff(now, start) >= RX_WINDOW_MAX_MS:
+                break
+            # RxTimeout on DIO1 if wired, otherwise from REG_IRQ_FLAGS
+            if self._pin_rx_timeout:
+                timed_out = self._pin_rx_timeout.value()
+            elif utime.ticks_diff(now, polled) >= RX_POLL_MS:
+                polled = now
+                irq_flags = self.read_register(REG_IRQ_FLAGS)
+                timed_out = irq_flags & IRQ_RX_TIME_OUT_MASK
+                self._rx_done = irq_flags & IRQ_RX_DONE_MASK != 0
+            if timed_out:
+                break
+            idle()
+        self._rx_window = False
+
+        irq_flags = self.read_register(REG_IRQ_FLAGS)
+        self.write_register(REG_IRQ_FLAGS, 0xFF)
+        if irq_flags & IRQ_RX_DONE_MASK and \
+           irq_flags & IRQ_PAYLOAD_CRC_ERROR_MASK == 0:
+            return self.read_payload_into(self._downlink_buf)
+
+        self.standby()
+        return 0
+
+    def symbol_us(self):
+        """ LoRa symbol time in microseconds at the current SF/bandwidth.
+        """
+        return (1 << self._sf) * 1000 // self._bw
+
+    def hop_period_for_dwell(self, dwell_ms):
+        """ Longest hop period, in symbols, that keeps each hop within
+            dwell_ms at the current data rate.
+        """
+        period = dwell_ms * 1000 // self.symbol_us()
+        if period < 1:
+            raise ValueError("Dwell time shorter than one symbol.")
+        return min(period, MAX_HOP_PERIOD)
+
+    def set_hopping(self, hop_table, hop_period):
+        """ Frequency hopping for long P2P packets: each packet starts on
+            hop_table[0] and the modem moves on every hop_period symbols;
+            the FhssChangeChannel IRQ on DIO2 loads the next channel, so a
+            long packet at high SF stays within the per-channel dwell
+            limit. hop_table holds FRF bytes like RX2_FREQUENCY, both ends
+            need the same table and period. None switches hopping off and
+            returns to the current channel.
+
+            Hops are written from the IRQ, so sending must wait for TxDone
+            on DIO0 rather than poll the IRQ flags over SPI. Duty cycle is
+            still booked on the channel of the packet.
+        """
+        if hop_table is None:
+            self._hop_frf = None
+            self.write_register(REG_HOP_PERIOD, 0)
+            if self._pin_fhss:
+                self._pin_fhss.irq(handler=None)
+            if self._actual_channel is not None:
+                self.set_frequency(self._actual_channel)
+            return
+
+        if not self._pin_fhss:
+            raise ValueError("Frequency hopping needs the dio_2 pin.")
+        if self._tx_wait == TX_WAIT_POLL or not self._pin_rx_done:
+            raise ValueError("Frequency hopping needs TxDone on dio_0.")
+        if not 0 < hop_period <= MAX_HOP_PERIOD:
+            raise ValueError("Hop period must be 1 to {} symbols.".format(
+                MAX_HOP_PERIOD))
+        if not 0 < len(hop_table) <= HOP_CHANNEL_MASK + 1:
+            raise ValueError("Hop table must have 1 to {} channels.".format(
+                HOP_CHANNEL_MASK + 1))
+
+        # bytes once, the IRQ only indexes
+        self._hop_frf = tuple(bytes(frf) for frf in hop_table)
+        self.write_register(REG_HOP_PERIOD, hop_period)
+        self.reset_hop()
+        self._pin_fhss.irq(
+            trigger=Pin.IRQ_RISING, handler = self._handle_fhss
+        )
+
+    def reset_hop(self):
+        """ Back to the first hop channel, where every packet starts.
+        """
+        if self._hop_frf:
+            self.write_registers(REG_FRF_MSB, self._hop_frf[0])
+
+    def _handle_fhss(self, event_source):
+        # FhssChangeChannel: load the channel the modem moved to
+        hop_frf = self._hop_frf
+        if not hop_frf:
+            return
+        channel = self.read_register(REG_HOP_CHANNEL) & HOP_CHANNEL_MASK
+        self.write_registers(REG_FRF_MSB, hop_frf[channel % len(hop_frf)])
+        self.write_register(REG_IRQ_FLAGS, IRQ_FHSS_CHANGE_CHANNEL_MASK)
+        self.hops += 1
+
+    def set_symbol_timeout(self, symbols):
+        # SymbTimeout: bits 9-8 in modem config 2, bits 7-0 in 0x1F
+        self.write_register(
+            REG_FEI_LSB,
+            (self.read_register(REG_FEI_LSB) & 0xfc) | ((symbols >> 8) & 0x03)
+        )
+        self.write_register(REG_PREAMBLE_DETECT, symbols & 0xff)
+
+    def on_receive(self, callback, schedule = True, lorawan = True):
+        """ Registers callback(lora, payload) for received packets. The IRQ
+            only queues them; with schedule they are handed over through
+            micropython.schedule, otherwise the application calls poll().
+
+            With lorawan only authenticated data downlinks for our DevAddr
+            reach the callback, decrypted; anything else is dropped in
+            the IRQ. lorawan=False hands over every packet received with
+            a valid CRC as is, for P2P and other non-LoRaWAN traffic.
+        """
         self._on_receive = callback
+        self._schedule_poll = schedule
+        self._rx_lorawan = lorawan
 
         if self._pin_rx_done:
             if callback:
-                print("callback attached")
-                self.write_register(REG_DIO_MAPPING_1, 0x00)
-                self._pin_rx_done.irq(
-                    trigger=Pin.IRQ_RISING, handler = self.handle_on_receive
-                )
-            else:
-                self._pin_rx_done.detach_irq()
-
+                if self._debug:
+                    print("callback attached")
+                self.write_register(REG_DIO_MAPPING_1, DIO0_RX_DONE)
+
+    def _handle_dio0(self, event_source):
+        # DIO0 is shared: CadDone and TxDone while sending, RxDone otherwise
+        if self._cad_pending:
+            return
+        if self._tx_pending:
+            self._tx_done_ms = utime.ticks_ms()
+            self._tx_done = True
+        elif self._rx_window:
+            self._rx_done = True
+        elif self._on_receive:
+            self.handle_on_receive(event_source)
 
     def handle_on_receive(self, event_source):
-        self.set_lock(True)              # lock until TX_Done
+        """ RxDone in interrupt context: latch the flags and copy the packet
+            into the receive ring, without allocating. Everything else
+            happens in poll().
+        """
+        irq_flags = self.read_register(REG_IRQ_FLAGS)
+        self.write_register(REG_IRQ_FLAGS, irq_flags)
+        if irq_flags & IRQ_RX_DONE_MASK == 0:
+            return
+        # the next packet starts on the first hop channel again
+        self.reset_hop()
+        if irq_flags & IRQ_PAYLOAD_CRC_ERROR_MASK:
+            self.rx_dropped += 1
+            return
+
+        slot = self._rx_ring.slot()
+        if slot is None:
+            self.rx_overflows += 1
+            return
 
-        aes = AES(
-            self._ttn_config.device_address,
-            self._ttn_config.app_key,
-            self._ttn_config.network_key,
-            self.frame_counter
+        self.write_register(
+            REG_FIFO_ADDR_PTR,
+            self.read_register(REG_FIFO_RX_CURRENT_ADDR)
         )
-
-        # irqFlags = self.getIrqFlags() should be 0x50
-        if (self.get_irq_flags() & IRQ_PAYLOAD_CRC_ERROR_MASK) == 0:
+        if self._implicit_header_mode:
+            packet_length = self.read_register(REG_PAYLOAD_LENGTH)
+        else:
+            packet_length = self.read_register(REG_RX_NB_BYTES)
+        # the whole slot in one burst, a view of packet_length would
+        # allocate; bytes past the packet are ignored
+        self.read_registers(REG_FIFO, slot)
+        # most frames in a shared field are for other nodes
+        if self._rx_lorawan and not self.downlink_for_us(slot, packet_length):
+            self.rx_foreign += 1
+            return
+        self._rx_ring.commit(
+            packet_length,
+            self.read_register(REG_PKT_RSSI_VALUE),
+            self.read_register(REG_PKT_SNR_VALUE)
+        )
+        self.rx_packets += 1
+
+        if self._schedule_poll and not self._poll_scheduled:
+            self._poll_scheduled = True
+            try:
+                schedule(self._poll_ref, None)
+            except RuntimeError:
+                # schedule queue full, the next IRQ or poll() catches up
+                self._poll_scheduled = False
+
+    def _scheduled_poll(self, _):
+        self._poll_scheduled = False
+        self.poll()
+
+    def poll(self):
+        """ Authenticates and decrypts the queued downlinks and hands
+            them to the on_receive callback, oldest first; raw packets
+            as received with on_receive(lorawan=False). The payload
+            view is only valid during the callback. Returns the number
+            of packets handled.
+        """
+        ring = self._rx_ring
+        buf = self._rx_payload
+        handled = 0
+        while len(ring):
+            packet, slot = ring.peek()
+            length = len(packet)
+            buf[:length] = packet
+            rssi_value = ring.rssi[slot]
+            snr_value = ring.snr[slot]
+            ring.release()
+            handled += 1
+
+            if self._rx_lorawan:
+                payload = self.open_downlink(buf, length)
+                if payload is None:
+                    continue
+                self.downlink_received(buf, length, payload, rssi_value,
+                                       snr_value)
+            else:
+                payload = memoryview(buf)[:length]
+                self.record_link_quality(rssi_value, snr_value)
             if self._on_receive:
-                payload = self.read_payload()
-                self.set_lock(False)     # unlock when done reading
-                data = aes.decrypt_payload(payload)
-                self._on_receive(self, data)
+                self._on_receive(self, payload)
 
-        self.set_lock(False)             # unlock in any case.
-        self.collect_garbage()
+        if handled:
+            self.apply_gc_policy()
+        return handled
 
     """
     def handle_on_receive(self, event_source):
@@ -643,8 +1972,15 @@ class SX127x:
             )
 
     def read_payload(self):
+        payload = bytearray(MAX_PKT_LENGTH)
+        packet_length = self.read_payload_into(payload)
+        return bytes(payload[:packet_length])
+
+    def read_payload_into(self, buffer):
+        """ Reads the last received packet into a caller supplied buffer.
+            Returns the number of bytes copied, truncated to len(buffer).
+        """
         # set FIFO address to current RX address
-        # fifo_rx_current_addr = self.read_register(REG_FIFO_RX_CURRENT_ADDR)
         self.write_register(
             REG_FIFO_ADDR_PTR, 
             self.read_register(REG_FIFO_RX_CURRENT_ADDR)
@@ -655,41 +1991,187 @@ class SX127x:
             packet_length = self.read_register(REG_PAYLOAD_LENGTH)  
         else:
             packet_length = self.read_register(REG_RX_NB_BYTES)
+        packet_length = min(packet_length, len(buffer))
+
+        if self.burst_fifo:
+            self.read_fifo(buffer, packet_length)
+        else:
+            for i in range(packet_length):
+                buffer[i] = self.read_register(REG_FIFO)
 
-        payload = bytearray()
-        for i in range(packet_length):
-            payload.append(self.read_register(REG_FIFO))
+        return packet_length
 
-        self.collect_garbage()
-        return bytes(payload)
 
+    def _record(self, address, length):
+        # compile_profile: note the registers set by the configuration
+        for i in range(address, address + length):
+            if not SHADOW_MAP[i]:
+                raise ValueError(
+                    "Register 0x{:02X} cannot be part of a profile.".format(i))
+            self._recording[i] = 1
 
     def read_register(self, address, byteorder = 'big', signed = False):
-        response = self.transfer(address & 0x7f)
-        return int.from_bytes(response, byteorder)
+        if self._shadow_enabled and self._shadow_valid[address]:
+            self.shadow_reads_saved += 1
+            return self._shadow[address]
+
+        value = self.transfer(address & 0x7f)
+        if self._shadow_enabled and SHADOW_MAP[address]:
+            self._shadow[address] = value
+            self._shadow_valid[address] = 1
+        return value
 
     def write_register(self, address, value):
+        if self._recording is not None:
+            self._record(address, 1)
+        if self._shadow_enabled and SHADOW_MAP[address]:
+            if self._shadow_valid[address] and self._shadow[address] == value:
+                self.shadow_writes_saved += 1
+                return
+            self._shadow[address] = value
+            self._shadow_valid[address] = 1
+            if self._staging:
+                return
+
         self.transfer(address | 0x80, value)
 
-    def transfer(self, address, value = 0x00):
-        response = bytearray(1)
+    def read_registers(self, address, buffer):
+        """ Burst reads len(buffer) consecutive registers starting at address.
+            REG_FIFO does not auto-increment, so this also drains the FIFO.
+        """
+        n = len(buffer)
+        if self._shadow_enabled and address and self._shadowed(address, n):
+            for i in range(n):
+                buffer[i] = self._shadow[address + i]
+            self.shadow_reads_saved += 1
+            return
+
+        self._addr_buf[0] = address & 0x7f
+        self._pin_ss.value(0)
+        self._spi.write(self._addr_buf)
+        self._spi.readinto(buffer)
+        self._pin_ss.value(1)
+        self.spi_transactions += 1
 
+    def write_registers(self, address, buffer):
+        """ Burst writes buffer to consecutive registers starting at address.
+        """
+        if self._recording is not None:
+            self._record(address, len(buffer))
+        if self._shadow_enabled and address:
+            n = len(buffer)
+            if self._shadowed(address, n, buffer):
+                self.shadow_writes_saved += 1
+                return
+            staged = self._staging
+            for i in range(n):
+                if SHADOW_MAP[address + i]:
+                    self._shadow[address + i] = buffer[i]
+                    self._shadow_valid[address + i] = 1
+                else:
+                    staged = False
+            if staged:
+                return
+
+        self._burst_write(address, buffer)
+
+    def _burst_write(self, address, buffer):
+        self._addr_buf[0] = address | 0x80
         self._pin_ss.value(0)
+        self._spi.write(self._addr_buf)
+        self._spi.write(buffer)
+        self._pin_ss.value(1)
+        self.spi_transactions += 1
+
+    def _shadowed(self, address, length, buffer = None):
+        # True if the whole range is held in the shadow (and equals buffer)
+        for i in range(length):
+            if not self._shadow_valid[address + i]:
+                return False
+            if buffer is not None and self._shadow[address + i] != buffer[i]:
+                return False
+        return True
+
+    def resync(self):
+        """ Reloads the register shadow from the chip, call after a reset
+            or whenever the chip may have been reconfigured behind the
+            driver's back.
+        """
+        if not self._shadow_enabled:
+            return
+
+        # registers 0x01-0x7F in one burst, skipping the FIFO
+        self._shadow_enabled = False
+        self.read_registers(REG_OP_MODE, memoryview(self._shadow)[1:])
+        self._shadow_enabled = True
 
-        self._spi.write(bytes([address]))
-        self._spi.write_readinto(bytes([value]), response)
+        for i in range(128):
+            self._shadow_valid[i] = SHADOW_MAP[i]
+
+    def begin_config(self):
+        """ Starts a staged configuration: the shadow is loaded from the
+            chip and subsequent configuration register writes only update
+            the shadow until commit_config().
+        """
+        self._shadow_enabled = True
+        self.resync()
+        self._chip_image[:] = self._shadow
+        self._staging = True
+
+    def commit_config(self):
+        """ Writes the staged registers that differ from the chip, runs of
+            consecutive registers in one burst. Returns the number of
+            registers written.
+        """
+        self._staging = False
+        written = 0
+        i = 1
+        while i < 128:
+            if not SHADOW_MAP[i] or self._shadow[i] == self._chip_image[i]:
+                i += 1
+                continue
+            start = i
+            while i < 128 and SHADOW_MAP[i] and \
+                  self._shadow[i] != self._chip_image[i]:
+                i += 1
+            self._burst_write(start, memoryview(self._shadow)[start:i])
+            written += i - start
+
+        if not self._register_shadow:
+            self._shadow_enabled = False
+            for i in range(128):
+                self._shadow_valid[i] = 0
+        return written
 
+    def transfer(self, address, value = 0x00):
+        """ Single register access: address and value are clocked out in
+            one write_readinto using preallocated buffers, returns the
+            register value.
+        """
+        self._tx_buf[0] = address
+        self._tx_buf[1] = value
+
+        self._pin_ss.value(0)
+        self._spi.write_readinto(self._tx_buf, self._rx_buf)
         self._pin_ss.value(1)
+        self.spi_transactions += 1
 
-        return response
+        return self._rx_buf[1]
 
     def blink_led(self, times = 1, on_seconds = 0.1, off_seconds = 0.1):
-        for i in range(times):
-            if self._led_status:
-                self._led_status.value(True)
-                utime.sleep(on_seconds)
-                self._led_status.value(False)
-                utime.sleep(off_seconds)
+        # non-blocking, the pattern runs from the StatusLEDs timer
+        self._leds.blink(
+            "radio", times, int(on_seconds * 1000), int(off_seconds * 1000)
+        )
+
+    def apply_gc_policy(self):
+        """ Called once per sent or received packet.
+        """
+        if self._gc_policy == GC_AFTER_PACKETS:
+            self._gc_packets += 1
+            if self._gc_packets >= self._gc_interval:
+                self._gc_packets = 0
+                self.collect_garbage()
 
     def collect_garbage(self):
         gc.collect()
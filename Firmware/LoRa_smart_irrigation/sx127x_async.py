@@ -0,0 +1,138 @@
+import gc
+import utime
+import uasyncio as asyncio
+from machine import Pin
+from sx127x import (
+    MAX_PKT_LENGTH, MODE_SETTLE_MS, MODE_STDBY, MODE_SLEEP,
+    IRQ_RX_DONE_MASK, IRQ_PAYLOAD_CRC_ERROR_MASK,
+)
+
+
+class AsyncSX127x:
+    """ uasyncio front end for an SX127x radio.
+
+        Takes over the DIO0 interrupt of the wrapped driver: TxDone and
+        RxDone wake the waiting task through a ThreadSafeFlag, so sensor
+        and pump tasks keep running while a packet is in flight.
+    """
+    def __init__(self, lora):
+        self.lora = lora
+        self._tx_flag = asyncio.ThreadSafeFlag()
+        self._rx_flag = asyncio.ThreadSafeFlag()
+        self._rx_buf = bytearray(MAX_PKT_LENGTH)
+
+        if not lora._pin_rx_done:
+            raise ValueError("AsyncSX127x needs the dio_0 pin.")
+        lora._pin_rx_done.irq(
+            trigger=Pin.IRQ_RISING, handler = self._handle_dio0
+        )
+
+    def _handle_dio0(self, event_source):
+        if self.lora._cad_pending:
+            return
+        if self.lora._tx_pending:
+            self.lora._tx_done_ms = utime.ticks_ms()
+            self.lora._tx_done = True
+            self._tx_flag.set()
+        elif self.lora._rx_window:
+            # Class A window of the driver, not for the packet stream
+            self.lora._rx_done = True
+        else:
+            self._rx_flag.set()
+
+    async def standby(self):
+        self.lora.set_mode(MODE_STDBY)
+        await asyncio.sleep_ms(MODE_SETTLE_MS)
+
+    async def sleep(self):
+        self.lora.set_mode(MODE_SLEEP)
+        await asyncio.sleep_ms(MODE_SETTLE_MS)
+
+    async def receive(self, size = 0):
+        self.lora.receive(size)
+
+    async def send_data(self, data, data_length, frame_counter, timeout=5,
+                        confirmed=False):
+        alloc = gc.mem_alloc()
+
+        lora_pkt, lora_pkt_len = self.lora.build_packet(
+            data, data_length, frame_counter, confirmed
+        )
+        await self.send_packet(lora_pkt, lora_pkt_len, timeout)
+        self.lora.uplink_sent()
+
+        self.lora.last_send_alloc = gc.mem_alloc() - alloc
+        self.lora.apply_gc_policy()
+
+    async def send_packet(self, lora_packet, packet_length, timeout=5):
+        """ Sends a LoRa packet, yielding to other tasks until TxDone.
+        """
+        lora = self.lora
+        lora.set_lock(True)
+
+        try:
+            lora._preloaded = None  # overwritten in the FIFO
+            await self.standby()
+            lora.prepare_packet()
+            if lora._listen_before_talk:
+                await self.listen_before_talk()
+            lora.write(lora_packet, packet_length)
+
+            self._tx_flag.clear()
+            lora.start_transmit()
+            try:
+                await asyncio.wait_for_ms(
+                    self._tx_flag.wait(), int(timeout * 1000)
+                )
+            except asyncio.TimeoutError:
+                raise RuntimeError("Timeout during packet send")
+            finally:
+                lora.finish_transmit()
+        finally:
+            lora.set_lock(False)
+
+        lora.blink_led()
+
+    async def listen_before_talk(self):
+        """ SX127x.listen_before_talk, yielding during the backoff.
+        """
+        lora = self.lora
+        for attempt in range(lora._cad_retries + 1):
+            if not lora.channel_activity():
+                return attempt
+            if attempt < lora._cad_retries:
+                await asyncio.sleep_ms(lora.cad_backoff_ms(attempt))
+                if lora._channel is None:
+                    lora.prepare_packet()
+        raise RuntimeError("Channel busy after {} CAD attempts".format(
+            lora._cad_retries + 1))
+
+    def packets(self):
+        """ Receive stream: `async for packet in radio.packets()` yields
+            the raw PHYPayload of every frame received with a valid CRC.
+        """
+        return _PacketStream(self)
+
+    async def read_packet(self):
+        while True:
+            await self._rx_flag.wait()
+
+            irq_flags = self.lora.get_irq_flags()
+            if irq_flags & IRQ_RX_DONE_MASK:
+                self.lora.reset_hop()
+            if irq_flags & IRQ_RX_DONE_MASK and \
+               irq_flags & IRQ_PAYLOAD_CRC_ERROR_MASK == 0:
+                packet_length = self.lora.read_payload_into(self._rx_buf)
+                return bytes(self._rx_buf[:packet_length])
+
+
+class _PacketStream:
+
+    def __init__(self, radio):
+        self._radio = radio
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self._radio.read_packet()
@@ -0,0 +1,75 @@
+# Host test setup: MicroPython modules come from tests/stubs, the radio
+# is the register model in fake_radio.py.
+import gc
+import os
+import sys
+import types
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, 'stubs'))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.dirname(HERE))
+
+# MicroPython gc extras
+gc.mem_alloc = lambda: 0
+gc.mem_free = lambda: 100000
+gc.threshold = lambda *args: None
+
+# the device keeps the frequency plans in a ttn package
+import ttn_eu  # noqa: E402
+ttn = types.ModuleType('ttn')
+ttn.ttn_eu = ttn_eu
+sys.modules['ttn'] = ttn
+sys.modules['ttn.ttn_eu'] = ttn_eu
+
+import machine  # noqa: E402
+import micropython  # noqa: E402
+from fake_radio import FakeRadio  # noqa: E402
+
+DEVADDR = bytearray([0x26, 0x01, 0x02, 0x03])
+NWKEY = bytearray(range(16))
+APPKEY = bytearray(range(16, 32))
+PINS = {'ss': 1, 'reset': 0, 'dio_0': 5, 'led': 18}
+PARAMETERS = {
+    'tx_power_level': 2,
+    'signal_bandwidth': 'SF7BW125',
+    'spreading_factor': 7,
+    'coding_rate': 5,
+    'sync_word': 0x34,
+    'implicit_header': False,
+    'preamble_length': 8,
+    'enable_CRC': True,
+    'invert_IQ': False,
+}
+
+
+@pytest.fixture
+def radio():
+    machine.RADIOS.clear()
+    machine._pins.clear()
+    micropython._queue.clear()
+    return FakeRadio()
+
+
+@pytest.fixture
+def make_lora(radio):
+    """ Builds an SX127x on the fake radio (or the one on spi_unit),
+        keyword arguments go to the driver.
+    """
+    import sx127x
+    from machine import SPI
+
+    def make(spi_unit=0, pins=PINS, **kwargs):
+        kwargs.setdefault('duty_cycle', False)
+        kwargs.setdefault('lora_parameters', dict(PARAMETERS))
+        session = sx127x.TTN(DEVADDR, NWKEY, APPKEY, country='EU')
+        return sx127x.SX127x(SPI(spi_unit), pins=dict(pins),
+                             ttn_config=session, **kwargs)
+    return make
+
+
+@pytest.fixture
+def lora(make_lora):
+    return make_lora()
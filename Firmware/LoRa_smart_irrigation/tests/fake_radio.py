@@ -0,0 +1,174 @@
+# Register-level SX127x model for host tests: enough of the LoRa modem
+# for the driver's SPI traffic, FIFO, IRQ flags and mode changes.
+import machine
+import utime
+
+REG_FIFO = 0x00
+REG_OP_MODE = 0x01
+REG_FIFO_ADDR_PTR = 0x0D
+REG_FIFO_TX_BASE_ADDR = 0x0E
+REG_FIFO_RX_BASE_ADDR = 0x0F
+REG_FIFO_RX_CURRENT_ADDR = 0x10
+REG_IRQ_FLAGS = 0x12
+REG_RX_NB_BYTES = 0x13
+REG_PKT_SNR_VALUE = 0x19
+REG_PKT_RSSI_VALUE = 0x1A
+REG_PAYLOAD_LENGTH = 0x22
+REG_DIO_MAPPING_1 = 0x40
+REG_VERSION = 0x42
+
+MODE_STDBY = 0x01
+MODE_TX = 0x03
+MODE_RX_SINGLE = 0x06
+MODE_CAD = 0x07
+
+IRQ_CAD_DETECTED = 0x01
+IRQ_CAD_DONE = 0x04
+IRQ_TX_DONE = 0x08
+IRQ_RX_DONE = 0x40
+IRQ_RX_TIMEOUT = 0x80
+
+TX_MS = 50
+RX_WINDOW_MS = 30
+CAD_MS = 5
+
+
+class FakeRadio:
+    """ One SX127x behind SPI unit spi with chip select on pin ss, reset
+        on pin rst and DIO0 on pin dio0.
+
+        tx_frames collects every frame sent, downlinks queued with
+        queue_downlink() are delivered in the next RX_SINGLE window and
+        inject() puts a packet into the FIFO as if just received.
+    """
+    def __init__(self, spi=0, ss=1, rst=0, dio0=5):
+        self.ss = ss
+        self.rst = rst
+        self.dio0 = dio0
+        self.transactions = 0
+        self.tx_frames = []
+        self.downlinks = []
+        self.cad_busy = []
+        self.rx_windows = 0
+        self._pending = None
+        self.reset()
+        machine.RADIOS[spi] = self
+
+    def reset(self):
+        self.r = bytearray(128)
+        self.fifo = bytearray(256)
+        self.r[REG_VERSION] = 0x12
+        self.r[REG_OP_MODE] = 0x09
+        self.r[0x0C] = 0x20
+        self.r[0x1D] = 0x72
+        self.r[0x1E] = 0x70
+        self.r[0x21] = 0x08
+        self.r[REG_PAYLOAD_LENGTH] = 0x01
+        self.r[0x39] = 0x12
+        self._address = None
+
+    def pin_changed(self, n, value):
+        if n == self.ss and value == 0:
+            # chip select low starts a transaction
+            self._address = None
+            self.transactions += 1
+        elif n == self.rst and value == 0:
+            self.reset()
+
+    def xfer(self, data):
+        out = bytearray()
+        for b in data:
+            if self._address is None:
+                self._address = b
+                out.append(0)
+                continue
+            address = self._address & 0x7F
+            if self._address & 0x80:
+                self._write(address, b)
+                out.append(0)
+            else:
+                out.append(self._read(address))
+            # burst access auto-increments, except on the FIFO
+            if address != REG_FIFO:
+                self._address = (self._address & 0x80) | ((address + 1) & 0x7F)
+        return bytes(out)
+
+    def _read(self, address):
+        self.tick()
+        if address == REG_FIFO:
+            value = self.fifo[self.r[REG_FIFO_ADDR_PTR]]
+            self.r[REG_FIFO_ADDR_PTR] = (self.r[REG_FIFO_ADDR_PTR] + 1) & 0xFF
+            return value
+        return self.r[address]
+
+    def _write(self, address, value):
+        if address == REG_FIFO:
+            self.fifo[self.r[REG_FIFO_ADDR_PTR]] = value
+            self.r[REG_FIFO_ADDR_PTR] = (self.r[REG_FIFO_ADDR_PTR] + 1) & 0xFF
+            return
+        if address == REG_IRQ_FLAGS:
+            # write 1 to clear
+            self.r[address] &= ~value & 0xFF
+            return
+        self.r[address] = value
+        if address == REG_OP_MODE and value & 0x80:
+            self._mode_changed(value & 0x07)
+
+    def _mode_changed(self, mode):
+        now = utime.ticks_ms()
+        if mode == MODE_TX:
+            base = self.r[REG_FIFO_TX_BASE_ADDR]
+            length = self.r[REG_PAYLOAD_LENGTH]
+            self.tx_frames.append(bytes(self.fifo[base:base + length]))
+            self._pending = ('tx', now + TX_MS)
+        elif mode == MODE_RX_SINGLE:
+            self.rx_windows += 1
+            if self.downlinks and self.downlinks[0][0] <= self.rx_windows:
+                self._pending = ('rx', now + RX_WINDOW_MS)
+            else:
+                self._pending = ('rx_timeout', now + RX_WINDOW_MS)
+        elif mode == MODE_CAD:
+            self._pending = ('cad', now + CAD_MS)
+
+    def _standby(self):
+        self.r[REG_OP_MODE] = (self.r[REG_OP_MODE] & 0xF8) | MODE_STDBY
+
+    def _dio0_mapping(self):
+        return self.r[REG_DIO_MAPPING_1] >> 6
+
+    def tick(self):
+        """ Completes the pending operation once its time has come. """
+        if not self._pending or utime.ticks_ms() < self._pending[1]:
+            return
+        kind = self._pending[0]
+        self._pending = None
+        self._standby()
+        if kind == 'tx':
+            self.r[REG_IRQ_FLAGS] |= IRQ_TX_DONE
+            if self._dio0_mapping() == 1:
+                machine.fire(self.dio0)
+        elif kind == 'rx_timeout':
+            self.r[REG_IRQ_FLAGS] |= IRQ_RX_TIMEOUT
+        elif kind == 'rx':
+            self.inject(self.downlinks.pop(0)[1])
+        elif kind == 'cad':
+            self.r[REG_IRQ_FLAGS] |= IRQ_CAD_DONE
+            if self.cad_busy and self.cad_busy.pop(0):
+                self.r[REG_IRQ_FLAGS] |= IRQ_CAD_DETECTED
+            if self._dio0_mapping() == 2:
+                machine.fire(self.dio0)
+
+    def queue_downlink(self, packet, window=1):
+        """ Delivers packet in the window-th RX_SINGLE window from now. """
+        self.downlinks.append((self.rx_windows + window, bytes(packet)))
+
+    def inject(self, packet, rssi=60, snr=20):
+        base = self.r[REG_FIFO_RX_BASE_ADDR]
+        self.fifo[base:base + len(packet)] = packet
+        self.r[REG_FIFO_RX_CURRENT_ADDR] = base
+        self.r[REG_RX_NB_BYTES] = len(packet)
+        self.r[REG_IRQ_FLAGS] |= IRQ_RX_DONE
+        self.r[REG_PKT_RSSI_VALUE] = rssi
+        self.r[REG_PKT_SNR_VALUE] = snr & 0xFF
+        if self._dio0_mapping() == 0:
+            machine.fire(self.dio0)
@@ -0,0 +1,28 @@
+# LoRaWAN downlinks for the test session in conftest.py.
+from encryption_aes import SessionCrypto
+
+from conftest import APPKEY, DEVADDR, NWKEY
+
+UNCONFIRMED_DATA_DOWN = 0x60
+CONFIRMED_DATA_DOWN = 0xA0
+
+
+def downlink(fcnt, fport=1, payload=b'', fopts=b'', fctrl=0,
+             mtype=UNCONFIRMED_DATA_DOWN, devaddr=DEVADDR):
+    """ PHYPayload of a data downlink, FRMPayload encrypted and MIC set
+        with the test session keys. fport None leaves FPort out.
+    """
+    session = SessionCrypto(devaddr, APPKEY, NWKEY)
+    packet = bytearray([mtype])
+    packet += bytes(reversed(devaddr))
+    packet.append(fctrl | len(fopts))
+    packet += bytes([fcnt & 0xFF, (fcnt >> 8) & 0xFF])
+    packet += fopts
+    if fport is not None:
+        packet.append(fport)
+        start = len(packet)
+        packet += payload
+        session.encrypt(fcnt, packet, len(payload), direction=1,
+                        offset=start, network=fport == 0)
+    packet += session.mic(fcnt, packet, len(packet), direction=1)
+    return bytes(packet)
@@ -0,0 +1,27 @@
+# RPi.GPIO for the Raspberry Pi sample driver, DIO callbacks are
+# called directly by the tests.
+BCM = 11
+IN = 1
+OUT = 0
+PUD_DOWN = 21
+RISING = 31
+
+
+def setmode(mode):
+    pass
+
+
+def setup(pin, direction, pull_up_down=None):
+    pass
+
+
+def output(pin, value):
+    pass
+
+
+def add_event_detect(pin, edge, callback=None, bouncetime=None):
+    pass
+
+
+def cleanup():
+    pass
@@ -0,0 +1,63 @@
+# Plain AES-128 block encryption (FIPS-197) for the ucryptolib stub.
+
+
+def _xtime(a):
+    return ((a << 1) ^ 0x1B) & 0xFF if a & 0x80 else a << 1
+
+
+def _sbox():
+    sbox = [0] * 256
+    p = q = 1
+    sbox[0] = 0x63
+    while True:
+        # p runs through the multiplicative group, q is its inverse
+        p = p ^ ((p << 1) & 0xFF) ^ (0x1B if p & 0x80 else 0)
+        q ^= q << 1
+        q ^= q << 2
+        q ^= q << 4
+        q &= 0xFF
+        if q & 0x80:
+            q ^= 0x09
+        x = q
+        for shift in (1, 2, 3, 4):
+            x ^= ((q << shift) | (q >> (8 - shift))) & 0xFF
+        sbox[p] = x ^ 0x63
+        if p == 1:
+            return sbox
+
+
+SBOX = _sbox()
+
+
+def expand_key(key):
+    words = [list(key[i:i + 4]) for i in range(0, 16, 4)]
+    rcon = 1
+    for i in range(4, 44):
+        word = list(words[i - 1])
+        if i % 4 == 0:
+            word = [SBOX[b] for b in word[1:] + word[:1]]
+            word[0] ^= rcon
+            rcon = _xtime(rcon)
+        words.append([words[i - 4][j] ^ word[j] for j in range(4)])
+    return [sum(words[r * 4:r * 4 + 4], []) for r in range(11)]
+
+
+def encrypt_block(round_keys, block):
+    state = [b ^ k for b, k in zip(block, round_keys[0])]
+    for r in range(1, 11):
+        state = [SBOX[b] for b in state]
+        # ShiftRows on the column-major state
+        state = [state[(i + 4 * (i % 4)) % 16] for i in range(16)]
+        if r != 10:
+            mixed = []
+            for c in range(4):
+                a = state[c * 4:c * 4 + 4]
+                mixed += [
+                    _xtime(a[0]) ^ _xtime(a[1]) ^ a[1] ^ a[2] ^ a[3],
+                    a[0] ^ _xtime(a[1]) ^ _xtime(a[2]) ^ a[2] ^ a[3],
+                    a[0] ^ a[1] ^ _xtime(a[2]) ^ _xtime(a[3]) ^ a[3],
+                    _xtime(a[0]) ^ a[0] ^ a[1] ^ a[2] ^ _xtime(a[3]),
+                ]
+            state = mixed
+        state = [b ^ k for b, k in zip(state, round_keys[r])]
+    return bytes(state)
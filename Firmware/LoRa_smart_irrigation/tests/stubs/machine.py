@@ -0,0 +1,111 @@
+# Pin, SPI and friends on top of the register-level radio model in
+# fake_radio.py: chip select frames SPI transactions, the reset pin
+# resets the model and DIO pins fire their IRQ handlers.
+import utime
+
+_pins = {}
+RADIOS = {}  # SPI unit -> FakeRadio
+
+
+def idle():
+    utime.sleep_us(100)
+    _tick()
+
+
+def lightsleep(ms=0):
+    utime.sleep_ms(ms)
+    _tick()
+
+
+def _tick():
+    for radio in RADIOS.values():
+        radio.tick()
+
+
+def disable_irq():
+    return 0
+
+
+def enable_irq(state):
+    pass
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_RISING = 1
+    IRQ_FALLING = 2
+
+    def __init__(self, n, mode=0, pull=None, value=None):
+        self.n = n
+        self._value = 0
+        self.handler = None
+        _pins.setdefault(n, []).append(self)
+
+    def value(self, v=None):
+        if v is None:
+            return self._value
+        self._value = int(bool(v))
+        for radio in RADIOS.values():
+            radio.pin_changed(self.n, self._value)
+
+    __call__ = value
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    def toggle(self):
+        self.value(1 - self._value)
+
+    def irq(self, trigger=None, handler=None, hard=False):
+        self.handler = handler
+
+
+def fire(n):
+    """ Rising edge on pin n: runs the IRQ handlers attached to it. """
+    for pin in _pins.get(n, []):
+        if pin.handler:
+            pin.handler(pin)
+
+
+class SPI:
+    MSB = 0
+
+    def __init__(self, unit=0, *args, **kwargs):
+        self.unit = unit
+
+    def write(self, buf):
+        RADIOS[self.unit].xfer(bytes(buf))
+
+    def readinto(self, buf, write=0):
+        buf[:] = RADIOS[self.unit].xfer(bytes([write] * len(buf)))
+
+    def write_readinto(self, write_buf, read_buf):
+        read_buf[:] = RADIOS[self.unit].xfer(bytes(write_buf))
+
+
+class Timer:
+    PERIODIC = 1
+    ONE_SHOT = 0
+
+    def __init__(self, *args, **kwargs):
+        self.callback = None
+
+    def init(self, mode=1, period=0, freq=0, callback=None):
+        self.callback = callback
+
+    def deinit(self):
+        self.callback = None
+
+
+class ADC:
+    def __init__(self, pin):
+        pass
+
+    def read_u16(self):
+        return 40000
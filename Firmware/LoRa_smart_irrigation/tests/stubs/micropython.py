@@ -0,0 +1,32 @@
+# Scheduled callbacks queue up until run_scheduled(), like the soft
+# IRQ queue between bytecodes on the device.
+_queue = []
+SCHEDULE_DEPTH = 8
+
+
+def schedule(func, arg):
+    if len(_queue) >= SCHEDULE_DEPTH:
+        raise RuntimeError('schedule queue full')
+    _queue.append((func, arg))
+
+
+def run_scheduled():
+    while _queue:
+        func, arg = _queue.pop(0)
+        func(arg)
+
+
+def const(x):
+    return x
+
+
+def alloc_emergency_exception_buf(size):
+    pass
+
+
+def native(f):
+    return f
+
+
+def viper(f):
+    return f
@@ -0,0 +1,20 @@
+# spidev for the Raspberry Pi sample driver, on top of the radio model:
+# each xfer() is one chip select framed transaction.
+import machine
+
+
+class SpiDev:
+    def __init__(self):
+        self.bus = None
+        self.max_speed_hz = 0
+
+    def open(self, bus, device):
+        self.bus = bus
+
+    def close(self):
+        pass
+
+    def xfer(self, data):
+        radio = machine.RADIOS[self.bus]
+        radio.pin_changed(radio.ss, 0)
+        return list(radio.xfer(bytes(data)))
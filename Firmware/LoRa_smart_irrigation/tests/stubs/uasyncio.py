@@ -0,0 +1,25 @@
+import asyncio as _asyncio
+from asyncio import *  # noqa: F401,F403
+
+
+async def sleep_ms(ms):
+    await _asyncio.sleep(ms / 1000)
+
+
+async def wait_for_ms(awaitable, ms):
+    return await _asyncio.wait_for(awaitable, ms / 1000)
+
+
+class ThreadSafeFlag:
+    def __init__(self):
+        self._event = _asyncio.Event()
+
+    def set(self):
+        self._event.set()
+
+    def clear(self):
+        self._event.clear()
+
+    async def wait(self):
+        await self._event.wait()
+        self._event.clear()
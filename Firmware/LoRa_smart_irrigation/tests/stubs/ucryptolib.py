@@ -0,0 +1,18 @@
+# ucryptolib.aes in ECB mode (mode 1), the only mode the driver uses.
+import aes_reference
+
+
+class aes:
+    def __init__(self, key, mode, iv=None):
+        if mode != 1:
+            raise ValueError('only ECB')
+        self._round_keys = aes_reference.expand_key(bytes(key))
+
+    def encrypt(self, data, out=None):
+        result = bytearray()
+        for i in range(0, len(data), 16):
+            result += aes_reference.encrypt_block(
+                self._round_keys, bytes(data[i:i + 16]))
+        if out is None:
+            return bytes(result)
+        out[:len(result)] = result
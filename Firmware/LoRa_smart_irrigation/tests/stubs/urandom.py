@@ -0,0 +1 @@
+from random import getrandbits, randint, random, seed  # noqa: F401
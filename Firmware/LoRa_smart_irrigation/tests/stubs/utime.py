@@ -0,0 +1,35 @@
+# Virtual clock: sleeping advances time instantly, so timeouts and
+# duty-cycle waits run at host speed and reproducibly.
+_now_us = [1000000]
+
+
+def ticks_us():
+    return _now_us[0]
+
+
+def ticks_ms():
+    return _now_us[0] // 1000
+
+
+def time():
+    return _now_us[0] // 1000000
+
+
+def ticks_diff(a, b):
+    return a - b
+
+
+def ticks_add(a, b):
+    return a + b
+
+
+def sleep_us(us):
+    _now_us[0] += int(us)
+
+
+def sleep_ms(ms):
+    _now_us[0] += int(ms * 1000)
+
+
+def sleep(s):
+    _now_us[0] += int(s * 1000000)
@@ -0,0 +1,95 @@
+# [user-012] ADR: node side stepping, backoff, LinkADRReq answers
+import pytest
+
+from adr import ADR_ACK_LIMIT, ADR_ACK_DELAY, FCTRL_ADR, FCTRL_ADR_ACK_REQ
+from conftest import PARAMETERS
+
+
+def test_backoff_sequence(make_lora):
+    lora = make_lora(adr=True)
+    adr = lora.adr
+    assert (adr.data_rate, adr.tx_power) == (5, 7)
+
+    for _ in range(ADR_ACK_LIMIT - 1):
+        adr.on_uplink()
+    assert adr.fctrl() == FCTRL_ADR
+    adr.on_uplink()
+    assert adr.fctrl() == FCTRL_ADR | FCTRL_ADR_ACK_REQ
+
+    # ADR_ACK_DELAY later: full power first
+    for _ in range(ADR_ACK_DELAY):
+        adr.on_uplink()
+    assert (adr.data_rate, adr.tx_power) == (5, 0)
+    assert lora._data_rate == 'SF7BW125'
+    # then one DR lower every ADR_ACK_DELAY
+    for _ in range(ADR_ACK_DELAY):
+        adr.on_uplink()
+    assert adr.data_rate == 4
+    assert lora._data_rate == 'SF8BW125'
+    for _ in range(ADR_ACK_DELAY - 1):
+        adr.on_uplink()
+    assert adr.data_rate == 4
+
+    # any downlink ends the backoff
+    adr.on_downlink(b'', 0, 0.0)
+    assert adr.fctrl() == FCTRL_ADR
+    assert adr.adr_ack_cnt == 0
+
+
+def test_backoff_stops_at_dr0(make_lora):
+    lora = make_lora(adr=True)
+    adr = lora.adr
+    adr.tx_power, adr.data_rate = 0, 0
+    lora.set_data_rate('SF12BW125')
+    for _ in range(ADR_ACK_LIMIT + 4 * ADR_ACK_DELAY):
+        adr.on_uplink()
+    assert (adr.data_rate, adr.tx_power) == (0, 0)
+
+
+@pytest.mark.parametrize('request_byte, status', [
+    (0x30, 0x07),  # DR3, power 0
+    (0xFF, 0x07),  # keep both
+    (0x70, 0x05),  # DR7 not in EU868
+    (0x38, 0x03),  # power index 8 does not exist
+    (0x78, 0x01),  # neither
+])
+def test_link_adr_req_status_bits(make_lora, request_byte, status):
+    lora = make_lora(adr=True)
+    adr = lora.adr
+    before = (adr.data_rate, adr.tx_power, lora._data_rate)
+    assert adr.link_adr_req(request_byte) == status
+    assert bytes(lora._fopts[:lora._fopts_len]) == bytes([0x03, status])
+    if status != 0x07 or request_byte == 0xFF:
+        # rejected requests change nothing
+        assert (adr.data_rate, adr.tx_power, lora._data_rate) == before
+    else:
+        assert (adr.data_rate, adr.tx_power) == (3, 0)
+        assert lora._data_rate == 'SF9BW125'
+
+
+def test_margin_steps_data_rate_then_power(make_lora):
+    parameters = dict(PARAMETERS, signal_bandwidth='SF9BW125', spreading_factor=9)
+    lora = make_lora(adr=True, lora_parameters=parameters)
+    adr = lora.adr
+    adr.tx_power = 0
+    # 10 dB SNR at SF9: 12.5 dB over the 10 dB reserve, four 3 dB steps
+    for _ in range(7):
+        adr.on_downlink(b'', 0, 10.0)
+    assert adr.data_rate == 3
+    adr.on_downlink(b'', 0, 10.0)
+    assert (adr.data_rate, adr.tx_power) == (5, 2)
+    assert lora._data_rate == 'SF7BW125'
+
+    # short of margin at SF7: power goes back up
+    for _ in range(8):
+        adr.on_downlink(b'', 0, -6.0)
+    assert (adr.data_rate, adr.tx_power) == (5, 0)
+
+
+def test_network_control_stops_node_stepping(make_lora):
+    lora = make_lora(adr=True)
+    adr = lora.adr
+    adr.link_adr_req(0x30)
+    for _ in range(8):
+        adr.on_downlink(b'', 0, 10.0)
+    assert adr.data_rate == 3
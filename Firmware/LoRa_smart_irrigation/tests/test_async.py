@@ -0,0 +1,93 @@
+# [user-010] receive_windows keeps working with the async front end
+# [user-005] async send and receive paths
+import asyncio
+
+import machine
+import pytest
+import uasyncio
+import utime
+
+from conftest import PINS
+from frames import downlink
+from sx127x import CAD_BACKOFF_MS, RX_WINDOW_MAX_MS
+from sx127x_async import AsyncSX127x
+
+
+def test_rx_window_sees_rx_done_with_async_wrapper(make_lora, radio):
+    # RxTimeout on DIO1, so RxDone must come through DIO0
+    lora = make_lora(pins=dict(PINS, dio_1=6))
+    front_end = AsyncSX127x(lora)
+    lora.send_data(b'data', 4, 1)
+    radio.queue_downlink(downlink(1, payload=b'ok'))
+
+    start = utime.ticks_ms()
+    payload = lora.receive_windows()
+
+    assert bytes(payload) == b'ok'
+    assert lora.last_rx_window == 1
+    assert utime.ticks_diff(utime.ticks_ms(), start) < RX_WINDOW_MAX_MS
+    # the window's packet is not handed to the packets() stream
+    assert not front_end._rx_flag._event.is_set()
+
+
+@pytest.fixture
+def virtual_sleep(monkeypatch):
+    async def sleep_ms(ms):
+        utime.sleep_ms(ms)
+        await asyncio.sleep(0)
+    monkeypatch.setattr(uasyncio, 'sleep_ms', sleep_ms)
+
+
+def on_air(coro):
+    """ Runs coro while a side task lets radio time pass. """
+    async def main():
+        task = asyncio.ensure_future(coro)
+        while not task.done():
+            machine.idle()
+            await asyncio.sleep(0)
+        return task.result()
+    return asyncio.run(main())
+
+
+def test_async_send_blinks_like_the_sync_path(lora, radio, virtual_sleep):
+    front_end = AsyncSX127x(lora)
+    on_air(front_end.send_data(b'data', 4, 1))
+    assert len(radio.tx_frames) == 1
+    assert lora._leds._running
+
+
+def test_async_listen_before_talk_backs_off(make_lora, radio, virtual_sleep):
+    lora = make_lora(listen_before_talk=True, cad_retries=3)
+    front_end = AsyncSX127x(lora)
+    radio.cad_busy = [True, True, False]
+    start = utime.ticks_ms()
+    on_air(front_end.send_data(b'data', 4, 1))
+    assert len(radio.tx_frames) == 1
+    assert radio.cad_busy == []
+    # two backoffs, each at least half its window, before the clear CAD
+    assert utime.ticks_diff(utime.ticks_ms(), start) >= \
+        CAD_BACKOFF_MS // 2 + CAD_BACKOFF_MS
+
+
+def test_async_listen_before_talk_gives_up(make_lora, radio, virtual_sleep):
+    lora = make_lora(listen_before_talk=True, cad_retries=2)
+    front_end = AsyncSX127x(lora)
+    radio.cad_busy = [True, True, True]
+    with pytest.raises(RuntimeError, match='Channel busy after 3'):
+        on_air(front_end.send_data(b'data', 4, 1))
+    assert radio.tx_frames == []
+    assert not lora._lock
+
+
+def test_rx_done_signals_the_packet_stream(lora, radio):
+    front_end = AsyncSX127x(lora)
+    lora.receive()
+    packet = downlink(1, payload=b'stream')
+    radio.inject(packet)
+    assert front_end._rx_flag._event.is_set()
+
+    async def first():
+        async for received in front_end.packets():
+            return received
+    assert asyncio.run(first()) == bytes(packet)
+    assert not front_end._rx_flag._event.is_set()
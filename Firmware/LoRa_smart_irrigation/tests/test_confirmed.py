@@ -0,0 +1,78 @@
+# [user-020] confirmed uplinks: retransmission, DR step-down, restore
+import pytest
+
+import fake_radio
+from frames import downlink
+from sx127x import UPLINK_ACKED, UPLINK_UNACKED, UPLINK_FAILED
+
+FCTRL_ACK = 0x20
+REG_MODEM_CONFIG_2 = 0x1E
+
+
+def record_tx(lora, radio):
+    """ (FCnt, SF, ADR data rate) of every frame as it goes on air. """
+    sent = []
+    mode_changed = radio._mode_changed
+
+    def recording(mode):
+        mode_changed(mode)
+        if mode == fake_radio.MODE_TX:
+            frame = radio.tx_frames[-1]
+            sent.append((
+                frame[6] | frame[7] << 8,
+                radio.r[REG_MODEM_CONFIG_2] >> 4,
+                lora.adr.data_rate if lora.adr else None,
+            ))
+    radio._mode_changed = recording
+    return sent
+
+
+def test_ack_in_a_later_window(make_lora, radio):
+    lora = make_lora(adr=True)
+    sent = record_tx(lora, radio)
+    # two windows per transmission, RX1 of the third
+    radio.queue_downlink(downlink(1, fport=None, fctrl=FCTRL_ACK), window=5)
+
+    assert lora.send_confirmed(b'data', 4, 7, transmissions=4) == UPLINK_ACKED
+    # same FCnt every time, one DR lower from the third transmission
+    assert sent == [(7, 7, 5), (7, 7, 5), (7, 8, 4)]
+    assert lora.retransmissions == 2
+    assert lora._data_rate == 'SF7BW125'
+    assert lora.adr.data_rate == 5
+    assert radio.r[REG_MODEM_CONFIG_2] >> 4 == 7
+    assert lora.uplink_outcomes[-1] == (7, UPLINK_ACKED, 3)
+
+
+def test_no_ack_spends_the_budget(make_lora, radio):
+    lora = make_lora()
+    sent = record_tx(lora, radio)
+
+    assert lora.send_confirmed(b'data', 4, 3, transmissions=5) == UPLINK_UNACKED
+    assert [sf for _, sf, _ in sent] == [7, 7, 8, 8, 9]
+    assert lora.retransmissions == 4
+    assert lora.uplinks_unacked == 1
+    assert lora._data_rate == 'SF7BW125'
+    assert lora.uplink_outcomes[-1] == (3, UPLINK_UNACKED, 5)
+
+
+def test_link_adr_req_mid_burst_is_kept(make_lora, radio):
+    lora = make_lora(adr=True)
+    sent = record_tx(lora, radio)
+    # RX1 of the first transmission: no ACK, LinkADRReq to DR3 (SF9)
+    fopts = bytes([0x03, 0x30, 0xFF, 0x00, 0x01])
+    radio.queue_downlink(downlink(1, fport=None, fopts=fopts), window=1)
+
+    assert lora.send_confirmed(b'data', 4, 1, transmissions=4) == UPLINK_UNACKED
+    # no step-down over the network's rate, and no restore at the end
+    assert [sf for _, sf, _ in sent] == [7, 9, 9, 9]
+    assert lora._data_rate == 'SF9BW125'
+    assert lora.adr.data_rate == 3
+
+
+def test_radio_error_is_recorded_and_raised(lora, radio, monkeypatch):
+    # TxDone never comes
+    monkeypatch.setattr(fake_radio, 'TX_MS', 10 ** 9)
+    with pytest.raises(RuntimeError):
+        lora.send_confirmed(b'data', 4, 9, transmissions=3)
+    assert lora.uplink_outcomes[-1] == (9, UPLINK_FAILED, 0)
+    assert lora._data_rate == 'SF7BW125'
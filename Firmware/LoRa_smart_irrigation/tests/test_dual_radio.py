@@ -0,0 +1,52 @@
+# [user-017] DualRadio: RX2 downlinks act on the uplink radio
+import micropython
+
+from dual_radio import DualRadio
+from fake_radio import FakeRadio
+from frames import CONFIRMED_DATA_DOWN, downlink
+
+RX_PINS = {'ss': 11, 'reset': 10, 'dio_0': 15}
+FCTRL_ACK = 0x20
+
+
+def make_dual(make_lora, **kwargs):
+    tx = make_lora(**kwargs)
+    rx_radio = FakeRadio(spi=1, ss=11, rst=10, dio0=15)
+    rx = make_lora(spi_unit=1, pins=RX_PINS, **kwargs)
+    return DualRadio(tx, rx), rx_radio
+
+
+def test_rx2_confirmed_downlink_acked_by_tx(make_lora):
+    dual, rx_radio = make_dual(make_lora)
+    rx_radio.inject(downlink(5, payload=b'cfg', mtype=CONFIRMED_DATA_DOWN))
+    micropython.run_scheduled()
+
+    assert dual.tx._ack_pending
+    assert not dual.rx._ack_pending
+    assert dual.tx.frame_counter_down == 5
+    packet, _ = dual.tx.build_packet(b'data', 4, 1)
+    assert packet[5] & FCTRL_ACK
+
+
+def test_rx2_link_adr_req_applies_to_tx(make_lora):
+    dual, rx_radio = make_dual(make_lora, adr=True)
+    fopts = bytes([0x03, 0x30, 0xFF, 0x00, 0x01])
+    rx_radio.inject(downlink(1, payload=b'x', fopts=fopts))
+    micropython.run_scheduled()
+
+    assert dual.tx._data_rate == 'SF9BW125'
+    assert bytes(dual.tx._fopts[:dual.tx._fopts_len]) == bytes([0x03, 0x07])
+    assert dual.rx._fopts_len == 0
+
+
+def test_radios_keep_their_own_parameters(make_lora):
+    import sx127x
+    from conftest import PARAMETERS
+    shared = dict(PARAMETERS)
+    defaults = dict(sx127x.SX127x._default_parameters)
+    dual, _ = make_dual(make_lora, lora_parameters=shared)
+    # rx is listening on RX2 with inverted IQ, tx is not
+    assert dual.rx._parameters['invertIQ'] is True
+    assert dual.tx._parameters.get('invertIQ') is not True
+    assert shared == PARAMETERS
+    assert sx127x.SX127x._default_parameters == defaults
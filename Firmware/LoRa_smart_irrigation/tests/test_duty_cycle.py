@@ -0,0 +1,80 @@
+# [user-011] time on air and the duty cycle ledger
+import pytest
+import utime
+
+from duty_cycle import DutyCycle, frf_to_hz, MAX_OFF_MS
+from ttn_eu import TTN_FREQS
+
+
+# published EU868 figures: preamble 8, explicit header, CRC, CR 4/5
+@pytest.mark.parametrize('data_rate, length, airtime_us', [
+    ('SF7BW125', 13, 46336),
+    ('SF9BW125', 51, 328704),
+    ('SF12BW125', 13, 1155072),  # LowDataRateOptimize on
+    ('SF7BW250', 13, 23168),
+])
+def test_time_on_air(lora, data_rate, length, airtime_us):
+    lora.set_data_rate(data_rate)
+    assert lora.time_on_air_us(length) == airtime_us
+
+
+def test_frf_to_hz():
+    assert frf_to_hz((0x6C, 0x80, 0x00)) == 434000000
+    # the plan's FRF values are within one step of the nominal carrier
+    assert abs(frf_to_hz(TTN_FREQS[0]) - 868100000) < 3000
+    assert abs(frf_to_hz(TTN_FREQS[3]) - 867100000) < 3000
+
+
+def test_sub_bands():
+    ledger = DutyCycle()
+    assert ledger.sub_band(868100000) == 2
+    assert ledger.sub_band(867100000) == 1
+    assert ledger.sub_band(869525000) == 4
+    assert ledger.sub_band(868650000) == -1
+    assert ledger.delay_ms(-1) == 0
+
+
+def test_sub_band_closes_for_airtime_times_divisor():
+    ledger = DutyCycle()
+    ledger.record(2, 50000)  # 50 ms at 1%: 5 s from the start of TX
+    assert ledger.delay_ms(2) == 5000 - 50
+    assert ledger.delay_ms(1) == 0
+    assert ledger.airtime_us[2] == 50000
+    utime.sleep_ms(4000)
+    assert ledger.delay_ms(2) == 950
+    utime.sleep_ms(950)
+    assert ledger.delay_ms(2) == 0
+
+
+def test_stale_entries_reopen():
+    ledger = DutyCycle()
+    ledger.record(0, 1000)
+    # an off time past MAX_OFF_MS can only be a wrapped tick
+    ledger._available[0] = utime.ticks_add(utime.ticks_ms(), MAX_OFF_MS + 1)
+    assert ledger.delay_ms(0) == 0
+
+
+def test_driver_books_uplinks_and_picks_open_channels(make_lora, radio):
+    lora = make_lora(duty_cycle=True, channel=None)
+    ledger = lora._duty_cycle
+    # close the 868.1/868.3/868.5 sub-band
+    ledger.record(lora._channel_sub_band[0], 100000)
+    for _ in range(20):
+        channel = lora.select_channel()
+        assert lora._channel_sub_band[channel] != lora._channel_sub_band[0]
+    assert lora.channel_delay_ms(0) > 0
+    assert lora.send_delay_ms() == 0
+
+    lora._actual_channel = 3
+    lora._tx_length = 20
+    lora.record_airtime()
+    assert ledger.airtime_us[lora._channel_sub_band[3]] == lora.time_on_air_us(20)
+    # every EU868 channel is closed now, the wait is the shortest one
+    assert lora.send_delay_ms() == min(lora.channel_delay_ms(0), lora.channel_delay_ms(3))
+
+
+def test_claim_channel_refuses_a_closed_channel(make_lora, radio):
+    lora = make_lora(duty_cycle=True, channel=0)
+    lora._duty_cycle.record(lora._channel_sub_band[0], 100000)
+    with pytest.raises(RuntimeError):
+        lora.claim_channel()
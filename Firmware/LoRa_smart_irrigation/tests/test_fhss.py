@@ -0,0 +1,99 @@
+# [user-024] FHSS: the FhssChangeChannel IRQ on DIO2 follows the hop table
+import os
+import sys
+
+import machine
+from conftest import PINS
+from ttn_eu import TTN_FREQS
+
+import fake_radio
+
+REG_FRF_MSB = 0x06
+REG_HOP_CHANNEL = 0x1C
+REG_HOP_PERIOD = 0x24
+IRQ_FHSS_CHANGE_CHANNEL = 0x02
+CRC_ON_PAYLOAD = 0x40  # RegHopChannel bit 6, not part of the channel
+DIO2 = 7
+
+SAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__)))), 'sample_codes', 'LoRaWAN-master')
+
+
+def frf(radio):
+    return tuple(radio.r[REG_FRF_MSB:REG_FRF_MSB + 3])
+
+
+def hop(radio, channel, pin=DIO2):
+    # the modem moved on: FhssPresentChannel, the IRQ flag and DIO2
+    radio.r[REG_HOP_CHANNEL] = CRC_ON_PAYLOAD | channel
+    radio.r[fake_radio.REG_IRQ_FLAGS] |= IRQ_FHSS_CHANGE_CHANNEL
+    machine.fire(pin)
+
+
+def test_hops_follow_the_table(make_lora, radio):
+    lora = make_lora(pins=dict(PINS, dio_2=DIO2))
+    table = [TTN_FREQS[i] for i in range(3)]
+    lora.set_hopping(table, 10)
+    assert radio.r[REG_HOP_PERIOD] == 10
+    assert frf(radio) == table[0]
+
+    for channel, expected in ((1, 1), (2, 2), (4, 1)):
+        hop(radio, channel)
+        assert frf(radio) == table[expected]
+        assert radio.r[fake_radio.REG_IRQ_FLAGS] & IRQ_FHSS_CHANGE_CHANNEL == 0
+    assert lora.hops == 3
+
+
+def test_every_packet_starts_on_the_first_hop(make_lora, radio):
+    lora = make_lora(pins=dict(PINS, dio_2=DIO2))
+    table = [TTN_FREQS[i] for i in range(3)]
+    lora.set_hopping(table, 10)
+    hop(radio, 2)
+    starts = []
+    mode_changed = radio._mode_changed
+
+    def recording(mode):
+        if mode == fake_radio.MODE_TX:
+            starts.append(frf(radio))
+        mode_changed(mode)
+    radio._mode_changed = recording
+    lora.send_data(b'data', 4, 1)
+    assert starts == [table[0]]
+
+
+def test_hopping_off(make_lora, radio):
+    lora = make_lora(pins=dict(PINS, dio_2=DIO2))
+    table = [TTN_FREQS[i] for i in range(3)]
+    lora.set_hopping(table, 10)
+    lora.set_hopping(None, 0)
+    assert radio.r[REG_HOP_PERIOD] == 0
+    before = frf(radio)
+    hop(radio, 1)
+    assert frf(radio) == before
+    assert lora.hops == 0
+
+
+def test_sample_driver_hops(radio):
+    if SAMPLES not in sys.path:
+        sys.path.append(SAMPLES)
+    from SX127x.LoRa import LoRa
+    from SX127x.constants import MODE
+
+    # the constructor talks to the GPIOs, the hop logic only needs SPI
+    lora = LoRa.__new__(LoRa)
+    lora.hop_table = None
+    lora.mode = MODE.SLEEP
+    lora.set_fhss([868.1, 868.3, 868.5], 20)
+    assert radio.r[REG_HOP_PERIOD] == 20
+    table = [tuple(channel) for channel in lora.hop_table]
+    assert frf(radio) == table[0]
+
+    radio.r[REG_HOP_CHANNEL] = CRC_ON_PAYLOAD | 2
+    radio.r[fake_radio.REG_IRQ_FLAGS] |= IRQ_FHSS_CHANGE_CHANNEL
+    assert lora.get_hop_channel()['fhss_present_channel'] == 2
+    lora._dio2(DIO2)
+    assert frf(radio) == table[2]
+    assert radio.r[fake_radio.REG_IRQ_FLAGS] & IRQ_FHSS_CHANGE_CHANNEL == 0
+
+    lora.set_fhss(None, 0)
+    assert radio.r[REG_HOP_PERIOD] == 0
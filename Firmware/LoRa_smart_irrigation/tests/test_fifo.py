@@ -0,0 +1,54 @@
+# [user-001] burst FIFO access moves the same bytes as byte-wise access
+import pytest
+
+from sx127x import REG_FIFO_ADDR_PTR, REG_FIFO_TX_BASE_ADDR
+
+PACKET = bytes(range(7, 7 + 40))
+
+
+@pytest.mark.parametrize('burst', [False, True])
+def test_write_loads_fifo(lora, radio, burst):
+    lora.burst_fifo = burst
+    lora.standby()
+    lora.write_register(REG_FIFO_ADDR_PTR, lora.read_register(REG_FIFO_TX_BASE_ADDR))
+    base = radio.r[REG_FIFO_TX_BASE_ADDR]
+    buffer = bytearray(64)
+    buffer[:len(PACKET)] = PACKET
+
+    lora.write(buffer, len(PACKET))
+
+    assert bytes(radio.fifo[base:base + len(PACKET)]) == PACKET
+    assert radio.r[0x22] == len(PACKET)
+
+
+def test_burst_write_is_one_transaction(lora, radio):
+    lora.standby()
+    lora.burst_fifo = True
+    start = radio.transactions
+    lora.write_fifo(PACKET, len(PACKET))
+    assert radio.transactions - start == 1
+
+
+@pytest.mark.parametrize('burst', [False, True])
+def test_read_payload_into(lora, radio, burst):
+    lora.burst_fifo = burst
+    radio.inject(PACKET)
+    buffer = bytearray(255)
+    assert lora.read_payload_into(buffer) == len(PACKET)
+    assert bytes(buffer[:len(PACKET)]) == PACKET
+
+
+def test_read_payload_into_truncates(lora, radio):
+    radio.inject(PACKET)
+    buffer = bytearray(10)
+    assert lora.read_payload_into(buffer) == 10
+    assert bytes(buffer) == PACKET[:10]
+
+
+def test_read_fifo_matches_bytewise(lora, radio):
+    radio.inject(PACKET)
+    lora.burst_fifo = False
+    bytewise = lora.read_payload()
+    lora.burst_fifo = True
+    burst = lora.read_payload()
+    assert bytewise == burst == PACKET
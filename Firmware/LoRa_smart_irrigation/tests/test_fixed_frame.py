@@ -0,0 +1,77 @@
+# [user-022] fixed-size frames in implicit header mode
+import micropython
+import pytest
+
+from fixed_frame import FrameSchema, FixedFrameLink, P2P_SYNC_WORD
+
+REG_MODEM_CONFIG_1 = 0x1D
+REG_MODEM_CONFIG_2 = 0x1E
+REG_PAYLOAD_LENGTH = 0x22
+REG_SYNC_WORD = 0x39
+IMPLICIT_HEADER_MODE_ON = 0x01
+RX_PAYLOAD_CRC_ON = 0x04
+
+# valve id, flow, pressure, state
+FMT = '<hhHB'
+
+
+def test_schema_round_trip():
+    schema = FrameSchema(FMT)
+    assert schema.payload_length == 7
+    frame = bytearray(schema.payload_length)
+    schema.pack_into(frame, 3, -120, 4000, 1)
+    assert schema.unpack(frame) == (3, -120, 4000, 1)
+
+
+def test_schema_size_limits():
+    with pytest.raises(ValueError):
+        FrameSchema('256s')
+    with pytest.raises(ValueError):
+        FrameSchema('')
+
+
+def test_link_configures_implicit_header(lora, radio):
+    FixedFrameLink(lora, FrameSchema(FMT, coding_rate=8, crc=False))
+    assert radio.r[REG_MODEM_CONFIG_1] & IMPLICIT_HEADER_MODE_ON
+    assert (radio.r[REG_MODEM_CONFIG_1] >> 1) & 0x07 == 4  # 4/8
+    assert radio.r[REG_MODEM_CONFIG_2] & RX_PAYLOAD_CRC_ON == 0
+    assert radio.r[REG_PAYLOAD_LENGTH] == 7
+    assert radio.r[REG_SYNC_WORD] == P2P_SYNC_WORD
+
+
+def test_send_checks_the_length(lora, radio):
+    schema = FrameSchema(FMT)
+    link = FixedFrameLink(lora, schema)
+    with pytest.raises(ValueError):
+        link.send(bytearray(6))
+    with pytest.raises(ValueError):
+        link.send(bytearray(8))
+    assert radio.tx_frames == []
+
+    frame = bytearray(schema.payload_length)
+    schema.pack_into(frame, 1, 2, 3, 4)
+    link.send(frame)
+    assert radio.tx_frames == [bytes(frame)]
+    assert radio.r[REG_MODEM_CONFIG_1] & IMPLICIT_HEADER_MODE_ON
+
+
+def test_received_frames_reach_the_callback(lora, radio):
+    schema = FrameSchema(FMT)
+    link = FixedFrameLink(lora, schema)
+    received = []
+    link.on_receive(lambda link, frame: received.append(link.schema.unpack(frame)))
+    link.listen()
+    frame = bytearray(schema.payload_length)
+    for i in range(3):
+        schema.pack_into(frame, i, -i, 100 * i, i & 1)
+        radio.inject(frame)
+    micropython.run_scheduled()
+    assert received == [(0, 0, 0, 0), (1, -1, 100, 1), (2, -2, 200, 0)]
+    assert link.rx_packets == 3
+
+
+def test_no_header_is_shorter_on_air(lora):
+    link = FixedFrameLink(lora, FrameSchema(FMT))
+    implicit = link.time_on_air_us()
+    lora.implicit_header_mode(False)
+    assert implicit < lora.time_on_air_us(7)
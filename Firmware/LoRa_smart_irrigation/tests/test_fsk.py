@@ -0,0 +1,149 @@
+# [user-023] FSK maintenance link: duty cycle booking, bulk framing
+import queue
+import struct
+import threading
+
+import pytest
+import utime
+
+from fsk import (
+    FskModem, FSK_MAX_PAYLOAD, BULK_START, BULK_DATA, BULK_END, BULK_ACK,
+    BULK_HEADER, BULK_CHUNK,
+)
+from ttn_eu import TTN_FREQS
+
+REG_IRQ_FLAGS_1 = 0x3E
+REG_IRQ_FLAGS_2 = 0x3F
+
+
+def fsk_ready(radio):
+    # the model has no FSK modem: mode always ready, packets sent at once
+    radio.r[REG_IRQ_FLAGS_1] = 0x80
+    radio.r[REG_IRQ_FLAGS_2] = 0x08
+
+
+def test_fsk_airtime_is_booked_and_paced(make_lora, radio):
+    lora = make_lora(duty_cycle=True)
+    fsk_ready(radio)
+    fsk = FskModem(lora, frequency=TTN_FREQS[0])
+    frame = bytearray(FSK_MAX_PAYLOAD)
+    with fsk:
+        fsk.send_packet(frame, FSK_MAX_PAYLOAD)
+        sub_band = fsk._sub_band
+        assert sub_band >= 0
+        airtime = fsk.time_on_air_us(FSK_MAX_PAYLOAD)
+        assert lora._duty_cycle.airtime_us[sub_band] == airtime
+        # 1% sub-band: the next frame waits out 100 times the airtime
+        delay = fsk.duty_cycle_delay_ms()
+        assert delay > 0
+        start = utime.ticks_ms()
+        fsk.send_packet(frame, FSK_MAX_PAYLOAD)
+        assert utime.ticks_diff(utime.ticks_ms(), start) >= delay
+        assert lora._duty_cycle.airtime_us[sub_band] == 2 * airtime
+
+
+def test_fsk_send_refused_when_duty_cycle_wait_too_long(make_lora, radio):
+    lora = make_lora(duty_cycle=True)
+    fsk_ready(radio)
+    fsk = FskModem(lora, bitrate=1200, frequency=TTN_FREQS[0])
+    frame = bytearray(FSK_MAX_PAYLOAD)
+    with fsk:
+        fsk.send_packet(frame, FSK_MAX_PAYLOAD)
+        with pytest.raises(RuntimeError):
+            fsk.send_packet(frame, FSK_MAX_PAYLOAD)
+        # LoRa shares the ledger, the sub-band is closed for uplinks too
+        assert lora.channel_delay_ms(0) > 0
+
+
+class Link:
+    """ Two modems back to back: frames one sends are the other's
+        receive, drop(kind, seq) loses a frame on its first send.
+    """
+    def __init__(self, sender, receiver):
+        self.frames = []
+        self._dropped = set()
+        self.losses = set()
+        to_receiver = queue.Queue()
+        to_sender = queue.Queue()
+        self._attach(sender, to_receiver, to_sender)
+        self._attach(receiver, to_sender, to_receiver)
+
+    def _attach(self, modem, outbox, inbox):
+        def send_packet(buffer, length, **kwargs):
+            frame = bytes(buffer[:length])
+            self.frames.append(frame)
+            key = (frame[0], frame[1] | frame[2] << 8)
+            if key in self.losses and key not in self._dropped:
+                self._dropped.add(key)
+                return
+            outbox.put(frame)
+
+        def receive_packet(buffer, timeout_ms):
+            try:
+                frame = inbox.get(timeout=timeout_ms / 1000)
+            except queue.Empty:
+                return None
+            buffer[:len(frame)] = frame
+            return len(frame)
+
+        modem.send_packet = send_packet
+        modem.receive_packet = receive_packet
+
+
+def transfer(lora, data, buffer_size=2048, losses=()):
+    sender = FskModem(lora)
+    receiver = FskModem(lora)
+    link = Link(sender, receiver)
+    link.losses = set(losses)
+    buffer = bytearray(buffer_size)
+    result = {}
+
+    def receive():
+        try:
+            result['length'] = receiver.receive_bulk(buffer, timeout_ms=2000)
+        except Exception as e:
+            result['error'] = e
+    thread = threading.Thread(target=receive)
+    thread.start()
+    try:
+        result['frames'] = sender.send_bulk(data)
+    except Exception as e:
+        result['send_error'] = e
+    thread.join(5)
+    assert not thread.is_alive()
+    return result, bytes(buffer[:result.get('length', 0)]), link, sender
+
+
+def test_bulk_framing(lora):
+    data = bytes(range(256)) * 2
+    result, received, link, _ = transfer(lora, data)
+    assert received == data
+    chunks = -(-len(data) // BULK_CHUNK)
+    assert result['frames'] == chunks + 2
+    sent = [f for f in link.frames if f[0] != BULK_ACK]
+    assert [f[0] for f in sent] == [BULK_START] + [BULK_DATA] * chunks + [BULK_END]
+    assert [f[1] | f[2] << 8 for f in sent] == list(range(chunks + 2))
+    assert struct.unpack_from('<I', sent[0], BULK_HEADER)[0] == len(data)
+    assert all(len(f) <= FSK_MAX_PAYLOAD for f in sent)
+    assert len(sent[-2]) == BULK_HEADER + len(data) - (chunks - 1) * BULK_CHUNK
+
+
+def test_empty_bulk_transfer(lora):
+    result, received, _, _ = transfer(lora, b'')
+    assert result['frames'] == 2
+    assert result['length'] == 0
+
+
+def test_lost_frames_and_acks_are_retried(lora):
+    data = bytes(range(200))
+    # DATA 2 lost on the way out, the ACK of DATA 1 lost on the way back
+    result, received, _, sender = transfer(
+        lora, data, losses=[(BULK_DATA, 2), (BULK_ACK, 1)])
+    assert received == data
+    assert sender.bulk_retries == 2
+
+
+def test_oversized_bulk_transfer_is_refused(lora):
+    result, _, _, _ = transfer(lora, bytes(100), buffer_size=50)
+    assert isinstance(result['error'], ValueError)
+    assert isinstance(result['send_error'], RuntimeError)
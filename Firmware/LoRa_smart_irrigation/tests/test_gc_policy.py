@@ -0,0 +1,43 @@
+# [user-007] garbage collection policy of the send/receive paths
+import gc
+
+import pytest
+
+from sx127x import GC_NEVER, GC_THRESHOLD, GC_AFTER_PACKETS
+
+
+@pytest.fixture
+def collections(monkeypatch):
+    calls = []
+    monkeypatch.setattr(gc, 'collect', lambda: calls.append(1))
+    return calls
+
+
+def test_collect_every_n_packets(make_lora, collections):
+    lora = make_lora(gc_policy=GC_AFTER_PACKETS, gc_interval=3)
+    for fcnt in range(7):
+        lora.send_data(b'data', 4, fcnt)
+    assert len(collections) == 2
+
+
+def test_collect_after_every_packet_by_default(make_lora, collections):
+    lora = make_lora()
+    for fcnt in range(3):
+        lora.send_data(b'data', 4, fcnt)
+    assert len(collections) == 3
+
+
+@pytest.mark.parametrize('policy', [GC_NEVER, GC_THRESHOLD])
+def test_no_per_packet_collect(make_lora, collections, policy):
+    lora = make_lora(gc_policy=policy)
+    for fcnt in range(3):
+        lora.send_data(b'data', 4, fcnt)
+    assert collections == []
+
+
+def test_threshold_policy_sets_the_threshold(make_lora, monkeypatch):
+    thresholds = []
+    monkeypatch.setattr(gc, 'threshold', lambda *args: thresholds.append(args))
+    make_lora(gc_policy=GC_THRESHOLD, gc_threshold=4096)
+    make_lora(gc_policy=GC_AFTER_PACKETS)
+    assert thresholds == [(4096,)]
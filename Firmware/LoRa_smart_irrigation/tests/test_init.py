@@ -0,0 +1,32 @@
+# [user-008] warm restart configures the chip in standby
+from sx127x import SHADOW_MAP, RSSI_OFFSET_HF
+
+MODE_SLEEP = 0x00
+MODE_STDBY = 0x01
+MODE_RX_CONTINUOUS = 0x05
+
+
+def test_warm_start_configures_in_standby(make_lora, radio):
+    # chip left powered in RX continuous, with other modem settings
+    radio.r[0x01] = 0x80 | MODE_RX_CONTINUOUS
+    radio.r[0x1D] = 0x00
+    config_writes = []
+    write = radio._write
+
+    def recording_write(address, value):
+        if SHADOW_MAP[address]:
+            config_writes.append((address, radio.r[0x01] & 0x07))
+        write(address, value)
+    radio._write = recording_write
+
+    lora = make_lora(warm_start=True)
+
+    assert lora.warm_started
+    assert lora.config_writes > 0
+    assert config_writes
+    assert all(mode in (MODE_SLEEP, MODE_STDBY) for _, mode in config_writes)
+
+
+def test_rssi_offset_follows_the_channel_plan(lora):
+    # EU868 is above the mid-band threshold, the HF port is used
+    assert lora._rssi_offset == RSSI_OFFSET_HF
@@ -0,0 +1,64 @@
+# [user-016] link quality: rolling statistics, RSSI and the link report
+from link_stats import RollingStats
+from sx127x import RSSI_OFFSET_HF
+
+
+def test_nearest_rank_percentile():
+    stats = RollingStats(size=20)
+    assert stats.percentile(50) is None
+    for value in (15, 20, 35, 40, 50):
+        stats.add(value)
+    # the classic nearest-rank example: ranks ceil(p * 5 / 100)
+    assert stats.percentile(5) == 15
+    assert stats.percentile(30) == 20
+    assert stats.percentile(40) == 20
+    assert stats.percentile(50) == 35
+    assert stats.percentile(100) == 50
+    assert stats.percentile(0) == 15
+
+
+def test_percentile_of_ten_samples():
+    stats = RollingStats(size=10)
+    for value in range(10, 0, -1):
+        stats.add(value)
+    assert stats.percentile(10) == 1
+    assert stats.percentile(11) == 2
+    assert stats.percentile(90) == 9
+    assert stats.percentile(91) == 10
+
+
+def test_window_rolls():
+    stats = RollingStats(size=3)
+    for value in (5, 1, 9, 7):
+        stats.add(value)
+    # 5 dropped out
+    assert len(stats) == 3
+    assert (stats.min(), stats.max(), stats.mean()) == (1, 9, 17 / 3)
+
+
+def test_rssi_dbm(lora):
+    # above the noise floor: 16/15 slope
+    assert lora.rssi_dbm(60, 20) == 60 * 16 / 15 - RSSI_OFFSET_HF
+    # below it: SNR in 0.25 dB two's complement is added
+    assert lora.rssi_dbm(30, 0xF8) == 30 - RSSI_OFFSET_HF - 2.0
+    assert lora.snr_db(0xF8) == -2.0
+    assert lora.snr_db(40) == 10.0
+
+
+def test_link_report(lora):
+    assert bytes(lora.link_report()) == bytes(7)
+    for rssi_value, snr_value in ((60, 20), (45, 8), (30, 0xF8), (50, 12)):
+        lora.record_link_quality(rssi_value, snr_value)
+    report = lora.link_report()
+    rssi = sorted([
+        60 * 16 / 15 - 157, 45 * 16 / 15 - 157, 30 - 157 - 2.0, 50 * 16 / 15 - 157,
+    ])
+    assert report[0] == 4
+    assert report[1] == int(-rssi[0] + 0.5)
+    assert report[2] == int(-sum(rssi) / 4 + 0.5)
+    # 10th percentile of four samples is the lowest
+    assert report[3] == int(-rssi[0] + 0.5)
+    # SNR -2 dB min and p10, mean (5 + 2 - 2 + 3) / 4 dB
+    assert report[4] == (-8) & 0xFF
+    assert report[5] == 8
+    assert report[6] == (-8) & 0xFF
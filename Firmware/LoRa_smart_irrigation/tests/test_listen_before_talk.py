@@ -0,0 +1,67 @@
+# [user-013] listen before talk: CAD, random backoff, busy accounting
+import pytest
+import utime
+
+import fake_radio
+from duty_cycle import frf_to_hz
+from sx127x import CAD_BACKOFF_MS
+from ttn_eu import TTN_FREQS
+
+
+def record_modes(radio):
+    modes = []
+    mode_changed = radio._mode_changed
+
+    def recording(mode):
+        modes.append(mode)
+        mode_changed(mode)
+    radio._mode_changed = recording
+    return modes
+
+
+def test_clear_channel_sends_after_one_cad(make_lora, radio):
+    lora = make_lora(listen_before_talk=True)
+    modes = record_modes(radio)
+    lora.send_data(b'data', 4, 1)
+    assert [m for m in modes if m in (fake_radio.MODE_CAD, fake_radio.MODE_TX)] == \
+        [fake_radio.MODE_CAD, fake_radio.MODE_TX]
+    assert lora.cad_checks[0] == 1
+    assert lora.cad_busy[0] == 0
+    assert len(radio.tx_frames) == 1
+
+
+def test_busy_channel_backs_off_and_retries(make_lora, radio):
+    lora = make_lora(listen_before_talk=True)
+    radio.cad_busy = [True, True]
+    start = utime.ticks_ms()
+    lora.send_data(b'data', 4, 1)
+    # upper half of a 100 ms, then of a 200 ms window
+    assert utime.ticks_diff(utime.ticks_ms(), start) >= \
+        CAD_BACKOFF_MS // 2 + CAD_BACKOFF_MS
+    assert lora.cad_checks[0] == 3
+    assert lora.cad_busy[0] == 2
+    assert len(radio.tx_frames) == 1
+
+
+def test_gives_up_after_cad_retries(make_lora, radio):
+    lora = make_lora(listen_before_talk=True, cad_retries=2)
+    radio.cad_busy = [True] * 10
+    with pytest.raises(RuntimeError):
+        lora.send_data(b'data', 4, 1)
+    assert lora.cad_checks[0] == 3
+    assert radio.tx_frames == []
+
+
+def test_backoff_window_doubles(lora):
+    for attempt in range(4):
+        window = CAD_BACKOFF_MS << attempt
+        for _ in range(20):
+            assert window // 2 <= lora.cad_backoff_ms(attempt) < window
+
+
+def test_busy_rates_per_frequency(make_lora, radio):
+    lora = make_lora(listen_before_talk=True)
+    radio.cad_busy = [True, False, True, False]
+    lora.send_data(b'data', 4, 1)
+    lora.send_data(b'data', 4, 2)
+    assert lora.busy_rates() == {frf_to_hz(TTN_FREQS[0]): 0.5}
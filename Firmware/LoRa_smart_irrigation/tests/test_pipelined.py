@@ -0,0 +1,112 @@
+# [user-021] pipelined TX: uplink preloaded in the TX half of the FIFO
+import fake_radio
+from conftest import APPKEY, DEVADDR, NWKEY
+from encryption_aes import SessionCrypto
+from frames import downlink, CONFIRMED_DATA_DOWN
+from radio_worker import RadioWorker, CMD_STOP, EVT_SENT
+from sx127x import PIPELINED_TX_BASE, PIPELINED_RX_BASE, PIPELINED_REGION
+
+REG_FIFO_TX_BASE_ADDR = 0x0E
+REG_MAX_PAYLOAD_LENGTH = 0x23
+FCTRL_ACK = 0x20
+
+
+def record_tx_bases(radio):
+    bases = []
+    mode_changed = radio._mode_changed
+
+    def recording(mode):
+        if mode == fake_radio.MODE_TX:
+            bases.append(radio.r[REG_FIFO_TX_BASE_ADDR])
+        mode_changed(mode)
+    radio._mode_changed = recording
+    return bases
+
+
+def count_fifo_writes(radio):
+    writes = []
+    write = radio._write
+
+    def recording(address, value):
+        if address == fake_radio.REG_FIFO:
+            writes.append(value)
+        write(address, value)
+    radio._write = recording
+    return writes
+
+
+def test_fifo_is_split(make_lora, radio):
+    make_lora(pipelined_tx=True)
+    assert radio.r[REG_FIFO_TX_BASE_ADDR] == PIPELINED_TX_BASE
+    assert radio.r[fake_radio.REG_FIFO_RX_BASE_ADDR] == PIPELINED_RX_BASE
+    assert radio.r[REG_MAX_PAYLOAD_LENGTH] == PIPELINED_REGION
+
+
+def test_preloaded_uplink_survives_the_receive_windows(make_lora, radio):
+    lora = make_lora(pipelined_tx=True)
+    bases = record_tx_bases(radio)
+    lora.send_data(b'first', 5, 1)
+    lora.preload(b'second', 6, 2)
+    preloaded = bytes(radio.fifo[PIPELINED_TX_BASE:PIPELINED_TX_BASE + lora._preload_length])
+
+    frame = downlink(1, payload=b'cfg')
+    radio.queue_downlink(frame, window=1)
+    assert bytes(lora.receive_windows()) == b'cfg'
+    # the downlink went to the RX half, the uplink is untouched
+    assert bytes(radio.fifo[PIPELINED_RX_BASE:PIPELINED_RX_BASE + len(frame)]) == frame
+    assert bytes(radio.fifo[:len(preloaded)]) == preloaded
+    assert lora.preloaded == 2
+
+    writes = count_fifo_writes(radio)
+    assert lora.send_preloaded() == 2
+    assert writes == []
+    assert radio.tx_frames[-1] == preloaded
+    assert bases == [PIPELINED_TX_BASE, PIPELINED_TX_BASE]
+    assert lora.preloaded is None
+    assert lora.preloads_rebuilt == 0
+
+
+def test_fctrl_change_rebuilds_the_preloaded_uplink(make_lora, radio):
+    lora = make_lora(pipelined_tx=True)
+    lora.send_data(b'first', 5, 1)
+    lora.preload(b'second', 6, 2)
+    preloaded = bytes(radio.fifo[:lora._preload_length])
+
+    # a confirmed downlink: the next uplink must carry the ACK bit
+    radio.queue_downlink(downlink(1, mtype=CONFIRMED_DATA_DOWN), window=1)
+    lora.receive_windows()
+    lora.send_preloaded()
+
+    sent = radio.tx_frames[-1]
+    assert lora.preloads_rebuilt == 1
+    assert sent != preloaded
+    assert sent[5] & FCTRL_ACK
+    assert sent[6] | sent[7] << 8 == 2
+    session = SessionCrypto(DEVADDR, APPKEY, NWKEY)
+    assert session.verify_mic(2, bytearray(sent), len(sent) - 4, direction=0)
+    payload = bytearray(sent[9:-4])
+    session.encrypt(2, payload, direction=0)
+    assert payload == b'second'
+
+
+def test_worker_sends_the_next_uplink_preloaded(make_lora, radio):
+    lora = make_lora(pipelined_tx=True)
+    preloaded_sends = []
+    send_preloaded = lora.send_preloaded
+
+    def recording(*args, **kwargs):
+        preloaded_sends.append(lora.preloaded)
+        return send_preloaded(*args, **kwargs)
+    lora.send_preloaded = recording
+
+    worker = RadioWorker(lora)
+    assert worker.send(b'one', 1)
+    assert worker.send(b'two', 2)
+    worker.commands.put(CMD_STOP)
+    worker._run()
+
+    assert preloaded_sends == [2]
+    assert [f[6] | f[7] << 8 for f in radio.tx_frames] == [1, 2]
+    event = bytearray(255)
+    assert worker.poll(event) == (EVT_SENT, 0, 1)
+    assert worker.poll(event) == (EVT_SENT, 0, 2)
@@ -0,0 +1,120 @@
+# [user-019] compiled register profiles and the burst merge
+import pytest
+
+from sx127x import PROFILE_MERGE_GAP
+
+REG_OP_MODE = 0x01
+REG_MODEM_CONFIG_1 = 0x1D
+REG_MODEM_CONFIG_2 = 0x1E
+REG_SYMB_TIMEOUT_LSB = 0x1F
+REG_PREAMBLE_MSB = 0x20
+
+
+def record_bursts(lora):
+    bursts = []
+    burst_write = lora._burst_write
+
+    def recording(address, buffer):
+        bursts.append((address, bytes(buffer)))
+        burst_write(address, buffer)
+    lora._burst_write = recording
+    return bursts
+
+
+def profile_of(lora, **registers):
+    # registers as r1D=value keyword arguments
+    def configure(lora):
+        for name, value in registers.items():
+            lora.write_register(int(name[1:], 16), value)
+    return lora.compile_profile(configure)
+
+
+def test_compile_records_without_touching_chip_or_state(make_lora, radio):
+    lora = make_lora(register_shadow=True)
+    chip = bytes(radio.r)
+    state = (lora._data_rate, lora._sf, lora._bw, lora._crc)
+    profile = lora.data_rate_profile('SF12BW125')
+    assert bytes(radio.r) == chip
+    assert (lora._data_rate, lora._sf, lora._bw, lora._crc) == state
+    assert profile.mask[REG_MODEM_CONFIG_1] and profile.mask[REG_MODEM_CONFIG_2]
+    assert profile.values[REG_MODEM_CONFIG_2] >> 4 == 12
+    assert ('_sf', 12) in profile.state
+    # cached per data rate
+    assert lora.data_rate_profile('SF12BW125') is profile
+
+
+def test_status_registers_cannot_be_compiled(lora):
+    with pytest.raises(ValueError):
+        lora.compile_profile(lambda lora: lora.write_register(REG_OP_MODE, 0x81))
+
+
+def test_apply_writes_registers_and_state_once(make_lora, radio):
+    lora = make_lora(register_shadow=True)
+    profile = lora.data_rate_profile('SF12BW125')
+    assert lora.apply_profile(profile) >= 1
+    assert radio.r[REG_MODEM_CONFIG_2] >> 4 == 12
+    assert lora._sf == 12 and lora._data_rate == 'SF12BW125'
+    # the shadow knows the chip holds the profile now
+    assert lora.apply_profile(profile) == 0
+
+
+def test_short_gaps_of_known_registers_are_bridged(make_lora, radio):
+    lora = make_lora(register_shadow=True)
+    bridged = radio.r[REG_MODEM_CONFIG_2]
+    profile = profile_of(
+        lora,
+        r1D=radio.r[REG_MODEM_CONFIG_1] ^ 0x02,
+        r1F=radio.r[REG_SYMB_TIMEOUT_LSB] ^ 0x01,
+    )
+    bursts = record_bursts(lora)
+    assert lora.apply_profile(profile) == 1
+    assert bursts[0][0] == REG_MODEM_CONFIG_1
+    assert len(bursts[0][1]) == 3
+    # the register in between is rewritten with its own value
+    assert radio.r[REG_MODEM_CONFIG_2] == bridged
+
+
+def test_long_gaps_split_the_burst(make_lora, radio):
+    lora = make_lora(register_shadow=True)
+    address = REG_MODEM_CONFIG_1 + PROFILE_MERGE_GAP + 1
+    profile = lora.compile_profile(lambda lora: (
+        lora.write_register(REG_MODEM_CONFIG_1, radio.r[REG_MODEM_CONFIG_1] ^ 0x02),
+        lora.write_register(address, radio.r[address] ^ 0x01),
+    ))
+    bursts = record_bursts(lora)
+    assert lora.apply_profile(profile) == 2
+    assert [b[0] for b in bursts] == [REG_MODEM_CONFIG_1, address]
+
+
+def test_unknown_gaps_are_not_bridged_without_the_shadow(lora, radio):
+    profile = profile_of(
+        lora,
+        r1D=radio.r[REG_MODEM_CONFIG_1] ^ 0x02,
+        r1F=radio.r[REG_SYMB_TIMEOUT_LSB] ^ 0x01,
+    )
+    bursts = record_bursts(lora)
+    assert lora.apply_profile(profile) == 2
+    assert [len(b[1]) for b in bursts] == [1, 1]
+
+
+def test_unchanged_registers_are_skipped(make_lora, radio):
+    lora = make_lora(register_shadow=True)
+    profile = profile_of(
+        lora,
+        r1D=radio.r[REG_MODEM_CONFIG_1] ^ 0x02,
+        r1E=radio.r[REG_MODEM_CONFIG_2],
+    )
+    bursts = record_bursts(lora)
+    assert lora.apply_profile(profile) == 1
+    assert bursts == [(REG_MODEM_CONFIG_1, bytes([radio.r[REG_MODEM_CONFIG_1]]))]
+
+
+def test_apply_while_staging_only_updates_the_shadow(make_lora, radio):
+    lora = make_lora(register_shadow=True)
+    value = radio.r[REG_PREAMBLE_MSB] ^ 0x01
+    profile = profile_of(lora, r20=value)
+    lora.begin_config()
+    assert lora.apply_profile(profile) == 0
+    assert radio.r[REG_PREAMBLE_MSB] != value
+    assert lora.commit_config() == 1
+    assert radio.r[REG_PREAMBLE_MSB] == value
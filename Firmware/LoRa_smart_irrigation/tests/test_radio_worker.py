@@ -0,0 +1,120 @@
+# [user-018] radio worker: cross-core queues, events and errors
+import time
+
+import pytest
+
+import fake_radio
+from frames import downlink
+from radio_worker import (
+    FixedQueue, RadioWorker, CMD_STOP, EVT_SENT, EVT_DOWNLINK,
+    EVT_ERROR, EVT_UNACKED,
+)
+from sx127x import TX_WAIT_LIGHTSLEEP
+
+
+def test_queue_is_first_in_first_out_and_wraps():
+    queue = FixedQueue(slots=3, slot_size=8)
+    buffer = bytearray(8)
+    assert queue.get(buffer) is None
+    for turn in range(4):
+        assert queue.put(1, b'a%d' % turn, turn)
+        assert queue.put(2, b'bb%d' % turn, turn + 10)
+        assert len(queue) == 2
+        assert queue.get(buffer) == (1, 2, turn)
+        assert bytes(buffer[:2]) == b'a%d' % turn
+        assert queue.get(buffer) == (2, 3, turn + 10)
+        assert bytes(buffer[:3]) == b'bb%d' % turn
+    assert len(queue) == 0
+
+
+def test_full_queue_drops():
+    queue = FixedQueue(slots=2, slot_size=8)
+    assert queue.put(1, b'x')
+    assert queue.put(1, b'y')
+    assert not queue.put(1, b'z')
+    assert queue.dropped == 1
+    buffer = bytearray(8)
+    assert queue.get(buffer)[0] == 1 and buffer[0] == ord('x')
+    assert queue.put(1, b'z')
+
+
+def test_oversize_payload_is_truncated():
+    queue = FixedQueue(slots=2, slot_size=4)
+    assert queue.put(1, b'123456')
+    buffer = bytearray(8)
+    assert queue.get(buffer) == (1, 4, 0)
+    assert bytes(buffer[:4]) == b'1234'
+
+
+def test_peek_leaves_the_message():
+    queue = FixedQueue(slots=2, slot_size=4)
+    queue.put(3, b'ab', 7)
+    buffer = bytearray(4)
+    assert queue.peek(buffer) == (3, 2, 7)
+    assert len(queue) == 1
+    assert queue.get(buffer) == (3, 2, 7)
+
+
+def events(worker):
+    buffer = bytearray(255)
+    found = []
+    while True:
+        message = worker.poll(buffer)
+        if message is None:
+            return found
+        kind, length, arg = message
+        found.append((kind, bytes(buffer[:length]), arg))
+
+
+def run(worker):
+    worker.commands.put(CMD_STOP)
+    worker._run()
+    assert not worker.running
+
+
+def test_sent_and_downlink_events(lora, radio):
+    worker = RadioWorker(lora)
+    radio.queue_downlink(downlink(1, fport=5, payload=b'open'), window=1)
+    worker.send(b'report', 4)
+    run(worker)
+    assert events(worker) == [(EVT_SENT, b'', 4), (EVT_DOWNLINK, b'open', 5)]
+    assert len(radio.tx_frames) == 1
+
+
+def test_radio_errors_become_events(lora, radio, monkeypatch):
+    monkeypatch.setattr(fake_radio, 'TX_MS', 10 ** 9)
+    worker = RadioWorker(lora)
+    worker.send(b'report', 4)
+    worker.send(b'report', 5)
+    run(worker)
+    found = events(worker)
+    assert [(kind, arg) for kind, _, arg in found] == [(EVT_ERROR, 4), (EVT_ERROR, 5)]
+    assert found[0][1] == b'Timeout during packet send'
+
+
+def test_unacked_confirmed_uplink(make_lora, radio):
+    lora = make_lora(confirmed_transmissions=2)
+    worker = RadioWorker(lora)
+    worker.send(b'report', 9, confirmed=True)
+    run(worker)
+    assert events(worker) == [(EVT_UNACKED, b'', 9)]
+    assert len(radio.tx_frames) == 2
+
+
+def test_worker_refuses_lightsleep(make_lora):
+    with pytest.raises(ValueError):
+        RadioWorker(make_lora(tx_wait=TX_WAIT_LIGHTSLEEP))
+
+
+def test_start_and_stop_on_a_thread(lora, radio):
+    worker = RadioWorker(lora)
+    worker.start()
+    assert worker.running
+    worker.send(b'report', 1)
+    worker.stop()
+    deadline = time.monotonic() + 5
+    while worker.running and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not worker.running
+    assert events(worker) == [(EVT_SENT, b'', 1)]
+    assert worker.commands.get(bytearray(1)) is None
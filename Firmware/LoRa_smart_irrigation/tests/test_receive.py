@@ -0,0 +1,52 @@
+# [user-015] on_receive: LoRaWAN downlinks by default, raw packets opt-in
+import micropython
+
+from frames import downlink
+
+
+def receive_all(lora, radio, packets, **kwargs):
+    received = []
+    lora.on_receive(lambda lora, payload: received.append(bytes(payload)), **kwargs)
+    lora.receive()
+    for packet in packets:
+        radio.inject(packet)
+    micropython.run_scheduled()
+    return received
+
+
+def test_lorawan_receive_decrypts_our_downlinks(lora, radio):
+    ours = downlink(1, payload=b'open valve')
+    foreign = downlink(2, payload=b'not ours', devaddr=bytearray(4))
+    received = receive_all(lora, radio, [b'p2p frame', foreign, ours])
+    assert received == [b'open valve']
+    assert lora.rx_foreign == 2
+
+
+def test_raw_receive_gets_every_packet(lora, radio):
+    ours = downlink(1, payload=b'open valve')
+    received = receive_all(lora, radio, [b'p2p frame', ours], lorawan=False)
+    assert received == [b'p2p frame', ours]
+    assert lora.rx_foreign == 0
+    assert lora.frame_counter_down == -1
+
+
+# [user-014] downlinks from the receive ring reach ADR like RX window ones
+LINK_ADR_REQ_DR3 = bytes([0x03, 0x30, 0xFF, 0x00, 0x01])
+
+
+def test_ring_downlink_fopts_reach_adr(make_lora, radio):
+    lora = make_lora(adr=True)
+    received = receive_all(lora, radio, [downlink(1, payload=b'x', fopts=LINK_ADR_REQ_DR3)])
+    assert received == [b'x']
+    assert lora.adr.data_rate == 3
+    assert lora._data_rate == 'SF9BW125'
+    # LinkADRAns, all bits ACK, queued for the next uplink
+    assert bytes(lora._fopts[:lora._fopts_len]) == bytes([0x03, 0x07])
+
+
+def test_ring_downlink_port0_mac_commands_reach_adr(make_lora, radio):
+    lora = make_lora(adr=True)
+    lora.adr.adr_ack_cnt = 10
+    receive_all(lora, radio, [downlink(1, fport=0, payload=LINK_ADR_REQ_DR3)])
+    assert lora.adr.adr_ack_cnt == 0
+    assert lora.adr.data_rate == 3
@@ -0,0 +1,92 @@
+# [user-014] receive ring: preallocated slots, deferred processing
+import micropython
+
+from rx_ring import RxRing
+
+IRQ_PAYLOAD_CRC_ERROR = 0x20
+
+
+def fill(ring, data, rssi=0, snr=0):
+    slot = ring.slot()
+    if slot is None:
+        return False
+    slot[:len(data)] = data
+    ring.commit(len(data), rssi, snr)
+    return True
+
+
+def test_ring_is_first_in_first_out():
+    ring = RxRing(slots=3, slot_size=8)
+    assert ring.peek() is None
+    assert fill(ring, b'one', 10, 1)
+    assert fill(ring, b'two', 20, 2)
+    assert len(ring) == 2
+    packet, slot = ring.peek()
+    assert bytes(packet) == b'one'
+    assert (ring.rssi[slot], ring.snr[slot]) == (10, 1)
+    ring.release()
+    packet, slot = ring.peek()
+    assert bytes(packet) == b'two'
+    assert (ring.rssi[slot], ring.snr[slot]) == (20, 2)
+    ring.release()
+    assert len(ring) == 0
+    ring.release()  # nothing to free
+    assert len(ring) == 0
+
+
+def test_full_ring_refuses_and_wraps():
+    ring = RxRing(slots=2, slot_size=4)
+    assert fill(ring, b'a')
+    assert fill(ring, b'b')
+    assert ring.slot() is None
+    assert not fill(ring, b'c')
+    ring.release()
+    assert fill(ring, b'c')
+    received = []
+    while len(ring):
+        packet, _ = ring.peek()
+        received.append(bytes(packet))
+        ring.release()
+    assert received == [b'b', b'c']
+
+
+def test_slots_are_preallocated():
+    ring = RxRing(slots=2, slot_size=4)
+    first = ring.slot()
+    fill(ring, b'x')
+    fill(ring, b'y')
+    ring.release()
+    ring.release()
+    # the same storage is handed out again
+    assert ring.slot() is first
+
+
+def test_irq_queues_and_poll_delivers_in_order(make_lora, radio):
+    lora = make_lora(rx_slots=2)
+    received = []
+    lora.on_receive(lambda lora, payload: received.append(bytes(payload)),
+                    schedule=False, lorawan=False)
+    lora.receive()
+    for packet in (b'first', b'second', b'third'):
+        radio.inject(packet)
+    # nothing runs until poll(), the third packet found the ring full
+    assert received == []
+    assert lora.rx_overflows == 1
+    assert micropython._queue == []
+    assert lora.poll() == 2
+    assert received == [b'first', b'second']
+    assert lora.poll() == 0
+
+
+def test_crc_errors_are_dropped_in_the_irq(make_lora, radio):
+    lora = make_lora()
+    received = []
+    lora.on_receive(lambda lora, payload: received.append(bytes(payload)),
+                    lorawan=False)
+    lora.receive()
+    radio.r[0x12] |= IRQ_PAYLOAD_CRC_ERROR
+    radio.inject(b'garbled')
+    radio.inject(b'clean')
+    micropython.run_scheduled()
+    assert received == [b'clean']
+    assert lora.rx_dropped == 1
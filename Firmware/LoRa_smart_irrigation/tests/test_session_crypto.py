@@ -0,0 +1,93 @@
+# [user-009] session crypto against the RFC 4493 and LoRaWAN vectors
+import pytest
+
+import aes_reference
+from encryption_aes import SessionCrypto
+
+RFC_KEY = bytes.fromhex('2b7e151628aed2a6abf7158809cf4f3c')
+RFC_MESSAGE = bytes.fromhex(
+    '6bc1bee22e409f96e93d7e117393172a'
+    'ae2d8a571e03ac9c9eb76fac45af8e51'
+    '30c81c46a35ce411e5fbc1191a0a52ef'
+    'f69f2445df4f9b17ad2b417be66c3710'
+)
+RFC_CMAC = (
+    (0, 'bb1d6929e95937287fa37d129b756746'),
+    (16, '070a16b46b4d4144f79bdd9dd04a287c'),
+    (40, 'dfa66747de9ae63030ca32611497c827'),
+    (64, '51f0bebf7e3b9d92fc49741779363cfe'),
+)
+
+# uplink from the lora-packet project: FCnt 2, FPort 1, "test"
+DEVADDR = bytes.fromhex('49be7df1')
+NWKSKEY = bytes.fromhex('44024241ed4ce9a68c6a8bc055233fd3')
+APPSKEY = bytes.fromhex('ec925802ae430ca77fd3dd73cb2cc588')
+PACKET = bytes.fromhex('40f17dbe4900020001954378762b11ff0d')
+
+
+def cmac(key, message):
+    """ Straight RFC 4493 AES-CMAC, the reference for mic(). """
+    round_keys = aes_reference.expand_key(key)
+
+    def double(block):
+        value = int.from_bytes(block, 'big') << 1
+        if value >> 128:
+            value ^= (1 << 128) | 0x87
+        return (value & ((1 << 128) - 1)).to_bytes(16, 'big')
+
+    k1 = double(aes_reference.encrypt_block(round_keys, bytes(16)))
+    k2 = double(k1)
+    blocks = [message[i:i + 16] for i in range(0, len(message), 16)] or [b'']
+    if len(blocks[-1]) == 16:
+        last = bytes(a ^ b for a, b in zip(blocks[-1], k1))
+    else:
+        padded = blocks[-1] + b'\x80' + bytes(15 - len(blocks[-1]))
+        last = bytes(a ^ b for a, b in zip(padded, k2))
+    state = bytes(16)
+    for block in blocks[:-1] + [last]:
+        state = aes_reference.encrypt_block(
+            round_keys, bytes(a ^ b for a, b in zip(state, block)))
+    return state
+
+
+@pytest.mark.parametrize('length, expected', RFC_CMAC)
+def test_reference_cmac_matches_rfc_4493(length, expected):
+    assert cmac(RFC_KEY, RFC_MESSAGE[:length]).hex() == expected
+
+
+def test_subkeys_match_rfc_4493():
+    crypto = SessionCrypto(bytearray(4), bytearray(16), bytearray(RFC_KEY))
+    assert crypto._key_k1.hex() == 'fbeed618357133667c85e08f7236a8de'
+    assert crypto._key_k2.hex() == 'f7ddac306ae266ccf90bc11ee46d513b'
+
+
+# MHDR and FHDR alone are 8 bytes, a LoRaWAN message is never empty
+@pytest.mark.parametrize('length', [1, 8, 15, 16, 17, 32, 40, 64])
+@pytest.mark.parametrize('direction', [0, 1])
+def test_mic_is_cmac_over_b0_and_message(length, direction):
+    crypto = SessionCrypto(bytearray(DEVADDR), bytearray(16), bytearray(RFC_KEY))
+    fcnt = 0x12345
+    b0 = bytes([0x49, 0, 0, 0, 0, direction]) + DEVADDR[::-1] + \
+        fcnt.to_bytes(4, 'little') + bytes([0, length])
+    message = RFC_MESSAGE[:length]
+    mic = crypto.mic(fcnt, bytearray(message), length, direction)
+    assert bytes(mic) == cmac(RFC_KEY, b0 + message)[:4]
+
+
+def test_lorawan_uplink_vector():
+    crypto = SessionCrypto(bytearray(DEVADDR), bytearray(APPSKEY), bytearray(NWKSKEY))
+    packet = bytearray(PACKET)
+    assert crypto.verify_mic(2, packet, 13, direction=0)
+    crypto.encrypt(2, packet, 4, direction=0, offset=9)
+    assert bytes(packet[9:13]) == b'test'
+    # the operation is symmetric
+    crypto.encrypt(2, packet, 4, direction=0, offset=9)
+    assert bytes(packet) == PACKET
+
+
+def test_corrupted_packet_fails_the_mic():
+    crypto = SessionCrypto(bytearray(DEVADDR), bytearray(APPSKEY), bytearray(NWKSKEY))
+    packet = bytearray(PACKET)
+    packet[10] ^= 0x01
+    assert not crypto.verify_mic(2, packet, 13, direction=0)
+    assert not crypto.verify_mic(3, bytearray(PACKET), 13, direction=0)
@@ -0,0 +1,74 @@
+# [user-003] write-through register shadow
+from fake_radio import REG_IRQ_FLAGS
+
+REG_SYNC_WORD = 0x39
+REG_FRF_MSB = 0x06
+REG_PREAMBLE_MSB = 0x20
+REG_RSSI_VALUE = 0x1B
+
+
+def test_shadowed_reads_skip_the_bus(make_lora, radio):
+    lora = make_lora(register_shadow=True)
+    lora.write_register(REG_SYNC_WORD, 0x34)
+    before = radio.transactions
+    for _ in range(5):
+        assert lora.read_register(REG_SYNC_WORD) == 0x34
+    assert radio.transactions == before
+    assert lora.shadow_reads_saved >= 5
+
+
+def test_unchanged_writes_are_dropped(make_lora, radio):
+    lora = make_lora(register_shadow=True)
+    lora.write_register(REG_SYNC_WORD, 0x12)
+    lora.write_register(REG_SYNC_WORD, 0x34)
+    before = radio.transactions
+    saved = lora.shadow_writes_saved
+    lora.write_register(REG_SYNC_WORD, 0x34)
+    lora.write_registers(REG_PREAMBLE_MSB, bytes(radio.r[REG_PREAMBLE_MSB:REG_PREAMBLE_MSB + 2]))
+    assert radio.transactions == before
+    assert lora.shadow_writes_saved == saved + 2
+    # a changed value is written through
+    lora.write_register(REG_SYNC_WORD, 0x12)
+    assert radio.r[REG_SYNC_WORD] == 0x12
+    assert radio.transactions == before + 1
+
+
+def test_status_registers_are_always_read(make_lora, radio):
+    lora = make_lora(register_shadow=True)
+    radio.r[REG_RSSI_VALUE] = 40
+    assert lora.read_register(REG_RSSI_VALUE) == 40
+    radio.r[REG_RSSI_VALUE] = 41
+    assert lora.read_register(REG_RSSI_VALUE) == 41
+    radio.r[REG_IRQ_FLAGS] = 0x08
+    assert lora.read_register(REG_IRQ_FLAGS) == 0x08
+
+
+def test_resync_picks_up_changes_behind_the_driver(make_lora, radio):
+    lora = make_lora(register_shadow=True)
+    lora.write_register(REG_SYNC_WORD, 0x34)
+    radio.r[REG_SYNC_WORD] = 0x12
+    assert lora.read_register(REG_SYNC_WORD) == 0x34
+    lora.resync()
+    assert lora.read_register(REG_SYNC_WORD) == 0x12
+
+
+def test_shadow_off_reads_the_chip(lora, radio):
+    lora.write_register(REG_SYNC_WORD, 0x34)
+    radio.r[REG_SYNC_WORD] = 0x12
+    assert lora.read_register(REG_SYNC_WORD) == 0x12
+
+
+def test_staged_config_commits_changed_runs_in_bursts(make_lora, radio):
+    lora = make_lora(register_shadow=True)
+    lora.begin_config()
+    before = radio.transactions
+    lora.write_registers(REG_FRF_MSB, bytes([0xD9, 0x13, 0x33]))
+    lora.write_register(REG_SYNC_WORD, radio.r[REG_SYNC_WORD] ^ 0xFF)
+    assert radio.transactions == before
+    expected_sync = radio.r[REG_SYNC_WORD] ^ 0xFF
+    written = lora.commit_config()
+    assert bytes(radio.r[REG_FRF_MSB:REG_FRF_MSB + 3]) == bytes([0xD9, 0x13, 0x33])
+    assert radio.r[REG_SYNC_WORD] == expected_sync
+    assert written <= 4
+    # one burst for the FRF run, one for the sync word
+    assert radio.transactions - before == 2
@@ -0,0 +1,78 @@
+# [user-025] spectrum scan: RSSI histograms, percentiles, occupancy
+import pytest
+
+from duty_cycle import frf_to_hz
+from spectrum_scan import SpectrumScanner
+from sx127x import RSSI_OFFSET_HF
+from ttn_eu import TTN_FREQS
+
+REG_FRF_MSB = 0x06
+REG_RSSI_VALUE = 0x1B
+
+QUIET = list(range(20, 30))  # 20..29
+BURSTY = [20] * 5 + [60] * 5
+
+
+def rssi_per_channel(radio, samples):
+    """ RssiValue reads cycle through samples[FRF] of the tuned channel. """
+    positions = {}
+    read = radio._read
+
+    def reading(address):
+        if address != REG_RSSI_VALUE:
+            return read(address)
+        frf = tuple(radio.r[REG_FRF_MSB:REG_FRF_MSB + 3])
+        i = positions.get(frf, 0)
+        positions[frf] = i + 1
+        values = samples[frf]
+        return values[i % len(values)]
+    radio._read = reading
+
+
+def make_scanner(lora, radio):
+    rssi_per_channel(radio, {TTN_FREQS[0]: QUIET, TTN_FREQS[1]: BURSTY})
+    return SpectrumScanner(lora, [TTN_FREQS[0], TTN_FREQS[1]], samples=10)
+
+
+def test_nearest_rank_percentiles(lora, radio):
+    scanner = make_scanner(lora, radio)
+    scanner.scan()
+    assert scanner.percentile(0, 0) == 20
+    assert scanner.percentile(0, 10) == 20
+    assert scanner.percentile(0, 11) == 21
+    assert scanner.percentile(0, 50) == 24
+    assert scanner.percentile(0, 90) == 28
+    assert scanner.percentile(0, 100) == 29
+    assert scanner.percentile(1, 50) == 20
+    assert scanner.percentile(1, 51) == 60
+
+
+def test_report_and_quietest(lora, radio):
+    scanner = make_scanner(lora, radio)
+    scanner.scan(sweeps=3)
+    assert scanner.sweeps == 3
+    report = scanner.report(margin_db=6)
+    ch, hz, floor, p50, p90, peak, busy = report[0]
+    assert (ch, hz) == (0, frf_to_hz(TTN_FREQS[0]))
+    assert (floor, p50, p90, peak) == tuple(v - RSSI_OFFSET_HF for v in (20, 24, 28, 29))
+    # at or above floor + 6 dB (26): 26..29
+    assert busy == 40.0
+    assert report[1][6] == 50.0
+    assert report[1][5] == 60 - RSSI_OFFSET_HF
+    assert scanner.quietest(1) == [0]
+
+
+def test_scan_restores_the_radio(lora, radio):
+    scanner = make_scanner(lora, radio)
+    before = bytes(radio.r[REG_FRF_MSB:REG_FRF_MSB + 3])
+    scanner.scan()
+    assert bytes(radio.r[REG_FRF_MSB:REG_FRF_MSB + 3]) == before
+    assert radio.r[0x01] & 0x07 == 0x01  # standby
+    assert not lora._lock
+
+
+def test_histogram_limit(lora, radio):
+    scanner = SpectrumScanner(lora, [TTN_FREQS[0]], samples=40000)
+    with pytest.raises(ValueError):
+        scanner.scan(sweeps=2)
+    assert scanner.report() == []
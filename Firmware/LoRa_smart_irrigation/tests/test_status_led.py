@@ -0,0 +1,69 @@
+# [user-006] timer driven status LEDs
+from machine import Pin
+
+from status_led import StatusLEDs
+
+
+def leds_with(*names, **kwargs):
+    leds = StatusLEDs(period_ms=50, **kwargs)
+    pins = {}
+    for n, name in enumerate(names):
+        pins[name] = Pin(30 + n, Pin.OUT)
+        leds.add(name, pins[name])
+    return leds, pins
+
+
+def trace(leds, pin, ticks):
+    """ Pin level after each timer period. """
+    levels = []
+    for _ in range(ticks):
+        if leds._timer.callback:
+            leds._timer.callback(leds._timer)
+        levels.append(pin.value())
+    return levels
+
+
+def test_blink_pattern_runs_from_the_timer():
+    leds, pins = leds_with('radio')
+    leds.blink('radio', times=2, on_ms=100, off_ms=50)
+    # on at once, the timer does the rest without the caller sleeping
+    assert pins['radio'].value() == 1
+    assert trace(leds, pins['radio'], 7) == [1, 0, 1, 1, 0, 0, 0]
+    # pattern over, timer stopped
+    assert not leds._running
+    assert leds._timer.callback is None
+
+
+def test_leds_blink_independently():
+    leds, pins = leds_with('a', 'b')
+    leds.blink('a', times=1, on_ms=50, off_ms=50)
+    leds.blink('b', times=1, on_ms=150, off_ms=50)
+    assert trace(leds, pins['a'], 1) == [0]
+    assert pins['b'].value() == 1
+    assert trace(leds, pins['b'], 3) == [1, 0, 0]
+    assert not leds._running
+
+
+def test_set_cancels_a_pattern():
+    leds, pins = leds_with('status')
+    leds.blink('status', times=3)
+    leds.set('status', True)
+    assert trace(leds, pins['status'], 10) == [1] * 10
+    assert not leds._running
+
+
+def test_off_stops_everything():
+    leds, pins = leds_with('a', 'b')
+    leds.set('a', True)
+    leds.blink('b', times=5)
+    leds.off()
+    assert pins['a'].value() == 0 and pins['b'].value() == 0
+    assert not leds._running
+
+
+def test_disabled_leds_stay_off():
+    leds, pins = leds_with('radio', enabled=False)
+    leds.set('radio', True)
+    leds.blink('radio')
+    assert pins['radio'].value() == 0
+    assert leds._timer is None
@@ -0,0 +1,48 @@
+# [user-002] single-transaction register access
+from fake_radio import REG_FIFO_ADDR_PTR, REG_VERSION
+
+REG_SYNC_WORD = 0x39
+REG_FRF_MSB = 0x06
+
+
+def test_transfer_is_one_transaction(lora, radio):
+    before = radio.transactions
+    assert lora.transfer(REG_VERSION) == 0x12
+    lora.transfer(REG_SYNC_WORD | 0x80, 0x34)
+    assert radio.r[REG_SYNC_WORD] == 0x34
+    assert radio.transactions - before == 2
+    assert lora.spi_transactions >= 2
+
+
+def test_transfer_reuses_its_buffers(lora, radio):
+    tx, rx = lora._tx_buf, lora._rx_buf
+    calls = []
+    spi = lora._spi
+    write_readinto = spi.write_readinto
+
+    def recording(out, into):
+        calls.append((out, into))
+        write_readinto(out, into)
+    spi.write_readinto = recording
+
+    for _ in range(3):
+        lora.transfer(REG_VERSION)
+    assert all(out is tx and into is rx for out, into in calls)
+    assert len(calls) == 3
+
+
+def test_burst_access_is_one_transaction(lora, radio):
+    frf = bytes([0xD9, 0x06, 0x8B])
+    before = radio.transactions
+    lora.write_registers(REG_FRF_MSB, frf)
+    assert bytes(radio.r[REG_FRF_MSB:REG_FRF_MSB + 3]) == frf
+    buffer = bytearray(3)
+    lora.read_registers(REG_FRF_MSB, buffer)
+    assert bytes(buffer) == frf
+    assert radio.transactions - before == 2
+
+
+def test_single_register_helpers_go_through_transfer(lora, radio):
+    lora.write_register(REG_FIFO_ADDR_PTR, 0x42)
+    assert radio.r[REG_FIFO_ADDR_PTR] == 0x42
+    assert lora.read_register(REG_FIFO_ADDR_PTR) == 0x42
@@ -0,0 +1,28 @@
+# [user-004] TxDone on DIO0 instead of polling REG_IRQ_FLAGS
+import pytest
+
+import fake_radio
+from sx127x import TX_WAIT_LIGHTSLEEP
+
+REG_DIO_MAPPING_1 = 0x40
+
+
+@pytest.mark.parametrize('tx_wait', [None, TX_WAIT_LIGHTSLEEP])
+def test_irq_wait_saves_polls(make_lora, radio, tx_wait):
+    kwargs = {'tx_wait': tx_wait} if tx_wait else {}
+    lora = make_lora(**kwargs)
+    lora.send_data(b'data', 4, 1)
+    assert len(radio.tx_frames) == 1
+    # a poll per SPI round trip over the 50 ms airtime
+    assert lora.tx_polls_saved > 0
+    assert radio.r[REG_DIO_MAPPING_1] == 0x00
+
+
+def test_irq_wait_times_out(lora, radio, monkeypatch):
+    monkeypatch.setattr(fake_radio, 'TX_MS', 10 ** 9)
+    with pytest.raises(RuntimeError, match='Timeout during packet send'):
+        lora.send_data(b'data', 4, 1, timeout=1)
+    assert lora.tx_polls_saved == 0
+    # DIO0 handed back to RxDone even though TxDone never came
+    assert radio.r[REG_DIO_MAPPING_1] == 0x00
+    assert not lora._tx_pending
@@ -90,6 +90,8 @@ class LoRa(object):
         :param do_calibration: Call rx_chain_calibration, default is True.
         """
         self.verbose = verbose
+        # FRF register bytes of the hop channels, None while not hopping
+        self.hop_table = None
         # set the callbacks for DIO0..5 IRQs.
         BOARD.add_events(self._dio0, self._dio1, self._dio2, self._dio3, self._dio4, self._dio5)
         # set mode to sleep and read all registers
@@ -169,6 +171,7 @@ class LoRa(object):
         if self.dio_mapping[1] == 0:
             self.on_rx_timeout()
         elif self.dio_mapping[1] == 1:
+            self._fhss_change_channel()
             self.on_fhss_change_channel()
         elif self.dio_mapping[1] == 2:
             self.on_CadDetected()
@@ -179,8 +182,20 @@ class LoRa(object):
         # DIO2 00: FhssChangeChannel
         # DIO2 01: FhssChangeChannel
         # DIO2 10: FhssChangeChannel
+        self._fhss_change_channel()
         self.on_fhss_change_channel()
 
+    def _fhss_change_channel(self):
+        # Load the frequency of the hop channel the modem moved to. The modem
+        # is in TX/RX here, so the FRF registers are written directly
+        # (set_freq only allows SLEEP/STDBY).
+        if self.hop_table is None:
+            return
+        channel = self.get_hop_channel()['fhss_present_channel']
+        frf = self.hop_table[channel % len(self.hop_table)]
+        self.spi.xfer([REG.LORA.FR_MSB | 0x80] + frf)
+        self.clear_irq_flags(FhssChangeChannel=1)
+
     def _dio3(self, channel):
         # DIO3 00: CadDone
         # DIO3 01: ValidHeader
@@ -231,6 +246,7 @@ class LoRa(object):
         self.set_payload_length(payload_size)
         
         self.set_mode(MODE.STDBY)
+        self.reset_hop()
         base_addr = self.get_fifo_tx_base_addr()
         self.set_fifo_addr_ptr(base_addr)
         return self.spi.xfer([REG.LORA.FIFO | 0x80] + payload)[1:]
@@ -238,6 +254,7 @@ class LoRa(object):
     def reset_ptr_rx(self):
         """ Get FIFO ready for RX: Set FifoAddrPtr to FifoRxBaseAddr. The transceiver is put into STDBY mode. """
         self.set_mode(MODE.STDBY)
+        self.reset_hop()
         base_addr = self.get_fifo_rx_base_addr()
         self.set_fifo_addr_ptr(base_addr)
 
@@ -288,6 +305,31 @@ class LoRa(object):
         lsb = i
         return self.spi.xfer([REG.LORA.FR_MSB | 0x80, msb, mid, lsb])
 
+    def set_fhss(self, frequencies, hop_period):
+        """ Frequency hopping for long packets. Each packet starts on frequencies[0] and the modem moves to the
+        next channel every hop_period symbols; the FhssChangeChannel interrupt (DIO2, or DIO1 with mapping 1) loads
+        the next frequency. Both ends need the same list and hop period.
+        :param frequencies: Hop channels in MHz, or None to stop hopping
+        :param hop_period: Symbols per hop (1..255)
+        :return: New hop period
+        """
+        assert self.mode == MODE.SLEEP or self.mode == MODE.STDBY
+        if frequencies is None:
+            self.hop_table = None
+            return self.set_hop_period(0)
+        assert 0 < hop_period < 256
+        self.hop_table = []
+        for f in frequencies:
+            i = int(f * 16384.)    # choose floor, as set_freq
+            self.hop_table.append([i >> 16, i >> 8 & 0xFF, i & 0xFF])
+        self.reset_hop()
+        return self.set_hop_period(hop_period)
+
+    def reset_hop(self):
+        """ Back to the first hop channel, a packet always starts there. """
+        if self.hop_table is not None:
+            self.spi.xfer([REG.LORA.FR_MSB | 0x80] + self.hop_table[0])
+
     def get_pa_config(self, convert_dBm=False):
         v = self.spi.xfer([REG.LORA.PA_CONFIG, 0])[1]
         pa_select    = v >> 7
@@ -503,7 +545,7 @@ class LoRa(object):
         return dict(
                 pll_timeout          = v >> 7,
                 crc_on_payload       = v >> 6 & 0x01,
-                fhss_present_channel = v >> 5 & 0b111111
+                fhss_present_channel = v & 0b111111
             )
 
     def get_modem_config_1(self):
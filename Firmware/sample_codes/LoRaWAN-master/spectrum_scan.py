@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+import sys
+import argparse
+from time import sleep, time
+from SX127x.LoRa import *
+from SX127x.board_config_ada import BOARD
+
+# TTN EU868 uplink channels (MHz)
+TTN_FREQS = [868.1, 868.3, 868.5, 867.1, 867.3, 867.5, 867.7, 867.9]
+# after retuning: PLL lock and the first RSSI average
+SETTLE_S = 0.001
+# above the quietest channel's floor by this much counts as busy
+BUSY_MARGIN_DB = 6
+
+BOARD.setup()
+parser = argparse.ArgumentParser(description="LoRa RSSI spectrum scanner")
+parser.add_argument('--freqs', dest='freqs', default=None, action="store", type=str,
+                    help="Comma separated frequencies in MHz. Default is the TTN EU868 plan.")
+parser.add_argument('--sweeps', dest='sweeps', default=20, action="store", type=int,
+                    help="Sweeps over all channels. Default is 20.")
+parser.add_argument('--samples', dest='samples', default=256, action="store", type=int,
+                    help="RSSI samples per channel and sweep. Default is 256.")
+parser.add_argument('--margin', dest='margin', default=BUSY_MARGIN_DB, action="store", type=float,
+                    help="dB above the quietest noise floor that count as busy. Default is 6.")
+
+
+class LoRaScanner(LoRa):
+    def __init__(self, frequencies, verbose=False):
+        super(LoRaScanner, self).__init__(verbose)
+        self.frequencies = frequencies
+        self.rssi = dict((f, []) for f in frequencies)
+
+    def scan(self, sweeps, samples):
+        """ Tunes every channel in STDBY, starts RXCONT and reads RssiValue samples times. Returns the time taken in s.
+        :param sweeps: Sweeps over all channels
+        :param samples: RSSI samples per channel and sweep
+        """
+        start = time()
+        for _ in range(sweeps):
+            for f in self.frequencies:
+                self.set_mode(MODE.STDBY)
+                self.set_freq(f)
+                self.set_mode(MODE.RXCONT)
+                sleep(SETTLE_S)
+                rssi = self.rssi[f]
+                for _ in range(samples):
+                    rssi.append(self.get_rssi_value())
+        self.set_mode(MODE.STDBY)
+        return time() - start
+
+    def report(self, margin_db):
+        """ Noise floor (10th percentile), median, 90th percentile and max in dBm and occupancy in % per channel.
+        :param margin_db: Samples this far above the quietest channel's floor count as busy
+        :return: List of dicts, one per channel
+        """
+        floors = dict((f, percentile(sorted(self.rssi[f]), 10)) for f in self.frequencies)
+        threshold = min(floors.values()) + margin_db
+        report = []
+        for f in self.frequencies:
+            ordered = sorted(self.rssi[f])
+            busy = len(ordered) - next((i for i, v in enumerate(ordered) if v >= threshold), len(ordered))
+            report.append(dict(
+                    freq      = f,
+                    floor     = floors[f],
+                    p50       = percentile(ordered, 50),
+                    p90       = percentile(ordered, 90),
+                    max       = ordered[-1],
+                    occupancy = busy * 100. / len(ordered),
+                ))
+        return report
+
+
+def percentile(ordered, p):
+    """ Nearest-rank percentile of a sorted list, p in 0..100. """
+    n = len(ordered)
+    rank = int(-(-p * n // 100))    # ceil(p * n / 100), 1-based
+    return ordered[min(max(rank, 1), n) - 1]
+
+
+args = parser.parse_args()
+if args.freqs:
+    frequencies = [float(f) for f in args.freqs.split(',')]
+else:
+    frequencies = TTN_FREQS
+lora = LoRaScanner(frequencies)
+
+# Setup: LoRa receiver, RSSI is measured in the configured bandwidth
+lora.set_mode(MODE.SLEEP)
+lora.set_dio_mapping([0,0,0,0,0,0])
+lora.set_bw(BW.BW125)
+lora.set_spreading_factor(7)
+assert(lora.get_agc_auto_on() == 1)
+
+try:
+    print("Scanning %d channels, %d sweeps of %d samples\n" % (len(frequencies), args.sweeps, args.samples))
+    elapsed = lora.scan(args.sweeps, args.samples)
+    report = lora.report(args.margin)
+    print("    MHz  floor    p50    p90    max  busy%")
+    for r in report:
+        print("%7.3f %6d %6d %6d %6d %6.1f" % (r['freq'], r['floor'], r['p50'], r['p90'], r['max'], r['occupancy']))
+    quietest = sorted(report, key=lambda r: (r['occupancy'], r['p90']))
+    print("\nSweep took %.1f s, quietest channels: %s" % (elapsed, ", ".join("%.1f" % r['freq'] for r in quietest[:3])))
+except KeyboardInterrupt:
+    sys.stdout.flush()
+    print("\nKeyboardInterrupt")
+finally:
+    sys.stdout.flush()
+    lora.set_mode(MODE.SLEEP)
+    BOARD.teardown()
@@ -0,0 +1,49 @@
+import machine
+import time
+
+from ulora2 import ULoRa
+
+# Two radios on the Pico's two SPI buses: radio_a sends on 433 MHz while
+# radio_b listens on 434 MHz, each with its own CS, reset and DIO0 pins.
+spi0 = machine.SPI(0,
+                   baudrate=2000000,
+                   polarity=1,
+                   phase=1,
+                   bits=8,
+                   firstbit=machine.SPI.MSB,
+                   sck=machine.Pin(2),
+                   mosi=machine.Pin(3),
+                   miso=machine.Pin(4))
+spi1 = machine.SPI(1,
+                   baudrate=2000000,
+                   polarity=1,
+                   phase=1,
+                   bits=8,
+                   firstbit=machine.SPI.MSB,
+                   sck=machine.Pin(10),
+                   mosi=machine.Pin(11),
+                   miso=machine.Pin(12))
+
+radio_a = ULoRa(spi0, machine.Pin(5, machine.Pin.OUT),
+                machine.Pin(7, machine.Pin.OUT), machine.Pin(6, machine.Pin.IN))
+radio_b = ULoRa(spi1, machine.Pin(13, machine.Pin.OUT),
+                machine.Pin(15, machine.Pin.OUT), machine.Pin(14, machine.Pin.IN))
+
+if not (radio_a.begin(433) and radio_b.begin(434)):
+    print("LoRa Failed!!")
+
+radio_b.receive(0)
+
+while True:
+    radio_a.beginPacket()
+    radio_a.dataPacket(bytearray(b"Hello!!"))
+    radio_a.endPacket()
+    print("Packet Sent")
+
+    if radio_b.parsePacket() > 0:
+        packet = bytearray()
+        while radio_b.available() > 0:
+            packet.append(radio_b.read())
+        print("Received", bytes(packet), radio_b.packetRssi())
+        radio_b.receive(0)
+    time.sleep(2)
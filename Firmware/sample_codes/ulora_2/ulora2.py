@@ -10,17 +10,6 @@ import _thread
 import ustruct
 import sys
 
-_implicitHeaderMode = False
-_onTxDone = False
-_frequency = 0
-
-cs = None
-dio0 = None
-rst = None
-spi = None
-pindex = 0
-iemode = False
-
 REG_FIFO         =       0x00
 REG_OP_MODE      =       0x01
 REG_FRF_MSB      =       0x06
@@ -81,282 +70,346 @@ MAX_PKT_LENGTH          =255
 
 
 
-                  
+class ULoRa:
+    """ One SX127x radio. Every radio keeps its own bus, pins and packet
+        state, so several can run side by side (e.g. on SPI0 and SPI1).
+    """
+    def __init__(self, spip, csp, rstp, dio0p):
+        self.spi = spip
+        self.cs = csp
+        self.rst = rstp
+        self.dio0 = dio0p
+        self._implicitHeaderMode = False
+        self._onTxDone = False
+        self._frequency = 0
+        self.pindex = 0
+
+    def spiWrite(self,reg,data):
+        msg = bytearray()
+        msg.append(0x00|reg)
+        msg.append(data)
+        self.cs.value(0)
+        self.spi.write(msg)
+        self.cs.value(1)
+
+    def spiRead(self,reg,nbytes=1):
+        if nbytes <1:
+            return bytearray()
+        elif nbytes == 1:
+            mb=0
+        else:
+            mb=1
+        msg = bytearray()
+        af = reg & 0x7F
+        msg.append(af)
+        #msg.append(af >> 8)
+        #msg.append(0x80 | (mb << 6) | reg)
+        self.cs.value(0)
+        self.spi.write(msg)
+        data = self.spi.read(nbytes)
+        self.cs.value(1)
+        return data
+
+    def writeRegister(self,reg,val):
+        msg = bytearray()
+        msg.append(reg | 0x80)
+        msg.append(val)
+        self.cs.value(0)
+        self.spi.write(msg)
+        ndata = self.spi.read(1)
+        self.cs.value(1)
+        return ndata
+
+    def readRegister(self,reg):
+        msg = bytearray()
+        msg.append(reg & 0x7F)
+        self.cs.value(0)
+        self.spi.write(msg)
+        ndata = self.spi.read(1)
+        self.cs.value(1)
+        return ndata[0]
+
+    def sleep(self):
+        self.writeRegister(REG_OP_MODE, MODE_LONG_RANGE_MODE | MODE_SLEEP)
+
+    def idle(self):
+        self.writeRegister(REG_OP_MODE, MODE_LONG_RANGE_MODE | MODE_STDBY)
+
+    def enableCRC(self,en):
+        mreg = self.readRegister(REG_MODEM_CONFIG_1)
+        if en:
+            self.writeRegister(REG_MODEM_CONFIG_1,mreg|0x04)
+        else:
+            self.writeRegister(REG_MODEM_CONFIG_1,mreg&0xFB)
+
+    def setFrequency(self,freq):
+        if freq < 410 or freq >525:
+            return False
+        else:
+            lfrq = freq * 1000000
+            self._frequency = lfrq
+            frf = int((lfrq << 19) / 32000000)
+            self.writeRegister(REG_FRF_MSB,frf>>16)
+            self.writeRegister(REG_FRF_MID,(frf>>8)&0xFF)
+            self.writeRegister(REG_FRF_LSB,frf & 0xFF)
+            return True
+
+    def LoRaOCP(self,ma):
+        ocptrim = 27
+        if ma <=120:
+            ocptrim = int((ma-45)/5)
+        elif ma <=240:
+            ocptrim = int((ma+30)/10)
+        self.writeRegister(REG_OCP,0x20 | (0x1F & ocptrim))
+
+    def setTxPower(self,power):
+        self.writeRegister(0x4D,0x87)
+        self.LoRaOCP(140)
+        self.writeRegister(0x09,0x80| 0x0C)
+
+    def isTransmitting(self):
+        egx = self.readRegister(REG_OP_MODE) & MODE_TX
+        if egx == MODE_TX:
+            return True
+        pmx = self.readRegister(REG_IRQ_FLAGS) & IRQ_TX_DONE_MASK
+
+        if pmx:
+            self.writeRegister(REG_IRQ_FLAGS,IRQ_TX_DONE_MASK)
+        return False
+
+    def explicitHeaderMode(self):
+        self._implicitHeaderMode = False
+        px1 =  self.readRegister(REG_MODEM_CONFIG_1) & 0xfe
+        self.writeRegister(REG_MODEM_CONFIG_1,px1)
+
+    def implicitHeaderMode(self):
+        self._implicitHeaderMode = True
+        px1 =  self.readRegister(REG_MODEM_CONFIG_1) & 0x01
+        self.writeRegister(REG_MODEM_CONFIG_1,px1)
+
+    def beginPacket(self,header=0):
+        psm = self.isTransmitting()
+        if psm:
+            return False
+        self.idle()
+        if header>0:
+            self.implicitHeaderMode()
+        else:
+            self.explicitHeaderMode()
+
+        self.writeRegister(REG_FIFO_ADDR_PTR, 0)
+        self.writeRegister(REG_PAYLOAD_LENGTH, 0)
+
+        return True
+
+    def dataPacket(self,buff):
+        size = len(buff)
+        paylen = self.readRegister(REG_PAYLOAD_LENGTH)
+        if paylen + size > 255:
+            size = 255 - paylen
+
+        for x in buff:
+            self.writeRegister(0x00,x)
+        self.writeRegister(REG_PAYLOAD_LENGTH,paylen+size)
+        return size
+
+    def endPacket(self,async1 = False):
+        if async1 == True and self._onTxDone == True:
+            self.writeRegister(REG_DIO_MAPPING_1, 0x40)
+        self.writeRegister(REG_OP_MODE, MODE_LONG_RANGE_MODE | MODE_TX)
+        if not async1:
+            while self.readRegister(REG_IRQ_FLAGS) & IRQ_TX_DONE_MASK == 0:
+                pass
+            self.writeRegister(REG_IRQ_FLAGS, IRQ_TX_DONE_MASK)
+        return True
+
+    def parsePacket(self,psize=0):
+        packetLength = 0
+        irqFlags = self.readRegister(REG_IRQ_FLAGS)
+        if psize > 0:
+            self.implicitHeaderMode()
+            self.writeRegister(REG_PAYLOAD_LENGTH, psize & 0xff)
+        else:
+            self.explicitHeaderMode()
+
+        self.writeRegister(REG_IRQ_FLAGS, irqFlags);
+
+        if irqFlags & 0x40 == 0 and irqFlags & 0x20 ==0:
+            self.pindex = 0
+            if self._implicitHeaderMode:
+                packetLength = self.readRegister(REG_PAYLOAD_LENGTH)
+            else:
+                packetLength = self.readRegister(REG_RX_NB_BYTES);
+            self.writeRegister(REG_FIFO_ADDR_PTR, self.readRegister(REG_FIFO_RX_CURRENT_ADDR))
+            self.idle()
+        elif self.readRegister(REG_OP_MODE) != (MODE_LONG_RANGE_MODE | MODE_RX_SINGLE):
+            self.writeRegister(REG_FIFO_ADDR_PTR, 0)
+            self.writeRegister(REG_OP_MODE, MODE_LONG_RANGE_MODE | MODE_RX_SINGLE)
+        return packetLength
+
+    def available(self):
+        return self.readRegister(REG_RX_NB_BYTES) - self.pindex
+
+    def read(self):
+        if self.available() == 0:
+            return -1
+        self.pindex = self.pindex + 1
+        return self.readRegister(REG_FIFO)
+
+    def readBuffer(self):
+        pkt_size = self.parsePacket()
+        rmp = self.available()
+        buff1 = []
+        if rmp > 0:
+            for x in range (0,pkt_size):
+                buff1.append(self.readRegister(REG_FIFO))
+            return buff1
+        else:
+            return []
+
+    def receive(self,psize):
+        self.writeRegister(REG_DIO_MAPPING_1, 0x00)
+        if psize>0:
+            self.implicitHeaderMode()
+        else:
+            self.explicitHeaderMode()
+        self.writeRegister(REG_OP_MODE, MODE_LONG_RANGE_MODE | MODE_RX_CONTINUOUS)
+
+    def packetRssi(self):
+        pgx = self.readRegister(REG_PKT_RSSI_VALUE)
+        if self._frequency < RF_MID_BAND_THRESHOLD:
+            return pgx - RSSI_OFFSET_LF_PORT
+        else:
+            return pgx - RSSI_OFFSET_HF_PORT
+
+    def getSignalBandwidth(self):
+        mox1 = self.readRegister(REG_MODEM_CONFIG_1) >> 4
+        if mox1 == 0:
+            return 7.8E3
+        elif mox1 == 1:
+            return 10.4E3
+        elif mox1 == 2:
+            return 15.6E3
+        elif mox1 == 3:
+            return 20.8E3
+        elif mox1 == 4:
+            return 31.25E3
+        elif mox1 == 5:
+            return 41.7E3
+        elif mox1 == 6:
+            return 62.5E3
+        elif mox1 == 7:
+            return 125E3
+        elif mox1 == 8:
+            return 250E3
+        elif mox1 == 9:
+            return 500E3
+
+    def setSignalBandwidth(self,bw):
+        if bw >=0 and bw <=9:
+            mox1 = self.readRegister(REG_MODEM_CONFIG_1) & 0x0F | (bw << 4)
+            self.writeRegister(REG_MODEM_CONFIG_1,mox1)
+            return True
+        else:
+            return False
+
+    def begin(self,freq):
+        if self.rst != None:
+            self.rst.value(0)
+            time.sleep(1)
+            self.rst.value(1)
+        ndata = self.readRegister(REG_VERSION)
+        if ndata != 0x12:
+            return False
+        self.sleep()
+        self.setFrequency(freq)
+        self.writeRegister(REG_FIFO_TX_BASE_ADDR, 0);
+        self.writeRegister(REG_FIFO_RX_BASE_ADDR, 0);
+        erpm = self.readRegister(REG_LNA)
+        self.writeRegister(REG_LNA, erpm | 0x03);
+        self.writeRegister(REG_MODEM_CONFIG_3, 0x04);
+        self.setTxPower(17)
+        self.idle()
+        return True
+
+
+# Module level API of the single-radio examples, on the radio set up by
+# begin(). Create ULoRa objects directly to drive more than one radio.
+_radio = None
+
+def begin(spip,csp,rstp,dio0p,freq):
+    global _radio
+    _radio = ULoRa(spip,csp,rstp,dio0p)
+    return _radio.begin(freq)
+
 def spiWrite(reg,data):
-    msg = bytearray()
-    msg.append(0x00|reg)
-    msg.append(data)
-    cs.value(0)
-    spi.write(msg)
-    cs.value(1)
-    
+    _radio.spiWrite(reg,data)
+
 def spiRead(reg,nbytes=1):
-    if nbytes <1:
-        return bytearray()
-    elif nbytes == 1:
-        mb=0
-    else:
-        mb=1
-    msg = bytearray()
-    af = reg & 0x7F
-    msg.append(af)
-    #msg.append(af >> 8)
-    #msg.append(0x80 | (mb << 6) | reg)
-    cs.value(0)
-    spi.write(msg)
-    data = spi.read(nbytes)
-    cs.value(1)
-    return data
-            
+    return _radio.spiRead(reg,nbytes)
+
 def writeRegister(reg,val):
-    msg = bytearray()
-    msg.append(reg | 0x80)
-    msg.append(val)
-    cs.value(0)
-    spi.write(msg)
-    ndata = spi.read(1)
-    cs.value(1)
-    return ndata
-    
+    return _radio.writeRegister(reg,val)
+
 def readRegister(reg):
-    msg = bytearray()
-    msg.append(reg & 0x7F)
-    cs.value(0)
-    spi.write(msg)
-    ndata = spi.read(1)
-    cs.value(1)
-    return ndata[0]
+    return _radio.readRegister(reg)
 
 def sleep():
-    writeRegister(REG_OP_MODE, MODE_LONG_RANGE_MODE | MODE_SLEEP)
-    
-    
+    _radio.sleep()
+
 def idle():
-    writeRegister(REG_OP_MODE, MODE_LONG_RANGE_MODE | MODE_STDBY)
+    _radio.idle()
 
 def enableCRC(en):
-    mreg = readRegister(REG_MODEM_CONFIG_1)
-    if en:
-        writeRegister(REG_MODEM_CONFIG_1,mreg|0x04)
-    else:
-        writeRegister(REG_MODEM_CONFIG_1,mreg&0xFB)
-
-
+    _radio.enableCRC(en)
 
-
-    
 def setFrequency(freq):
-    global _frequency
-    if freq < 410 or freq >525:
-        return False
-    else:
-        #print("freq OK")
-        lfrq = freq * 1000000
-        _frequency = lfrq
-        frf = int((lfrq << 19) / 32000000)
-        writeRegister(REG_FRF_MSB,frf>>16)
-        writeRegister(REG_FRF_MID,(frf>>8)&0xFF)
-        writeRegister(REG_FRF_LSB,frf & 0xFF)
-        return True
-    
+    return _radio.setFrequency(freq)
+
 def LoRaOCP(ma):
-    ocptrim = 27
-    if ma <=120:
-        ocptrim = int((ma-45)/5)
-    elif ma <=240:
-        ocptrim = int((ma+30)/10)
-    writeRegister(REG_OCP,0x20 | (0x1F & ocptrim))
-    
+    _radio.LoRaOCP(ma)
+
 def setTxPower(power):
-    writeRegister(0x4D,0x87)
-    LoRaOCP(140)
-    writeRegister(0x09,0x80| 0x0C)
-    
+    _radio.setTxPower(power)
+
 def isTransmitting():
-    egx = readRegister(REG_OP_MODE) & MODE_TX
-    if egx == MODE_TX:
-        return True
-    pmx = readRegister(REG_IRQ_FLAGS) & IRQ_TX_DONE_MASK
-    
-    if pmx:
-        writeRegister(REG_IRQ_FLAGS,IRQ_TX_DONE_MASK)
-    return False
+    return _radio.isTransmitting()
 
 def explicitHeaderMode():
-    global _implicitHeaderMode
-    _implicitHeaderMode = False
-    px1 =  readRegister(REG_MODEM_CONFIG_1) & 0xfe
-    writeRegister(REG_MODEM_CONFIG_1,px1)
-
+    _radio.explicitHeaderMode()
 
 def implicitHeaderMode():
-    global _implicitHeaderMode
-    _implicitHeaderMode = True
-    px1 =  readRegister(REG_MODEM_CONFIG_1) & 0x01
-    writeRegister(REG_MODEM_CONFIG_1,px1)
-
-
+    _radio.implicitHeaderMode()
 
 def beginPacket(header=0):
-    psm = isTransmitting()
-    if psm:
-        #print("Lora is in TX Mode")
-        return False
-    idle()
-    if header>0:
-        implicitHeaderMode()
-    else:
-        explicitHeaderMode()
+    return _radio.beginPacket(header)
 
-    writeRegister(REG_FIFO_ADDR_PTR, 0)
-    writeRegister(REG_PAYLOAD_LENGTH, 0)
-
-    return True
-    
 def dataPacket(buff):
-    size = len(buff)
-    paylen = readRegister(REG_PAYLOAD_LENGTH)
-    if paylen + size > 255:
-        size = 255 - paylen
-        
-    for x in buff:
-        writeRegister(0x00,x)
-    writeRegister(REG_PAYLOAD_LENGTH,paylen+size)
-    return size
+    return _radio.dataPacket(buff)
 
 def endPacket(async1 = False):
-    if async1 == True and _onTxDone == True:
-        writeRegister(REG_DIO_MAPPING_1, 0x40)
-    writeRegister(REG_OP_MODE, MODE_LONG_RANGE_MODE | MODE_TX)
-    if not async1:
-        while readRegister(REG_IRQ_FLAGS) & IRQ_TX_DONE_MASK == 0:
-            pass
-        writeRegister(REG_IRQ_FLAGS, IRQ_TX_DONE_MASK)
-    return True
-
+    return _radio.endPacket(async1)
 
 def parsePacket(psize=0):
-    global pindex
-    packetLength = 0
-    irqFlags = readRegister(REG_IRQ_FLAGS)
-    if psize > 0:
-        implicitHeaderMode()
-        writeRegister(REG_PAYLOAD_LENGTH, size & 0xff)
-    else:
-        explicitHeaderMode()
-
-    writeRegister(REG_IRQ_FLAGS, irqFlags);
-
-    if irqFlags & 0x40 == 0 and irqFlags & 0x20 ==0:
-        #print("here1")
-        pindex = 0
-        if _implicitHeaderMode:
-            packetLength = readRegister(REG_PAYLOAD_LENGTH)
-        else:
-            packetLength = readRegister(REG_RX_NB_BYTES);
-        writeRegister(REG_FIFO_ADDR_PTR, readRegister(REG_FIFO_RX_CURRENT_ADDR))
-        idle()
-    elif readRegister(REG_OP_MODE) != (MODE_LONG_RANGE_MODE | MODE_RX_SINGLE):
-        #print("here2")
-        writeRegister(REG_FIFO_ADDR_PTR, 0)
-        writeRegister(REG_OP_MODE, MODE_LONG_RANGE_MODE | MODE_RX_SINGLE)
-    return packetLength
-    
+    return _radio.parsePacket(psize)
 
 def available():
-    return readRegister(REG_RX_NB_BYTES) - pindex
-    
-            
+    return _radio.available()
+
 def read():
-    global pindex
-    if available() == 0:
-        return -1
-    pindex = pindex + 1
-    return readRegister(REG_FIFO)
-        
-def readBuffer():
-    pkt_size = parsePacket()
-    rmp = available()
-    buff1 = []
-    if rmp > 0:
-        for x in range (0,pkt_size):
-            buff1.append(readRegister(REG_FIFO))
-        return buff1
-    else:
-        return []
+    return _radio.read()
 
+def readBuffer():
+    return _radio.readBuffer()
 
 def receive(psize):
-    writeRegister(REG_DIO_MAPPING_1, 0x00)
-    if size>0:
-        implicitHeaderMode()
-    else:
-        explicitHeaderMode()
-    writeRegister(REG_OP_MODE, MODE_LONG_RANGE_MODE | MODE_RX_CONTINUOUS)
-
+    _radio.receive(psize)
 
 def packetRssi():
-    pgx = readRegister(REG_PKT_RSSI_VALUE)
-    if _frequency < RF_MID_BAND_THRESHOLD:
-        return pgx - RSSI_OFFSET_LF_PORT
-    else:
-        return pgx - RSSI_OFFSET_HF_PORT
+    return _radio.packetRssi()
 
 def getSignalBandwidth():
-    mox1 = readRegister(REG_MODEM_CONFIG_1) >> 4
-    if mox1 == 0:
-        return 7.8E3
-    elif mox1 == 1:
-        return 10.4E3
-    elif mox1 == 2:
-        return 15.6E3
-    elif mox1 == 3:
-        return 20.8E3
-    elif mox1 == 4:
-        return 31.25E3
-    elif mox1 == 5:
-        return 41.7E3
-    elif mox1 == 6:
-        return 62.5E3
-    elif mox1 == 7:
-        return 125E3
-    elif mox1 == 8:
-        return 250E3
-    elif mox1 == 9:
-        return 500E3
-
+    return _radio.getSignalBandwidth()
 
 def setSignalBandwidth(bw):
-    if bw >=0 and bw <=9:
-        mox1 = readRegister(REG_MODEM_CONFIG_1) & 0x0F | (bw << 4)
-        writeRegister(REG_MODEM_CONFIG_1,mox1)
-        return True
-    else:
-        return False
-
-
-def begin(spip,csp,rstp,dio0p,freq):
-    global rst,spi,cs,dio0
-    spi = spip
-    cs = csp
-    rst = rstp
-    dio0 = dio0p
-    if rstp != None:
-        rst.value(0)
-        time.sleep(1)
-        rst.value(1)
-        #print("rset OK")
-    ndata = readRegister(REG_VERSION)
-    if ndata != 0x12:
-        return False
-    sleep()
-    setFrequency(freq)
-    writeRegister(REG_FIFO_TX_BASE_ADDR, 0);
-    writeRegister(REG_FIFO_RX_BASE_ADDR, 0);
-    erpm = readRegister(REG_LNA)
-    writeRegister(REG_LNA, erpm | 0x03);
-    writeRegister(REG_MODEM_CONFIG_3, 0x04);
-    setTxPower(17)
-    idle()
-    return True
-    
+    return _radio.setSignalBandwidth(bw)